@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+
+import argparse
+import multiprocessing
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(__file__), os.pardir)
+sys.path.insert(0, os.path.join(ROOT, 'phil'))
+sys.path.insert(0, os.path.join(ROOT, 'tests'))
+
+import phil  # noqa: E402
+from wiki_stub import (  # noqa: E402
+    scale_free_graph, synthetic_graph, write_dump)
+
+
+def implicit_graph(nodes: int, degree: int):
+    """
+    Returns expand() for phil.search over a pseudo-random graph of `nodes`
+    articles with `degree` links each, computed on the fly so that only
+    the search itself takes memory.
+    """
+    def links(name):
+        i = int(name[7:])
+        return [f'Статья_{(i * 2654435761 + k * 40503 + 1) % nodes}'
+                for k in range(degree)]
+
+    def expand(frontier):
+        return map(links, frontier)
+    return expand
+
+
+def search_paths(start, finish, expand):
+    """ phil.search before parent pointers: a list per visited title. """
+    frontier = [start]
+    paths = {start: []}
+    while frontier:
+        next_frontier = []
+        for name, links in zip(frontier, expand(frontier)):
+            if not links:
+                continue
+            if finish in links:
+                return paths[name] + [name, finish]
+            for link in links:
+                if link in paths:
+                    continue
+                paths[link] = paths[name] + [name]
+                next_frontier.append(link)
+        frontier = next_frontier
+    return None
+
+
+def measure(connection, search, expand) -> None:
+    """ Runs the search in a fresh process and reports time and memory. """
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    search('Статья_0', 'Нет_такой', expand)
+    elapsed = time.perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    connection.send((elapsed, (peak - baseline) * 1024))
+
+
+def run_isolated(search, expand):
+    context = multiprocessing.get_context('fork')
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=measure,
+                              args=(sender, search, expand))
+    process.start()
+    result = receiver.recv()
+    process.join()
+    return result
+
+
+def bench_memory(args) -> None:
+    print(f'{args.nodes} nodes x {args.degree} links, search for a missing '
+          f'title (visits every reachable node):')
+    expand = implicit_graph(args.nodes, args.degree)
+    results = []
+    for label, search in (('paths', search_paths),
+                          ('parents', phil.search)):
+        elapsed, memory = run_isolated(search, expand)
+        results.append(memory)
+        print(f'{label:>8}: {elapsed:8.3f} s {memory / (1 << 20):10.1f} MiB '
+              f'peak RSS growth')
+    print(f'memory reduction: {(1 - results[1] / results[0]) * 100:.0f}%')
+
+
+def bench_index(args) -> None:
+    nodes = args.index_nodes
+    with tempfile.TemporaryDirectory() as tmp:
+        dump = os.path.join(tmp, 'dump.xml')
+        start = time.perf_counter()
+        write_dump(synthetic_graph(nodes, args.degree), dump)
+        print(f'{nodes} articles x {args.degree} links, dump '
+              f'{os.path.getsize(dump) >> 10} KiB written in '
+              f'{time.perf_counter() - start:.1f} s')
+        start = time.perf_counter()
+        phil.build_index(dump, os.path.join(tmp, 'index'))
+        print(f'  build-index: {time.perf_counter() - start:8.3f} s')
+        start = time.perf_counter()
+        index = phil.LinkIndex(os.path.join(tmp, 'index'))
+        print(f'  open:        {(time.perf_counter() - start) * 1000:8.3f} ms')
+        rng = random.Random(0)
+        pairs = [(f'Статья_{rng.randrange(nodes)}',
+                  f'Статья_{rng.randrange(nodes)}') for _ in range(20)]
+        start = time.perf_counter()
+        lengths = [len(phil.find_chain(*pair, index=index) or ())
+                   for pair in pairs]
+        elapsed = (time.perf_counter() - start) / len(pairs)
+        print(f'  query:       {elapsed * 1000:8.3f} ms on average, chains '
+              f'of {min(lengths)}-{max(lengths)} titles')
+        index.close()
+
+
+def bench_bidirectional(args) -> None:
+    nodes = args.index_nodes
+    with tempfile.TemporaryDirectory() as tmp:
+        dump = os.path.join(tmp, 'dump.xml')
+        write_dump(scale_free_graph(nodes, args.degree), dump)
+        phil.build_index(dump, os.path.join(tmp, 'index'))
+        index = phil.LinkIndex(os.path.join(tmp, 'index'))
+        rng = random.Random(0)
+        pairs = [(f'Статья_{rng.randrange(nodes)}',
+                  f'Статья_{rng.randrange(nodes)}') for _ in range(50)]
+        print(f'scale-free graph of {nodes} articles, {args.degree} links '
+              f'per new article, {len(pairs)} random pairs:')
+        lengths = []
+        for label, bidirectional in (('forward', False),
+                                     ('bidirectional', True)):
+            expanded = elapsed = 0
+            lengths.append([])
+            for pair in pairs:
+                start = time.perf_counter()
+                chain = index.find_chain(*pair, bidirectional)
+                elapsed += time.perf_counter() - start
+                expanded += index.expanded
+                lengths[-1].append(len(chain or ()))
+            print(f'{label:>14}: {elapsed / len(pairs) * 1000:8.3f} ms '
+                  f'{expanded / len(pairs):12.0f} articles expanded '
+                  f'on average')
+        assert lengths[0] == lengths[1], 'chain lengths differ'
+        index.close()
+
+
+BENCHMARKS = {
+    'memory': bench_memory,
+    'index': bench_index,
+    'bidirectional': bench_bidirectional,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='phil benchmarks')
+    parser.add_argument('benchmarks', nargs='*', metavar='BENCHMARK',
+                        help=f'one of {", ".join(BENCHMARKS)} (default: all)')
+    parser.add_argument('--nodes', type=int, default=1_000_000)
+    parser.add_argument('--degree', type=int, default=4)
+    parser.add_argument('--index-nodes', type=int, default=100_000,
+                        help='articles in the dump (index benchmarks)')
+    args = parser.parse_args()
+
+    for name in args.benchmarks or BENCHMARKS:
+        if name not in BENCHMARKS:
+            parser.error(f'unknown benchmark {name}')
+        BENCHMARKS[name](args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,380 @@
+#!/usr/bin/env python3
+
+import argparse
+import contextlib
+import io
+import os
+import re
+import signal
+import sys
+import tempfile
+import threading
+import time
+from functools import partial
+from unittest import mock
+
+ROOT = os.path.join(os.path.dirname(__file__), os.pardir)
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'tests'))
+
+import threaded_parser  # noqa: E402
+from habr_stub import HabrStub  # noqa: E402
+
+
+def bench_threads(args, tmp: str) -> None:
+    with HabrStub(args.articles, args.images, args.delay) as stub, \
+            mock.patch.object(threaded_parser, 'HABR', stub.url):
+        requests = args.articles * (args.images + 1) + 1
+        print(f'{args.articles} articles x {args.images} images, '
+              f'{args.delay * 1000:.0f} ms latency:')
+        for engine in args.engine:
+            run = (threaded_parser.run_scraper_async if engine == 'asyncio'
+                   else threaded_parser.run_scraper)
+            for threads in args.threads:
+                cwd = os.getcwd()
+                start = time.perf_counter()
+                run(threads, args.articles, tempfile.mkdtemp(dir=tmp),
+                    cache=False)
+                elapsed = time.perf_counter() - start
+                os.chdir(cwd)
+                print(f'{engine:>8} {threads:>5}: {elapsed:8.3f} s '
+                      f'{requests / elapsed:10.1f} requests/s')
+
+
+# ConnectionPool before pooling: a new connection per request.
+pool_without_reuse = partial(threaded_parser.ConnectionPool, idle_timeout=0)
+
+
+def bench_pool(args, tmp: str) -> None:
+    print(f'{args.articles} articles x {args.images} images, '
+          f'{args.delay * 1000:.0f} ms latency, '
+          f'{args.handshake * 1000:.0f} ms handshake:')
+    for threads in args.threads:
+        results = []
+        for label, patch in (
+                ('no reuse', mock.patch.object(
+                    threaded_parser, 'ConnectionPool', pool_without_reuse)),
+                ('pool', contextlib.nullcontext())):
+            with HabrStub(args.articles, args.images, args.delay,
+                          handshake=args.handshake) as stub, patch, \
+                    mock.patch.object(threaded_parser, 'HABR', stub.url):
+                cwd = os.getcwd()
+                start = time.perf_counter()
+                with contextlib.redirect_stdout(io.StringIO()):
+                    threaded_parser.run_scraper(
+                        threads, args.articles, tempfile.mkdtemp(dir=tmp),
+                        cache=False)
+                elapsed = time.perf_counter() - start
+                os.chdir(cwd)
+            results.append(elapsed)
+            print(f'{threads:>5} threads {label:>8}: {elapsed:8.3f} s '
+                  f'{stub.connections:6} connections '
+                  f'{len(stub.requests):6} requests')
+        print(f'{threads:>5} threads   saved: '
+              f'{(results[0] - results[1]) * 1000:8.0f} ms')
+
+
+def disk_usage(out_dir):
+    """ Returns apparent and actual bytes of the article folders. """
+    apparent = 0
+    inodes = {}
+    for name in os.listdir(out_dir):
+        if name.startswith('.'):
+            continue
+        for entry in os.scandir(os.path.join(out_dir, name)):
+            st = entry.stat()
+            apparent += st.st_size
+            inodes[st.st_ino] = st.st_size
+    return apparent, sum(inodes.values())
+
+
+def bench_dedup(args, tmp: str) -> None:
+    threads = max(args.threads)
+    with HabrStub(args.articles, args.images, args.delay,
+                  shared=args.shared, copies=args.copies) as stub, \
+            mock.patch.object(threaded_parser, 'HABR', stub.url):
+        references = args.articles * (args.images + args.shared + args.copies)
+        out_dir = tempfile.mkdtemp(dir=tmp)
+        cwd = os.getcwd()
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            threaded_parser.run_scraper(threads, args.articles, out_dir,
+                                        cache=False)
+        elapsed = time.perf_counter() - start
+        os.chdir(cwd)
+        fetched = sum(not path.startswith('/articles/') and path != '/'
+                      for path in stub.requests)
+    apparent, actual = disk_usage(out_dir)
+    print(f'{args.articles} articles x ({args.images} own + {args.shared} '
+          f'shared + {args.copies} copied) images, {threads} threads: '
+          f'{elapsed:.3f} s')
+    print(f'  images referenced {references:8}, downloaded {fetched:8} '
+          f'({(1 - fetched / references) * 100:.0f}% fewer requests)')
+    print(f'  bytes in articles {apparent:8}, on disk    {actual:8} '
+          f'({(1 - actual / apparent) * 100:.0f}% less disk)')
+
+
+def bench_resume(args, tmp: str) -> None:
+    threads = max(args.threads)
+    total = args.articles * args.images
+    download_image = threaded_parser.download_image
+    downloaded = 0
+    lock = threading.Lock()
+
+    def interrupt_at_90(ref, folder, max_size):
+        nonlocal downloaded
+        download_image(ref, folder, max_size)
+        with lock:
+            downloaded += 1
+            if downloaded == total * 9 // 10:
+                os.kill(os.getpid(), signal.SIGINT)
+
+    def run(out_dir, resume=False):
+        cwd = os.getcwd()
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            threaded_parser.run_scraper(threads, args.articles, out_dir,
+                                        cache=False, resume=resume)
+        os.chdir(cwd)
+        return time.perf_counter() - start
+
+    with HabrStub(args.articles, args.images, args.delay) as stub, \
+            mock.patch.object(threaded_parser, 'HABR', stub.url):
+        full = run(tempfile.mkdtemp(dir=tmp))
+        out_dir = tempfile.mkdtemp(dir=tmp)
+        with mock.patch.object(threaded_parser, 'download_image',
+                               interrupt_at_90):
+            interrupted = run(out_dir)
+        resumed = run(out_dir, resume=True)
+    print(f'{total} images, {threads} threads:')
+    print(f'  full crawl        {full:8.3f} s')
+    print(f'  interrupted at {downloaded * 100 // total:2}% '
+          f'{interrupted:8.3f} s')
+    print(f'  resumed           {resumed:8.3f} s '
+          f'({resumed / full * 100:.0f}% of the full crawl)')
+
+
+def bench_adaptive(args, tmp: str) -> None:
+    capacity = [(1, 4), (1, 24)]
+    print(f'{args.articles} articles x {args.images} images, '
+          f'{args.delay * 1000:.0f} ms latency, server capacity alternating '
+          f'{" / ".join(str(requests) for _, requests in capacity)} '
+          f'every second:')
+    for threads, adaptive in [(threads, False) for threads in args.threads] \
+            + [(max(args.threads), True)]:
+        with HabrStub(args.articles, args.images, args.delay,
+                      capacity=capacity) as stub, \
+                mock.patch.object(threaded_parser, 'HABR', stub.url):
+            out_dir = tempfile.mkdtemp(dir=tmp)
+            cwd = os.getcwd()
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                threaded_parser.run_scraper(
+                    threads, args.articles, out_dir, per_host=threads,
+                    cache=False, adaptive=adaptive)
+            elapsed = time.perf_counter() - start
+            os.chdir(cwd)
+        downloaded = sum(len(os.listdir(os.path.join(out_dir, name)))
+                         for name in os.listdir(out_dir)
+                         if not name.startswith('.'))
+        label = 'adaptive' if adaptive else 'fixed'
+        print(f'{label:>8} {threads:>5}: {elapsed:8.3f} s {downloaded:6} '
+              f'images {downloaded / elapsed:8.1f} images/s '
+              f'{stub.throttled:6} throttled')
+
+
+def bench_stats(args, tmp: str) -> None:
+    threads = max(args.threads)
+    print(f'{args.articles} articles x {args.images} images, '
+          f'{args.delay * 1000:.0f} ms latency, {threads} threads, '
+          f'best of 3:')
+    with HabrStub(args.articles, args.images, args.delay) as stub, \
+            mock.patch.object(threaded_parser, 'HABR', stub.url):
+        for stats in (False, True, False, True):
+            best = float('inf')
+            for _ in range(3):
+                cwd = os.getcwd()
+                start = time.perf_counter()
+                with contextlib.redirect_stdout(io.StringIO()), \
+                        contextlib.redirect_stderr(io.StringIO()):
+                    threaded_parser.run_scraper(
+                        threads, args.articles, tempfile.mkdtemp(dir=tmp),
+                        cache=False, stats=stats)
+                best = min(best, time.perf_counter() - start)
+                os.chdir(cwd)
+            label = 'stats on' if stats else 'stats off'
+            print(f'  {label:>9}: {best:8.3f} s')
+
+
+RE_IMAGES = re.compile(r'<img src=\"')
+
+
+def extract_images_find(content):
+    """ extract_images() before PageScanner: str.find and a regex. """
+    body_start = content.find(r'<div id="post-content-body">')
+    body_end = content.find(r'</div>', body_start)
+    inner_content = content[body_start:body_end]
+    images = []
+    for image in RE_IMAGES.finditer(inner_content):
+        start_ref = image.end()
+        end_ref = inner_content.find(r'"', start_ref)
+        images.append(inner_content[start_ref:end_ref])
+    return images
+
+
+def extract_articles_regex(content, articles):
+    """ extract_articles() before PageScanner: regexes over the page. """
+    re_headers = re.compile(r'<h2.*<\/h2>')
+    re_name = re.compile(r'<span>(.*)<\/span>')
+    re_href = re.compile(r'<a href=\"(.*)\"')
+    result = []
+    for lnk in re.findall(re_headers, content)[:articles]:
+        article_name = re.search(re_name, lnk).group(1)
+        article_link = re.search(re_href, lnk).group(1)
+        article_link = article_link[:article_link.find(r'"', 1)]
+        result.append((article_name, article_link))
+    return result
+
+
+def synthetic_front_page(articles: int, size: int) -> bytes:
+    """ A Habr-like front page of about `size` bytes. """
+    teaser = ('<div class="tm-article-snippet"><div class="meta"><a href="'
+              '/ru/users/x/"><span>x</span></a><time>today</time></div>'
+              '<div class="body"><p>Lorem ipsum dolor sit amet.</p>' * 4
+              + '</div></div>\n')
+    repeat = max(1, size // articles // len(teaser))
+    headers = ''.join(
+        f'<article><h2 class="tm-title"><a href="/ru/articles/{i}/" '
+        f'class="tm-title__link"><span>Article {i}</span></a></h2>'
+        f'{teaser * repeat}</article>\n' for i in range(articles))
+    return f'<html><body>{headers}</body></html>'.encode()
+
+
+def synthetic_page(images: int, size: int) -> bytes:
+    """ A Habr-like article of about `size` bytes with `images` images. """
+    paragraph = ('<p>Lorem ipsum <a href="/ru/hub/python/">dolor</a> sit '
+                 '<code>amet</code>, consectetur adipiscing elit.</p>\n')
+    figures = [f'<figure class="full-width"><img src="https://habrastorage'
+               f'.org/webt/{j:08x}.png" alt="" width="780"></figure>\n'
+               for j in range(images)]
+    header = '<html><head><title>Article</title></head><body>' \
+        + '<nav><a href="/ru/">Habr</a></nav>\n' * 20
+    body = ''.join(paragraph * 3 + figure for figure in figures)
+    comment = ('<div class="comment"><div class="comment__head"><a href="'
+               '/ru/users/x/">x</a></div><div class="comment__message">'
+               + paragraph + '</div></div>\n')
+    page = f'{header}<div id="post-content-body"><div>{body}</div></div>'
+    comments = comment * max(0, (size - len(page)) // len(comment))
+    return f'{page}{comments}</body></html>'.encode()
+
+
+def bench_parse(args, tmp: str) -> None:
+    if args.pages:
+        pages = []
+        for path in args.pages:
+            with open(path, 'rb') as f:
+                pages.append((os.path.basename(path), f.read()))
+    else:
+        pages = [(f'synthetic {size >> 20} MiB {kind}', page(size))
+                 for size in (1 << 20, 4 << 20)
+                 for kind, page in (
+                     ('article', partial(synthetic_page, args.images)),
+                     ('front page', partial(synthetic_front_page,
+                                            args.articles)))]
+
+    def timeit(function, repeat=5):
+        best = float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            function()
+            best = min(best, time.perf_counter() - start)
+        return best
+
+    def stream(page, front):
+        first = None
+        offset = 0
+
+        def found(*_):
+            nonlocal first
+            if first is None:
+                first = offset
+
+        scanner = threaded_parser.PageScanner(
+            on_article=found if front else None,
+            on_image=None if front else found)
+        for offset in range(0, len(page), threaded_parser.CHUNK_SIZE):
+            scanner.feed(
+                page[offset:offset + threaded_parser.CHUNK_SIZE])
+        scanner.close()
+        return first
+
+    for name, page in pages:
+        front = b'post-content-body' not in page
+        if front:
+            found = len(threaded_parser.extract_articles(page, len(page)))
+            old = partial(extract_articles_regex, articles=len(page))
+            new = partial(threaded_parser.extract_articles,
+                          articles=len(page))
+        else:
+            found = len(threaded_parser.extract_images(page))
+            old = extract_images_find
+            new = threaded_parser.extract_images
+        print(f'{name}: {len(page) / 1024:.0f} KiB, {found} '
+              f'{"articles" if front else "images"}')
+        for label, function in (
+                ('before', lambda: old(page.decode('utf-8'))),
+                ('scanner', lambda: new(page)),
+                ('streamed', lambda: stream(page, front))):
+            elapsed = timeit(function)
+            print(f'  {label:>10}: {elapsed * 1000:8.2f} ms '
+                  f'{len(page) / elapsed / (1 << 20):8.1f} MiB/s')
+        first = stream(page, front)
+        if first is not None:
+            print(f'  first {"article" if front else "image"} known after '
+                  f'{(first + threaded_parser.CHUNK_SIZE) / 1024:.0f} KiB '
+                  f'instead of {len(page) / 1024:.0f} KiB')
+
+
+BENCHMARKS = {
+    'threads': bench_threads,
+    'pool': bench_pool,
+    'dedup': bench_dedup,
+    'resume': bench_resume,
+    'adaptive': bench_adaptive,
+    'parse': bench_parse,
+    'stats': bench_stats,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Habr scraper benchmarks')
+    parser.add_argument('benchmarks', nargs='*', metavar='BENCHMARK',
+                        help=f'one of {", ".join(BENCHMARKS)} (default: all)')
+    parser.add_argument('--articles', type=int, default=20)
+    parser.add_argument('--images', type=int, default=10)
+    parser.add_argument('--delay', type=float, default=0.02)
+    parser.add_argument('--shared', type=int, default=3,
+                        help='images shared by all articles (dedup)')
+    parser.add_argument('--copies', type=int, default=2,
+                        help='identical images under per-article URLs (dedup)')
+    parser.add_argument('--handshake', type=float, default=0.02,
+                        help='per-connection setup latency (pool benchmark)')
+    parser.add_argument('--threads', type=int, nargs='+',
+                        default=[1, 2, 4, 8, 16, 32],
+                        help='worker threads / requests in flight')
+    parser.add_argument('--pages', nargs='+', metavar='FILE',
+                        help='saved article pages to parse (parse '
+                             'benchmark; default: synthetic pages)')
+    parser.add_argument('--engine', nargs='+', default=['threads', 'asyncio'],
+                        choices=('threads', 'asyncio'))
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for name in args.benchmarks or BENCHMARKS:
+            if name not in BENCHMARKS:
+                parser.error(f'unknown benchmark {name}')
+            BENCHMARKS[name](args, tmp)
+
+
+if __name__ == '__main__':
+    main()
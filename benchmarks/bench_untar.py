@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+
+import argparse
+import io
+import os
+import shutil
+import struct
+import sys
+import tarfile
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+import untar_stripped  # noqa: E402
+
+JOBS = 8
+
+
+def make_archive(path: str, files: int, size: int) -> None:
+    data = os.urandom(size)
+    with tarfile.open(path, 'w', format=tarfile.USTAR_FORMAT) as tar:
+        for i in range(files):
+            info = tarfile.TarInfo(f'file{i:06}')
+            info.size = size
+            tar.addfile(info, io.BytesIO(data))
+
+
+def make_headers_archive(path: str, entries: int) -> None:
+    '''
+    Быстро пишет архив из `entries' пустых файлов, собирая заголовки вручную
+    '''
+    head = struct.Struct('100s8s8s8s12s12s')
+    tail = struct.Struct('c100s6s2s32s32s8s8s155s12x')
+    with open(path, 'wb') as f:
+        for i in range(entries):
+            header = bytearray(
+                head.pack(f'dir{i // 1000:04}/file{i:07}'.encode(),
+                          b'0000644', b'0001750', b'0001750',
+                          b'00000000000', b'14315245655')
+                + b' ' * 8
+                + tail.pack(b'0', b'', b'ustar', b'00', b'user', b'group',
+                            b'', b'', b''))
+            header[148:156] = b'%06o\x00 ' % sum(header)
+            f.write(header)
+        f.write(bytes(1024))
+
+
+def buffered_extract(tar: untar_stripped.TarParser, dest: str) -> None:
+    for name in tar.files():
+        with open(os.path.join(dest, name), 'wb') as f:
+            for chunk in tar.read_member(name):
+                f.write(chunk)
+
+
+def zero_copy_extract(tar: untar_stripped.TarParser, dest: str) -> None:
+    tar.extract(dest)
+
+
+def parallel_extract(tar: untar_stripped.TarParser, dest: str) -> None:
+    tar.extract(dest, workers=JOBS)
+
+
+def legacy_scan(filename: str) -> None:
+    '''
+    Прежний разбор: чтение по одному заголовку, struct.unpack всех полей,
+    создание ArchiveItem и форматирование времени для каждого элемента
+    '''
+    tar = untar_stripped.TarParser.__new__(untar_stripped.TarParser)
+    items = {}
+    with open(filename, 'rb') as file:
+        while True:
+            header = file.read(512)
+            if len(header) < 512:
+                break
+            if header[0] == 0:
+                continue
+            archive_item = tar.create_archive_item(header)
+            archive_item.mod_time
+            items[archive_item.name] = archive_item
+            file.seek(-(-archive_item.size // 512) * 512, 1)
+
+
+def batch_scan(filename: str) -> None:
+    untar_stripped.TarParser(filename)
+
+
+def compressible_data(size: int) -> bytes:
+    words = [os.urandom(4).hex().encode() for _ in range(4096)]
+    data = b' '.join(words[i % 4096 // (i % 7 + 1)] for i in range(size // 8))
+    return data[:size]
+
+
+def tarfile_write(archive: str, members: list) -> None:
+    with tarfile.open(archive, 'w:gz') as tar:
+        for name, data in members:
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+
+
+def writer_plain(archive: str, members: list) -> None:
+    with untar_stripped.TarWriter(archive) as tar:
+        for name, data in members:
+            tar.add(name, data)
+
+
+def writer_gzip(archive: str, members: list) -> None:
+    with untar_stripped.TarWriter(archive, 'gz') as tar:
+        for name, data in members:
+            tar.add(name, data)
+
+
+def writer_parallel_gzip(archive: str, members: list) -> None:
+    with untar_stripped.TarWriter(archive, 'gz', workers=JOBS) as tar:
+        for name, data in members:
+            tar.add(name, data)
+
+
+def measure(func, tar, tmp: str, repeat: int) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        dest = tempfile.mkdtemp(dir=tmp)
+        start = time.perf_counter()
+        func(tar, dest)
+        best = min(best, time.perf_counter() - start)
+        shutil.rmtree(dest)
+    return best
+
+
+def bench_extract(args, tmp: str) -> None:
+    archive = os.path.join(tmp, 'bench.tar')
+    make_archive(archive, args.files, args.size)
+    tar = untar_stripped.TarParser(archive)
+    total = args.files * args.size / 2**20
+    print(f'{args.files} files of {args.size} bytes:')
+    for func in (buffered_extract, zero_copy_extract):
+        elapsed = measure(func, tar, tmp, args.repeat)
+        print(f'{func.__name__:>20}: {elapsed:8.3f} s '
+              f'{total / elapsed:10.1f} MiB/s')
+
+
+def bench_small_files(args, tmp: str) -> None:
+    archive = os.path.join(tmp, 'small.tar')
+    make_archive(archive, args.small_files, 4096)
+    tar = untar_stripped.TarParser(archive)
+    print(f'{args.small_files} small files:')
+    for func in (zero_copy_extract, parallel_extract):
+        elapsed = measure(func, tar, tmp, args.repeat)
+        print(f'{func.__name__:>20}: {elapsed:8.3f} s '
+              f'{args.small_files / elapsed:10.1f} files/s')
+
+
+def bench_scan(args, tmp: str) -> None:
+    archive = os.path.join(tmp, 'headers.tar')
+    make_headers_archive(archive, args.entries)
+    print(f'{args.entries} headers:')
+    for func in (legacy_scan, batch_scan):
+        start = time.perf_counter()
+        func(archive)
+        elapsed = time.perf_counter() - start
+        print(f'{func.__name__:>20}: {elapsed:8.3f} s '
+              f'{args.entries / elapsed:10.1f} headers/s')
+
+
+def bench_write(args, tmp: str) -> None:
+    data = compressible_data(args.size)
+    members = [(f'file{i:06}', data) for i in range(args.files)]
+    total = args.files * args.size / 2**20
+    archive = os.path.join(tmp, 'written.tar')
+    print(f'writing {args.files} files of {args.size} bytes:')
+    for func in (tarfile_write, writer_plain, writer_gzip,
+                 writer_parallel_gzip):
+        best = float('inf')
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            func(archive, members)
+            best = min(best, time.perf_counter() - start)
+        print(f'{func.__name__:>20}: {best:8.3f} s '
+              f'{total / best:10.1f} MiB/s '
+              f'{os.path.getsize(archive) / 2**20:10.1f} MiB')
+
+
+BENCHMARKS = {
+    'extract': bench_extract,
+    'small': bench_small_files,
+    'scan': bench_scan,
+    'write': bench_write,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='TarParser benchmarks')
+    parser.add_argument('benchmarks', nargs='*', metavar='BENCHMARK',
+                        help=f'one of {", ".join(BENCHMARKS)} (default: all)')
+    parser.add_argument('--files', type=int, default=16)
+    parser.add_argument('--size', type=int, default=32 * 2**20)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--jobs', type=int, default=JOBS)
+    parser.add_argument('--small-files', type=int, default=5000)
+    parser.add_argument('--entries', type=int, default=10**6)
+    args = parser.parse_args()
+    globals()['JOBS'] = args.jobs
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for name in args.benchmarks or BENCHMARKS:
+            if name not in BENCHMARKS:
+                parser.error(f'unknown benchmark {name}')
+            BENCHMARKS[name](args, tmp)
+
+
+if __name__ == '__main__':
+    main()
@@ -3,13 +3,33 @@
 from urllib.error import URLError
 from urllib.request import urlopen, HTTPError
 from urllib.parse import quote, unquote
-from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from array import array
+import argparse
+import bisect
+import bz2
+import mmap
+import os
 import re
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from xml.parsers import expat
+import zlib
 
+WIKI = 'https://ru.wikipedia.org'
+WORKERS = 16
+CACHE_PATH = os.path.join(os.path.expanduser('~'), '.cache', 'phil.sqlite')
+CACHE_TTL = 7 * 24 * 3600
+CACHE_SIZE = 256 * 1024 * 1024
 RE_LINK = re.compile(r'/wiki/([^:# ]+)[\"\']', flags=re.IGNORECASE)
 RE_BODY_START = re.compile(
     r'<div class="mw-content-ltr mw-parser-output" lang="ru" dir="ltr">')
 RE_BODY_END = re.compile(r'\<\!\-\-esi')
+RE_WIKILINK = re.compile(r'\[\[([^\[\]|]*)(?:\|[^\[\]]*)?\]\]')
 
 
 def get_content(name: str) -> str | None:
@@ -18,7 +38,7 @@ def get_content(name: str) -> str | None:
     В случае ошибки загрузки или отсутствия страницы возвращается None.
     """
     try:
-        with urlopen(f'https://ru.wikipedia.org/wiki/{quote(name)}') as page:
+        with urlopen(f'{WIKI}/wiki/{quote(name)}') as page:
             content = page.read().decode("utf-8")
             return content
     except (URLError, HTTPError):
@@ -61,42 +81,611 @@ def extract_links(page: str | None, begin: int, end: int) -> list[str]:
     return [unquote(link) for link in links]
 
 
-def find_chain(start: str, finish: str) -> list[str] | None:
+class LinkCache:
+    """
+    Постоянный кэш ссылок статей в базе SQLite path: для каждой статьи
+    хранится сжатый zlib список её ссылок, а не сама страница.
+    Записи старше ttl секунд считаются устаревшими. Когда сжатые списки
+    занимают больше max_bytes байт, удаляются давнее всего использованные.
+    Объект можно использовать из нескольких потоков.
+    """
+    COMMIT_EVERY = 64
+
+    def __init__(self, path: str = CACHE_PATH, ttl: float = CACHE_TTL,
+                 max_bytes: int = CACHE_SIZE):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.hits = self.misses = self.expired = self.evicted = 0
+        self.uncommitted = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute('CREATE TABLE IF NOT EXISTS links ('
+                        'title TEXT PRIMARY KEY, links BLOB NOT NULL, '
+                        'fetched REAL NOT NULL, used REAL NOT NULL)')
+        self.db.execute('CREATE INDEX IF NOT EXISTS links_used '
+                        'ON links (used)')
+        self.size = self.db.execute(
+            'SELECT COALESCE(SUM(LENGTH(links)), 0) FROM links').fetchone()[0]
+
+    def get(self, title: str) -> list[str] | None:
+        """
+        Функция возвращает ссылки статьи title из кэша или None, если их нет
+        или они устарели.
+        """
+        now = time.time()
+        with self.lock:
+            row = self.db.execute('SELECT links, fetched FROM links '
+                                  'WHERE title = ?', (title,)).fetchone()
+            if row is None or row[1] < now - self.ttl:
+                self.misses += 1
+                self.expired += row is not None
+                return None
+            self.hits += 1
+            self.db.execute('UPDATE links SET used = ? WHERE title = ?',
+                            (now, title))
+            self.written()
+        data = zlib.decompress(row[0]).decode('utf-8')
+        return data.split('\n') if data else []
+
+    def put(self, title: str, links: list[str]) -> None:
+        data = zlib.compress('\n'.join(links).encode('utf-8'))
+        now = time.time()
+        with self.lock:
+            old = self.db.execute('SELECT LENGTH(links) FROM links '
+                                  'WHERE title = ?', (title,)).fetchone()
+            self.db.execute('INSERT OR REPLACE INTO links VALUES (?, ?, ?, ?)',
+                            (title, data, now, now))
+            self.size += len(data) - (old[0] if old else 0)
+            if self.size > self.max_bytes:
+                self.evict()
+            self.written()
+
+    def evict(self) -> None:
+        """ Удаляет давнее всего использованные записи. Вызывать под lock. """
+        rows = self.db.execute('SELECT title, LENGTH(links) FROM links '
+                               'ORDER BY used')
+        victims = []
+        for title, size in rows:
+            if self.size <= self.max_bytes:
+                break
+            victims.append((title,))
+            self.size -= size
+        self.db.executemany('DELETE FROM links WHERE title = ?', victims)
+        self.evicted += len(victims)
+
+    def written(self) -> None:
+        self.uncommitted += 1
+        if self.uncommitted >= self.COMMIT_EVERY:
+            self.db.commit()
+            self.uncommitted = 0
+
+    def close(self) -> None:
+        with self.lock:
+            self.db.commit()
+            self.db.close()
+
+    def summary(self) -> str:
+        requests = self.hits + self.misses
+        rate = self.hits / requests * 100 if requests else 0.0
+        return (f'Cache: {self.hits} hits, {self.misses} misses '
+                f'({rate:.0f}% hit rate), {self.expired} expired, '
+                f'{self.evicted} evicted, {self.size} bytes')
+
+
+CACHE: LinkCache | None = None
+
+
+def get_links(name: str) -> list[str] | None:
+    """
+    Функция загружает вики-страницу name и возвращает отсортированный список
+    ссылок из содержимого статьи или None, если страницу загрузить не удалось.
+    Если задан CACHE, ссылки берутся из него и сохраняются в него.
+    """
+    if CACHE is not None:
+        links = CACHE.get(name)
+        if links is not None:
+            return links
+    page = get_content(name)
+    if page is None:
+        return None
+    links = sorted(extract_links(page, *extract_content(page)))
+    if CACHE is not None:
+        CACHE.put(name, links)
+    return links
+
+
+def fetch_level(executor, frontier: list[str], finish: str):
+    """
+    Функция параллельно загружает ссылки всех статей уровня frontier и
+    возвращает итератор по их спискам (None для незагруженных) в порядке
+    frontier. Как только ссылка на finish найдена, загрузка статей после неё
+    в порядке frontier отменяется: дальше неё итерировать не нужно.
+    """
+    futures = [executor.submit(get_links, name) for name in frontier]
+    for index, future in enumerate(futures):
+        future.add_done_callback(partial(cancel_after, futures, index, finish))
+    return (None if future.cancelled() else future.result()
+            for future in futures)
+
+
+def cancel_after(futures, index: int, finish: str, future) -> None:
+    if not future.cancelled() and future.exception() is None \
+            and finish in (future.result() or ()):
+        for later in futures[index + 1:]:
+            later.cancel()
+
+
+def find_chain(start: str, finish: str, workers: int = WORKERS,
+               index: 'LinkIndex | None' = None,
+               bidirectional: bool = False) -> list[str] | None:
     """
     Функция принимает на вход название начальной и конечной статьи и возвращает
     список переходов, позволяющий добраться из начальной статьи в конечную.
     Первым элементом результата должен быть start, последним — finish.
     Если построить переходы невозможно, возвращается None.
+
+    Поиск в ширину идёт по уровням: все статьи очередного уровня загружаются
+    параллельно в workers потоков. Если задан index, поиск идёт по нему без
+    обращений к сети, а при bidirectional — навстречу от обеих статей.
+    """
+    if index is not None:
+        return index.find_chain(start, finish, bidirectional)
+    executor = ThreadPoolExecutor(workers)
+    try:
+        finish_page = executor.submit(get_links, finish)
+
+        def expand(frontier):
+            levels = fetch_level(executor, frontier, finish)
+            if finish_page.result() is None:
+                return ()
+            return levels
+
+        return search(start, finish, expand)
+    finally:
+        # Pages being fetched still make it to the cache.
+        executor.shutdown(cancel_futures=True)
+
+
+def search(start: str, finish: str, expand) -> list[str] | None:
+    """
+    Функция ищет в ширину кратчайшую цепочку из start в finish и возвращает
+    её или None. expand(frontier) получает список статей очередного уровня и
+    возвращает итерируемое по спискам их ссылок в том же порядке (None для
+    незагруженных); дальше первой статьи со ссылкой на finish оно не читается.
+    Цепочка получается кратчайшей, а при нескольких кратчайших выбирается одна
+    и та же: статьи уровня и их ссылки перебираются по порядку.
+
+    Каждой найденной статье присваивается номер; для статьи хранится только
+    номер статьи, из которой на неё впервые сослались, в array, а цепочка
+    восстанавливается по этим номерам один раз в конце.
+    """
+    ids = {start: 0}
+    titles = [start]
+    parents = array('i', [-1])
+    frontier = array('i', [0])
+    while frontier:
+        next_frontier = array('i')
+        levels = expand([titles[node] for node in frontier])
+        for node, links in zip(frontier, levels):
+            if not links:
+                continue
+            if finish in links:
+                return restore_chain(titles, parents, node) + [finish]
+            for link in links:
+                if link in ids:
+                    continue
+                ids[link] = len(titles)
+                next_frontier.append(len(titles))
+                titles.append(link)
+                parents.append(node)
+        frontier = next_frontier
+    return None
+
+
+def restore_chain(titles: list[str], parents: array, node: int) -> list[str]:
+    """
+    Функция возвращает цепочку статей от начальной до статьи с номером node
+    по номерам родителей parents.
+    """
+    chain = []
+    while node != -1:
+        chain.append(titles[node])
+        node = parents[node]
+    return chain[::-1]
+
+
+def normalize_title(title: str) -> str:
+    """
+    Функция приводит название статьи из вики-разметки к виду из адреса
+    страницы: пробелы заменяются подчёркиваниями, первая буква — заглавная.
+    """
+    title = '_'.join(title.replace('_', ' ').split())
+    return title[:1].upper() + title[1:]
+
+
+def extract_wikilinks(text: str) -> list[str]:
     """
-    if get_content(start) is None or get_content(finish) is None:
+    Функция возвращает ссылки [[...]] вики-разметки text на другие статьи без
+    повторений, отбрасывая те же ссылки, что и extract_links: на другие
+    пространства имён и интервики (с двоеточием) и на разделы (с #).
+    """
+    links = {normalize_title(target)
+             for target in set(RE_WIKILINK.findall(text))
+             if ':' not in target and '#' not in target}
+    links.discard('')
+    return list(links)
+
+
+def iter_dump(path: str):
+    """
+    Генератор потоково читает XML-выгрузку MediaWiki path (можно сжатую bz2) и
+    порождает (название, цель перенаправления или None, вики-текст) для статей
+    основного пространства имён.
+    """
+    pages = []
+    page = {}
+    data = []
+
+    def start(tag, attributes):
+        if tag == 'page':
+            page.clear()
+        elif tag == 'redirect':
+            page['redirect'] = attributes.get('title')
+        data.clear()
+
+    def end(tag):
+        if tag in ('title', 'ns', 'text'):
+            page[tag] = ''.join(data)
+        elif tag == 'page' and page.get('ns') == '0' and page.get('title'):
+            redirect = page.get('redirect')
+            pages.append((normalize_title(page['title']),
+                          redirect and normalize_title(redirect),
+                          page.get('text', '')))
+
+    parser = expat.ParserCreate()
+    parser.buffer_text = True
+    parser.StartElementHandler = start
+    parser.EndElementHandler = end
+    parser.CharacterDataHandler = data.append
+    opener = bz2.open if path.endswith('.bz2') else open
+    with opener(path, 'rb') as f:
+        while chunk := f.read(1 << 20):
+            parser.Parse(chunk, False)
+            yield from pages
+            pages.clear()
+        parser.Parse(b'', True)
+        yield from pages
+
+
+class LinkIndex:
+    """
+    Индекс ссылок статей в каталоге path в формате CSR: номера статей — места
+    их названий в отсортированном списке, ссылки статьи id — targets[
+    offsets[id]:offsets[id + 1]], отсортированные по номеру, то есть по
+    названию. Так же в rev_offsets и rev_targets хранятся обратные ссылки:
+    номера статей, ссылающихся на id. Названия лежат в titles.txt, смещения
+    их строк — в title_offsets. Так же отсортированные названия
+    перенаправлений лежат в redirects.txt и redirect_offsets, а номера статей,
+    на которые они ведут, — в redirect_targets. Все массивы — int32. Файлы
+    отображаются в память через mmap и не читаются целиком.
+
+    В expanded после каждого поиска лежит число статей, ссылки которых он
+    просмотрел.
+    """
+    FILES = ('offsets', 'targets', 'rev_offsets', 'rev_targets',
+             'title_offsets', 'redirect_offsets', 'redirect_targets')
+    TITLES = 'titles.txt'
+    REDIRECTS = 'redirects.txt'
+
+    def __init__(self, path: str):
+        self.path = path
+        self.maps = []
+        self.views = []
+        (self.offsets, self.targets, self.rev_offsets, self.rev_targets,
+         self.title_offsets, self.redirect_offsets,
+         self.redirect_targets) = (self.map(f'{name}.i32', 'i')
+                                   for name in self.FILES)
+        self.titles = self.map(self.TITLES)
+        self.redirects = self.map(self.REDIRECTS)
+        self.expanded = 0
+
+    def map(self, name: str, format: str = 'B') -> memoryview:
+        with open(os.path.join(self.path, name), 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return memoryview(b'').cast(format)
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.maps.append(data)
+        self.views.append(memoryview(data))
+        self.views.append(self.views[-1].cast(format))
+        return self.views[-1]
+
+    def __len__(self) -> int:
+        return len(self.title_offsets) - 1
+
+    def title(self, node: int) -> str:
+        return bytes(self.titles[self.title_offsets[node]:
+                                 self.title_offsets[node + 1] - 1]
+                     ).decode('utf-8')
+
+    def id(self, title: str) -> int | None:
+        """
+        Возвращает номер статьи title или статьи, на которую title
+        перенаправляет, либо None.
+        """
+        key = title.encode('utf-8')
+        node = self.lookup(self.titles, self.title_offsets, key)
+        if node is not None:
+            return node
+        alias = self.lookup(self.redirects, self.redirect_offsets, key)
+        return None if alias is None else self.redirect_targets[alias]
+
+    @staticmethod
+    def lookup(lines: memoryview, offsets: memoryview,
+               key: bytes) -> int | None:
+        """ Двоичный поиск key среди отсортированных строк lines. """
+        def line(i):
+            return lines[offsets[i]:offsets[i + 1] - 1].tobytes()
+
+        i = bisect.bisect_left(range(len(offsets) - 1), key, key=line)
+        if i < len(offsets) - 1 and line(i) == key:
+            return i
         return None
-    queue = deque([start])
-    paths = {start: []}
-    while len(queue) > 0:
-        name = queue.pop()
-        page = get_content(name)
-        page_begin, page_end = extract_content(page)
-        links = extract_links(page, page_begin, page_end)
-        if len(links) == 0:
-            continue
-        for link in links:
-            if link == finish:
-                return paths[name] + [name, finish]
 
-            if link in paths.keys():
+    def links(self, node: int) -> memoryview:
+        return self.targets[self.offsets[node]:self.offsets[node + 1]]
+
+    def backlinks(self, node: int) -> memoryview:
+        return self.rev_targets[self.rev_offsets[node]:
+                                self.rev_offsets[node + 1]]
+
+    def find_chain(self, start: str, finish: str,
+                   bidirectional: bool = False) -> list[str] | None:
+        """
+        Функция ищет в ширину кратчайшую цепочку из start в finish так же,
+        как search, но по номерам статей. При bidirectional поиск идёт
+        навстречу с двух сторон (см. find_chain_bidirectional): длина цепочки
+        та же, но сама цепочка из нескольких кратчайших может быть другой.
+        Названия приводятся к виду normalize_title, перенаправления ведут на
+        свои статьи.
+        """
+        start = self.id(normalize_title(start))
+        finish = self.id(normalize_title(finish))
+        self.expanded = 0
+        if start is None or finish is None:
+            return None
+        if bidirectional and start != finish:
+            chain = self.find_chain_bidirectional(start, finish)
+        else:
+            chain = self.find_chain_forward(start, finish)
+        return chain and [self.title(node) for node in chain]
+
+    def find_chain_forward(self, start: int, finish: int) -> list[int] | None:
+        offsets, targets = self.offsets, self.targets
+        parents = array('i', [-2]) * len(self)
+        parents[start] = -1
+        frontier = [start]
+        while frontier:
+            next_frontier = []
+            self.expanded += len(frontier)
+            for node in frontier:
+                for link in targets[offsets[node]:offsets[node + 1]]:
+                    if link == finish:
+                        return self.restore(parents, node) + [finish]
+                    if parents[link] == -2:
+                        parents[link] = node
+                        next_frontier.append(link)
+            frontier = next_frontier
+        return None
+
+    def find_chain_bidirectional(self, start: int,
+                                 finish: int) -> list[int] | None:
+        """
+        Функция ищет кратчайшую цепочку встречными поисками в ширину: от start
+        по ссылкам и от finish по обратным ссылкам, каждый раз расширяя на
+        уровень меньшую из двух границ. Цепочка проходит через первую статью,
+        найденную обоими поисками: все такие статьи первого встретившегося
+        уровня дают цепочки одной, кратчайшей, длины.
+        """
+        sides = (
+            (self.offsets, self.targets, array('i', [-2]) * len(self),
+             [start]),
+            (self.rev_offsets, self.rev_targets, array('i', [-2]) * len(self),
+             [finish]),
+        )
+        sides[0][2][start] = sides[1][2][finish] = -1
+        while sides[0][3] and sides[1][3]:
+            side = 0 if len(sides[0][3]) <= len(sides[1][3]) else 1
+            offsets, targets, parents, frontier = sides[side]
+            other = sides[1 - side][2]
+            next_frontier = []
+            self.expanded += len(frontier)
+            for node in frontier:
+                for link in targets[offsets[node]:offsets[node + 1]]:
+                    if parents[link] != -2:
+                        continue
+                    parents[link] = node
+                    if other[link] != -2:
+                        return (self.restore(sides[0][2], link)
+                                + self.restore(sides[1][2], link)[-2::-1])
+                    next_frontier.append(link)
+            frontier[:] = next_frontier
+        return None
+
+    @staticmethod
+    def restore(parents: array, node: int) -> list[int]:
+        chain = []
+        while node != -1:
+            chain.append(node)
+            node = parents[node]
+        return chain[::-1]
+
+    def close(self) -> None:
+        self.offsets = self.targets = self.title_offsets = self.titles = None
+        self.rev_offsets = self.rev_targets = None
+        self.redirects = self.redirect_offsets = self.redirect_targets = None
+        for view in reversed(self.views):
+            view.release()
+        for data in self.maps:
+            data.close()
+        self.views = self.maps = []
+
+
+def build_index(dump: str, path: str) -> int:
+    """
+    Функция строит LinkIndex в каталоге path по выгрузке dump и возвращает
+    число статей. Ссылки на перенаправления заменяются ссылками на их цели,
+    ссылки на отсутствующие в выгрузке статьи отбрасываются. Перенаправления
+    на статьи выгрузки сохраняются, чтобы искать и по их названиям.
+    Выгрузка читается один раз: ссылки статей до нумерации названий
+    складываются во временный файл. Заодно строятся обратные ссылки.
+    """
+    os.makedirs(path, exist_ok=True)
+    redirects = {}
+    titles = set()
+    with tempfile.TemporaryFile('w+', encoding='utf-8', dir=path) as pages:
+        for title, redirect, text in iter_dump(dump):
+            if redirect is not None:
+                redirects[title] = redirect
                 continue
+            titles.add(title)
+            pages.write('\t'.join([title, *extract_wikilinks(text)]) + '\n')
+        titles = sorted(titles)
+        ids = {title: node for node, title in enumerate(titles)}
+        for title, target in redirects.items():
+            for _ in range(5):  # Цепочки перенаправлений.
+                if target not in redirects:
+                    break
+                target = redirects[target]
+            if target in ids and title not in ids:
+                ids[title] = ids[target]
+        aliases = sorted(title for title in redirects if title in ids)
 
-            paths[link] = paths[name] + [name]
-            queue.appendleft(link)
-    return None
+        adjacency = [None] * len(titles)
+        pages.seek(0)
+        for line in pages:
+            title, *links = line.rstrip('\n').split('\t')
+            node = ids[title]
+            adjacency[node] = array('i', sorted(
+                {ids[link] for link in links if link in ids} - {node}))
+
+    offsets = array('i', [0])
+    with open(os.path.join(path, 'targets.i32'), 'wb') as f:
+        for links in adjacency:
+            links.tofile(f)
+            offsets.append(offsets[-1] + len(links))
+    with open(os.path.join(path, 'offsets.i32'), 'wb') as f:
+        offsets.tofile(f)
+
+    # Обратные ссылки раскладываются подсчётом: статьи перебираются по
+    # возрастанию номера, и списки обратных ссылок тоже получаются
+    # отсортированными.
+    rev_offsets = array('i', [0]) * (len(titles) + 1)
+    for links in adjacency:
+        for link in links:
+            rev_offsets[link + 1] += 1
+    for node in range(len(titles)):
+        rev_offsets[node + 1] += rev_offsets[node]
+    rev_targets = array('i', [0]) * rev_offsets[-1]
+    position = rev_offsets[:-1]
+    for node, links in enumerate(adjacency):
+        for link in links:
+            rev_targets[position[link]] = node
+            position[link] += 1
+    del adjacency
+    for name, data in (('rev_offsets', rev_offsets),
+                       ('rev_targets', rev_targets)):
+        with open(os.path.join(path, f'{name}.i32'), 'wb') as f:
+            data.tofile(f)
+    write_lines(os.path.join(path, LinkIndex.TITLES),
+                os.path.join(path, 'title_offsets.i32'), titles)
+    write_lines(os.path.join(path, LinkIndex.REDIRECTS),
+                os.path.join(path, 'redirect_offsets.i32'), aliases)
+    with open(os.path.join(path, 'redirect_targets.i32'), 'wb') as f:
+        array('i', (ids[title] for title in aliases)).tofile(f)
+    return len(titles)
+
+
+def write_lines(path: str, offsets_path: str, lines: list[str]) -> None:
+    """
+    Функция записывает строки lines в файл path, а смещения их начал и конец
+    файла — массивом int32 в offsets_path.
+    """
+    offsets = array('i', [0])
+    with open(path, 'wb') as f:
+        for line in lines:
+            data = line.encode('utf-8') + b'\n'
+            f.write(data)
+            offsets.append(offsets[-1] + len(data))
+    with open(offsets_path, 'wb') as f:
+        offsets.tofile(f)
+
+
+def main_build_index(args: list[str]) -> None:
+    parser = argparse.ArgumentParser(
+        prog=f'{os.path.basename(sys.argv[0])} build-index',
+        description='Строит индекс ссылок по XML-выгрузке Википедии')
+    parser.add_argument('dump', help='файл выгрузки (.xml или .xml.bz2)')
+    parser.add_argument('-o', '--output', metavar='PATH',
+                        help='каталог индекса (по умолчанию DUMP.index)')
+    args = parser.parse_args(args)
+    output = args.output or re.sub(r'(\.xml)?(\.bz2)?$', '', args.dump) \
+        + '.index'
+    start = time.perf_counter()
+    pages = build_index(args.dump, output)
+    print(f'{pages} статей проиндексировано в {output} за '
+          f'{time.perf_counter() - start:.1f} с')
 
 
 def main():
-    from sys import argv
-    if len(argv) < 2:
-        print("Please provide start path")
-        exit(-1)
-    print(find_chain(argv[1], "Философия"))
+    global CACHE
+    if sys.argv[1:2] == ['build-index']:
+        main_build_index(sys.argv[2:])
+        return
+    parser = argparse.ArgumentParser(
+        description='Ищет цепочку ссылок Википедии от статьи до философии',
+        epilog=f'{os.path.basename(sys.argv[0])} build-index DUMP строит '
+               f'индекс для --index')
+    parser.add_argument('start', help='начальная статья')
+    parser.add_argument('--finish', default='Философия',
+                        help='конечная статья')
+    parser.add_argument('--workers', type=int, default=WORKERS,
+                        help='число параллельных загрузок')
+    parser.add_argument('--cache', default=CACHE_PATH, metavar='PATH',
+                        help='файл кэша ссылок')
+    parser.add_argument('--no-cache', dest='cache', action='store_const',
+                        const=None, help='не использовать кэш')
+    parser.add_argument('--cache-ttl', type=float, default=CACHE_TTL,
+                        metavar='SECONDS', help='срок жизни записей кэша')
+    parser.add_argument('--cache-size', type=int, default=CACHE_SIZE,
+                        metavar='BYTES', help='предельный размер кэша')
+    parser.add_argument('--index', metavar='PATH',
+                        help='искать по индексу build-index без сети')
+    parser.add_argument('--bidirectional', action='store_true',
+                        help='искать по индексу с двух сторон навстречу')
+    args = parser.parse_args()
+    if args.bidirectional and args.index is None:
+        parser.error('--bidirectional работает только с --index')
+
+    if args.index is not None:
+        index = LinkIndex(args.index)
+        try:
+            print(find_chain(args.start, args.finish, index=index,
+                             bidirectional=args.bidirectional))
+        finally:
+            index.close()
+        return
+    if args.cache is not None:
+        CACHE = LinkCache(args.cache, args.cache_ttl, args.cache_size)
+    try:
+        print(find_chain(args.start, args.finish, args.workers))
+    finally:
+        if CACHE is not None:
+            CACHE.close()
+            print(CACHE.summary(), file=sys.stderr)
+            CACHE = None
 
 
 if __name__ == '__main__':
@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+
+import argparse
+import contextlib
+import hashlib
+import http.server
+import subprocess
+import sys
+import threading
+import time
+
+
+class _Server(http.server.ThreadingHTTPServer):
+    request_queue_size = 256
+
+    def handle_error(self, request, client_address):
+        # Clients hanging up mid-response are expected (e.g. on shutdown).
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+class HabrStub:
+    """
+    Local stand-in for habr.com: a front page with `articles` headers,
+    article pages with `images` images each and the images themselves.
+    Every response is delayed by `delay` seconds to imitate network latency
+    and every new connection by `handshake` seconds to imitate TCP/TLS
+    setup; `connections` counts connections accepted. With `keep_alive`
+    off the server silently drops each connection after one response.
+    Responses carry an ETag and a Last-Modified date; conditional requests
+    for unchanged content get 304 and are counted in `not_modified`.
+    Besides its own images every article shows `shared` images with the
+    same URLs in all articles and `copies` images with per-article URLs
+    but the same content.
+
+    `capacity` is a list of (seconds, requests) phases, repeated in turn
+    from the start: while a phase lasts the server handles at most that
+    many requests at once and answers the excess with 429 at once; they
+    are counted in `throttled`.
+
+    With `stall`, pages stop for that many seconds before their closing
+    `</body>` tag, like a slow server still rendering the tail. `timings`
+    maps each path to the times its last request came in and was answered.
+    """
+    LAST_MODIFIED = 'Mon, 05 Oct 2026 10:00:00 GMT'
+
+    def __init__(self, articles=4, images=5, delay=0.0, image_size=1024,
+                 handshake=0.0, keep_alive=True, shared=0, copies=0,
+                 capacity=None, stall=0.0):
+        self.articles = articles
+        self.images = images
+        self.shared = shared
+        self.copies = copies
+        self.capacity = capacity
+        self.stall = stall
+        self.timings = {}
+        self.in_flight = 0
+        self.throttled = 0
+        self.started = time.monotonic()
+        self.delay = delay
+        self.image_size = image_size
+        self.handshake = handshake
+        self.keep_alive = keep_alive
+        self.connections = 0
+        self.not_modified = 0
+        self.requests = []
+        self.lock = threading.Lock()
+        self.server = _Server(('127.0.0.1', 0), self._handler())
+        self.server.daemon_threads = True
+        self.url = f'http://127.0.0.1:{self.server.server_port}'
+        self._thread = threading.Thread(target=self.server.serve_forever,
+                                        daemon=True)
+
+    def __enter__(self):
+        self.started = time.monotonic()
+        self._thread.start()
+        return self
+
+    def current_capacity(self):
+        if self.capacity is None:
+            return float('inf')
+        elapsed = (time.monotonic() - self.started) % sum(
+            seconds for seconds, _ in self.capacity)
+        for seconds, requests in self.capacity:
+            if elapsed < seconds:
+                return requests
+            elapsed -= seconds
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def front_page(self):
+        headers = ''.join(
+            f'<article><h2 class="title"><a href="/articles/{i}/" '
+            f'class="link"><span>Article {i}</span></a></h2></article>\n'
+            for i in range(self.articles))
+        return f'<html><body>{headers}</body></html>'.encode()
+
+    def article(self, i):
+        images = ''.join(
+            f'<p><img src="{self.url}/images/{i}/{j}.png" alt=""></p>'
+            for j in range(self.images))
+        images += ''.join(
+            f'<p><img src="{self.url}/shared/logo{k}.png" alt=""></p>'
+            for k in range(self.shared))
+        images += ''.join(
+            f'<p><img src="{self.url}/images/{i}/copy{k}.png" alt=""></p>'
+            for k in range(self.copies))
+        return (f'<html><body><div id="post-content-body">{images}</div>'
+                f'<div>comments</div></body></html>').encode()
+
+    def image(self, article, image):
+        return f'{article}/{image}'.encode().ljust(self.image_size, b'.')
+
+    def content(self, path):
+        parts = path.strip('/').split('/')
+        if path == '/':
+            return self.front_page()
+        if parts[0] == 'articles' and len(parts) == 2:
+            return self.article(int(parts[1]))
+        if parts[0] == 'images' and len(parts) == 3 \
+                and parts[2].startswith('copy'):
+            return self.image('copy', int(parts[2][4:-4]))
+        if parts[0] == 'images' and len(parts) == 3:
+            return self.image(int(parts[1]), int(parts[2][:-4]))
+        if parts[0] == 'shared' and len(parts) == 2:
+            return self.image('shared', int(parts[1][4:-4]))
+        return None
+
+    def _handler(self):
+        stub = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # Headers and body go out in separate writes; without this
+            # keep-alive clients stall on Nagle + delayed ACK.
+            disable_nagle_algorithm = True
+
+            def setup(self):
+                super().setup()
+                with stub.lock:
+                    stub.connections += 1
+                if stub.handshake:
+                    time.sleep(stub.handshake)
+
+            def do_GET(self):
+                with stub.lock:
+                    stub.requests.append(self.path)
+                    stub.timings[self.path] = [time.monotonic(), None]
+                    stub.in_flight += 1
+                    throttled = stub.in_flight > stub.current_capacity()
+                    stub.throttled += throttled
+                try:
+                    if throttled:
+                        self.send_response(429)
+                        self.send_header('Content-Length', '0')
+                        self.end_headers()
+                    else:
+                        self.respond()
+                finally:
+                    with stub.lock:
+                        stub.in_flight -= 1
+                        stub.timings[self.path][1] = time.monotonic()
+
+            def respond(self):
+                if stub.delay:
+                    time.sleep(stub.delay)
+                content = stub.content(self.path)
+                if content is None:
+                    self.send_error(404)
+                    return
+                etag = f'"{hashlib.sha1(content).hexdigest()[:16]}"'
+                if 'If-None-Match' in self.headers:
+                    fresh = self.headers['If-None-Match'] == etag
+                else:
+                    fresh = (self.headers.get('If-Modified-Since')
+                             == stub.LAST_MODIFIED)
+                if fresh:
+                    with stub.lock:
+                        stub.not_modified += 1
+                    self.send_response(304)
+                    self.send_header('ETag', etag)
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header('Content-Length', str(len(content)))
+                self.send_header('ETag', etag)
+                self.send_header('Last-Modified', stub.LAST_MODIFIED)
+                self.end_headers()
+                tail = content.rfind(b'</body>') if stub.stall else -1
+                if tail != -1:
+                    self.wfile.write(content[:tail])
+                    self.wfile.flush()
+                    time.sleep(stub.stall)
+                    content = content[tail:]
+                self.wfile.write(content)
+                if not stub.keep_alive:
+                    self.close_connection = True
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+@contextlib.contextmanager
+def spawn(**kwargs):
+    """
+    Runs HabrStub(**kwargs) in a separate process, e.g. to keep its memory
+    out of measurements, and yields its URL.
+    """
+    args = [f'--{key.replace("_", "-")}={value}'
+            for key, value in kwargs.items()]
+    process = subprocess.Popen([sys.executable, __file__, *args],
+                               stdout=subprocess.PIPE, text=True)
+    try:
+        yield process.stdout.readline().strip()
+    finally:
+        process.terminate()
+        process.wait()
+        process.stdout.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve a fake habr.com')
+    parser.add_argument('--articles', type=int, default=4)
+    parser.add_argument('--images', type=int, default=5)
+    parser.add_argument('--delay', type=float, default=0.0)
+    parser.add_argument('--image-size', type=int, default=1024)
+    parser.add_argument('--shared', type=int, default=0)
+    parser.add_argument('--copies', type=int, default=0)
+    args = parser.parse_args()
+    with HabrStub(args.articles, args.images, args.delay, args.image_size,
+                  shared=args.shared, copies=args.copies) as stub:
+        print(stub.url, flush=True)
+        threading.Event().wait()
+
+
+if __name__ == '__main__':
+    main()
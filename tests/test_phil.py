@@ -4,8 +4,15 @@ import phil as t
 from urllib.request import urlopen
 from urllib.parse import quote
 from urllib.error import URLError, HTTPError
+from collections import deque
+from unittest import mock
+import os
+import tempfile
+import time
 import unittest
 
+from wiki_stub import WikiStub, scale_free_graph, synthetic_graph, write_dump
+
 
 PHIL = 'Философия'
 
@@ -135,9 +142,306 @@ class TestChainFinder(unittest.TestCase):
         self._check('Самолёт')
 
 
+def _distance(graph, start, finish):
+    """ Число переходов кратчайшей цепочки из start в finish или None. """
+    queue = deque([start])
+    distances = {start: 0}
+    while queue:
+        name = queue.popleft()
+        for link in graph[name]:
+            if link == finish:
+                return distances[name] + 1
+            if link not in distances:
+                distances[link] = distances[name] + 1
+                queue.append(link)
+    return None
+
+
+class TestParallelChain(unittest.TestCase):
+    GRAPH = {
+        'A': ['B', 'C'],
+        'B': ['D'],
+        'C': ['D', 'E'],
+        'D': ['F'],
+        'E': ['F'],
+        'F': ['A'],
+        'G': [],
+    }
+
+    def _find(self, stub, start, finish, **kwargs):
+        with mock.patch.object(t, 'WIKI', stub.url):
+            return t.find_chain(start, finish, **kwargs)
+
+    def assertIsShortest(self, graph, chain, start, finish):
+        self.assertEqual(chain[0], start)
+        self.assertEqual(chain[-1], finish)
+        for name, link in zip(chain, chain[1:]):
+            self.assertIn(link, graph[name])
+        self.assertEqual(len(chain) - 1, _distance(graph, start, finish))
+
+    def test_small_graph(self):
+        with WikiStub(self.GRAPH) as stub:
+            self.assertEqual(self._find(stub, 'A', 'F'), ['A', 'B', 'D', 'F'])
+            self.assertEqual(self._find(stub, 'A', 'E'), ['A', 'C', 'E'])
+            self.assertEqual(self._find(stub, 'F', 'A'), ['F', 'A'])
+            self.assertIsNone(self._find(stub, 'G', 'A'))
+            self.assertIsNone(self._find(stub, 'A', 'G'))
+            self.assertIsNone(self._find(stub, 'A', 'Нет_такой'))
+            self.assertIsNone(self._find(stub, 'Нет_такой', 'A'))
+
+    def test_shortest_and_deterministic(self):
+        graph = synthetic_graph(300, 3, seed=1)
+        with WikiStub(graph) as stub:
+            for finish in ('Статья_1', 'Статья_42', 'Статья_299'):
+                with self.subTest(finish):
+                    chains = [self._find(stub, 'Статья_0', finish, workers=n)
+                              for n in (1, 4, 16, 16)]
+                    self.assertIsShortest(graph, chains[0], 'Статья_0',
+                                          finish)
+                    self.assertEqual(chains, chains[:1] * len(chains))
+
+    def test_search(self):
+        graph = synthetic_graph(2000, 2, seed=2)
+
+        def expand(frontier):
+            return (graph[name] for name in frontier)
+
+        for i in range(1, 2000, 97):
+            finish = f'Статья_{i}'
+            with self.subTest(finish):
+                chain = t.search('Статья_0', finish, expand)
+                if _distance(graph, 'Статья_0', finish) is None:
+                    self.assertIsNone(chain)
+                else:
+                    self.assertIsShortest(graph, chain, 'Статья_0', finish)
+
+    def test_concurrent_fetching(self):
+        graph = {'start': [f'x{i}' for i in range(20)], 'finish': []}
+        graph.update({f'x{i}': [f'y{i}'] for i in range(20)})
+        graph.update({f'y{i}': ['finish'] for i in range(20)})
+        with WikiStub(graph, delay=0.05) as stub:
+            begin = time.perf_counter()
+            chain = self._find(stub, 'start', 'finish', workers=20)
+            elapsed = time.perf_counter() - begin
+        self.assertEqual(chain, ['start', 'x0', 'y0', 'finish'])
+        # Three levels of 20 pages, each fetched in one round-trip.
+        self.assertLess(elapsed, 20 * 0.05)
+
+    def test_stops_at_finish(self):
+        graph = {'start': ['a', 'b'], 'a': ['finish'], 'finish': []}
+        graph.update({'b': [f'b{i}' for i in range(50)]})
+        graph.update({f'b{i}': [] for i in range(50)})
+        with WikiStub(graph) as stub:
+            self.assertEqual(self._find(stub, 'start', 'finish'),
+                             ['start', 'a', 'finish'])
+        self.assertFalse(any(name.startswith('b') and name != 'b'
+                             for name in stub.requests))
+
+
+class TestLinkCache(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self._tmp.name, 'links.sqlite')
+
+    def tearDown(self):
+        if t.CACHE is not None:
+            t.CACHE.close()
+            t.CACHE = None
+        self._tmp.cleanup()
+
+    def _find(self, stub, start, finish, **kwargs):
+        with mock.patch.object(t, 'WIKI', stub.url):
+            return t.find_chain(start, finish, **kwargs)
+
+    def test_repeated_query(self):
+        graph = synthetic_graph(200, 3, seed=3)
+        with WikiStub(graph) as stub:
+            t.CACHE = t.LinkCache(self.path)
+            chain = self._find(stub, 'Статья_0', 'Статья_7')
+            fetched = len(stub.requests)
+            t.CACHE.close()
+            # A new process: the cache lives on disk.
+            t.CACHE = t.LinkCache(self.path)
+            self.assertEqual(self._find(stub, 'Статья_0', 'Статья_7'), chain)
+            refetched = len(stub.requests) - fetched
+        # Only pages fetched ahead of the search and cancelled last time
+        # may be missing.
+        self.assertEqual(refetched, t.CACHE.misses)
+        self.assertGreater(t.CACHE.hits, 3 * t.CACHE.misses)
+
+    def test_get_put(self):
+        cache = t.LinkCache(self.path)
+        self.assertIsNone(cache.get('A'))
+        links = [f'Ссылка_{i}' for i in range(100)]
+        cache.put('A', links)
+        cache.put('B', [])
+        self.assertEqual(cache.get('A'), links)
+        self.assertEqual(cache.get('B'), [])
+        self.assertEqual((cache.hits, cache.misses), (2, 1))
+        # Link lists are stored compressed.
+        self.assertLess(cache.size, len('\n'.join(links).encode()) / 2)
+        cache.close()
+
+    def test_ttl(self):
+        cache = t.LinkCache(self.path, ttl=60)
+        cache.put('A', ['B'])
+        with mock.patch.object(t.time, 'time',
+                               return_value=time.time() + 61):
+            self.assertIsNone(cache.get('A'))
+        self.assertEqual(cache.expired, 1)
+        cache.close()
+
+    def test_lru_eviction(self):
+        def links(title):
+            return [f'{title}_{i}_{i * 7919 % 1009}' for i in range(50)]
+
+        cache = t.LinkCache(self.path)
+        cache.put('A', links('A'))
+        entry = cache.size
+        cache.close()
+        os.unlink(self.path)
+        cache = t.LinkCache(self.path, max_bytes=int(entry * 3.5))
+        now = time.time()
+        for i, title in enumerate('ABC'):
+            with mock.patch.object(t.time, 'time', return_value=now + i):
+                cache.put(title, links(title))
+        with mock.patch.object(t.time, 'time', return_value=now + 3):
+            cache.get('A')
+        with mock.patch.object(t.time, 'time', return_value=now + 4):
+            cache.put('D', links('D'))
+        self.assertLessEqual(cache.size, cache.max_bytes)
+        self.assertEqual(cache.evicted, 1)
+        self.assertIsNone(cache.get('B'))
+        for title in 'ACD':
+            self.assertEqual(cache.get(title), links(title))
+        cache.close()
+
+
+class TestLinkIndex(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def _build(self, graph, name='dump.xml', redirects=None):
+        dump = os.path.join(self._tmp.name, name)
+        write_dump(graph, dump, redirects)
+        path = os.path.join(self._tmp.name, name + '.index')
+        self.assertEqual(t.build_index(dump, path), len(graph))
+        index = t.LinkIndex(path)
+        self.addCleanup(index.close)
+        return index
+
+    def test_extract_wikilinks(self):
+        self.assertCountEqual(t.extract_wikilinks(
+            "[[Link one]] [[link_one|x]] [[C:x]] [[#qq]] [[Link#tt]] "
+            "[[en:Link]] [[Файл:a.png|мини|[[Внутри]]]] [[ 1946  год ]]ом"
+            "[[Категория:Статьи]] [[]] [[Ёж|ежи]]"),
+            ['Link_one', 'Внутри', '1946_год', 'Ёж'])
+
+    def test_index(self):
+        graph = {'A': ['B', 'C'], 'B': ['A', 'B'], 'C': [], 'Ёж': ['A']}
+        index = self._build(graph, redirects={'Бэ': 'B', 'Вэ': 'Бэ'})
+        self.assertEqual(len(index), 4)
+        self.assertEqual([index.title(i) for i in range(4)],
+                         ['A', 'B', 'C', 'Ёж'])
+        self.assertEqual(index.id('Ёж'), 3)
+        # Redirects, chained ones too, resolve to their articles.
+        self.assertEqual(index.id('Бэ'), 1)
+        self.assertEqual(index.id('Вэ'), 1)
+        self.assertIsNone(index.id('D'))
+        # Self-links are dropped.
+        self.assertEqual(list(index.links(index.id('B'))), [0])
+        self.assertEqual(list(index.links(index.id('C'))), [])
+        self.assertEqual(t.find_chain('Ёж', 'C', index=index),
+                         ['Ёж', 'A', 'C'])
+        self.assertIsNone(t.find_chain('C', 'A', index=index))
+        self.assertIsNone(t.find_chain('A', 'D', index=index))
+
+    def test_find_chain_titles(self):
+        graph = {'Самолёт': ['Крыло'], 'Крыло': ['Математика'],
+                 'Математика': []}
+        index = self._build(graph, redirects={'Самолет': 'Самолёт'})
+        for start, finish in (('Самолет', 'Математика'),
+                              ('самолёт', 'математика'),
+                              (' Самолет ', 'Математика')):
+            with self.subTest(start=start, finish=finish):
+                self.assertEqual(t.find_chain(start, finish, index=index),
+                                 ['Самолёт', 'Крыло', 'Математика'])
+
+    def test_redirects(self):
+        graph = {'A': ['Бэ'], 'B': ['Вэ'], 'C': ['A']}
+        index = self._build(graph, redirects={'Бэ': 'B', 'Вэ': 'Бэ'})
+        self.assertEqual(list(index.links(index.id('A'))), [index.id('B')])
+        self.assertEqual(list(index.links(index.id('B'))), [])
+
+    def test_backlinks(self):
+        graph = {'A': ['B', 'C'], 'B': ['A', 'C'], 'C': [], 'D': ['C']}
+        index = self._build(graph)
+        for title in graph:
+            with self.subTest(title):
+                self.assertEqual(
+                    [index.title(i) for i in index.backlinks(index.id(title))],
+                    sorted(name for name, links in graph.items()
+                           if title in links))
+
+    def assertIsChain(self, graph, chain, start, finish):
+        self.assertEqual((chain[0], chain[-1]), (start, finish))
+        for name, link in zip(chain, chain[1:]):
+            self.assertIn(link, graph[name])
+
+    def test_bidirectional(self):
+        graph = {'A': ['B', 'C'], 'B': ['D'], 'C': ['D', 'E'], 'D': ['F'],
+                 'E': ['F'], 'F': ['A'], 'G': []}
+        index = self._build(graph)
+        for start, finish, length in (('A', 'F', 3), ('A', 'E', 2),
+                                      ('F', 'A', 1), ('A', 'A', 4),
+                                      ('G', 'A', None), ('A', 'G', None),
+                                      ('A', 'Нет_такой', None)):
+            with self.subTest(start=start, finish=finish):
+                chain = t.find_chain(start, finish, index=index,
+                                     bidirectional=True)
+                if length is None:
+                    self.assertIsNone(chain)
+                else:
+                    self.assertIsChain(graph, chain, start, finish)
+                    self.assertEqual(len(chain) - 1, length)
+
+    def test_bidirectional_shortest(self):
+        for graph in (synthetic_graph(300, 2, seed=5),
+                      scale_free_graph(2000, 2, seed=5)):
+            index = self._build(graph)
+            titles = list(graph)
+            expanded = [0, 0]
+            for i in range(0, len(titles), len(titles) // 25):
+                start, finish = titles[i], titles[-1 - i // 3]
+                with self.subTest(start=start, finish=finish):
+                    plain = index.find_chain(start, finish)
+                    expanded[0] += index.expanded
+                    chain = index.find_chain(start, finish, True)
+                    expanded[1] += index.expanded
+                    self.assertEqual(len(chain or ()), len(plain or ()))
+                    if chain is not None:
+                        self.assertIsChain(graph, chain, start, finish)
+            self.assertLess(expanded[1], expanded[0])
+
+    def test_same_chains_as_live(self):
+        graph = synthetic_graph(300, 3, seed=4)
+        index = self._build(graph, 'dump.xml.bz2')
+        with WikiStub(graph) as stub, mock.patch.object(t, 'WIKI', stub.url):
+            for i in range(1, 300, 37):
+                finish = f'Статья_{i}'
+                with self.subTest(finish):
+                    self.assertEqual(
+                        t.find_chain('Статья_0', finish, index=index),
+                        t.find_chain('Статья_0', finish))
+
+
 def make_suite():
     suite = unittest.TestSuite()
-    for test in (TestLinksExtractor, TestChainFinder):
+    for test in (TestLinksExtractor, TestChainFinder, TestParallelChain,
+                 TestLinkCache, TestLinkIndex):
         suite.addTests(unittest.defaultTestLoader.loadTestsFromTestCase(test))
     return suite
 
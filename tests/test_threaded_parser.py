@@ -0,0 +1,598 @@
+#!/usr/bin/env python3
+
+import contextlib
+import io
+import os
+import signal
+import tempfile
+import time
+import tracemalloc
+import unittest
+from unittest import mock
+
+import threaded_parser as t
+import habr_stub
+from habr_stub import HabrStub
+
+
+class TestScraper(unittest.TestCase):
+    def setUp(self):
+        self._cwd = os.getcwd()
+        self._tmp = tempfile.TemporaryDirectory()
+        self.out_dir = os.path.join(self._tmp.name, 'out')
+
+    def tearDown(self):
+        os.chdir(self._cwd)
+        self._tmp.cleanup()
+
+    def _run(self, stub, threads, articles=None, out_dir=None,
+             engine='threads', **kwargs):
+        run = t.run_scraper_async if engine == 'asyncio' else t.run_scraper
+        with mock.patch.object(t, 'HABR', stub.url):
+            start = time.perf_counter()
+            run(threads, articles or stub.articles,
+                out_dir or self.out_dir, **kwargs)
+            return time.perf_counter() - start
+
+    def assertDownloaded(self, stub, articles=None, out_dir=None):
+        for i in range(articles or stub.articles):
+            for j in range(stub.images):
+                path = os.path.join(out_dir or self.out_dir,
+                                    f'Article {i}', f'{j}.png')
+                with open(path, 'rb') as f:
+                    self.assertEqual(f.read(), stub.image(i, j))
+
+    def test_download(self):
+        with HabrStub(articles=3, images=4) as stub:
+            self._run(stub, 4)
+        self.assertDownloaded(stub)
+
+    def test_articles_limit(self):
+        with HabrStub(articles=5, images=1) as stub:
+            self._run(stub, 2, articles=2)
+        self.assertDownloaded(stub, articles=2)
+        self.assertFalse(os.path.exists(
+            os.path.join(self.out_dir, 'Article 2')))
+
+    def test_concurrency(self):
+        with HabrStub(articles=4, images=6, delay=0.05) as stub:
+            serial = self._run(stub, 1)
+            parallel = self._run(stub, 8,
+                                 out_dir=os.path.join(self._tmp.name, 'p'))
+        self.assertDownloaded(stub, out_dir=os.path.join(self._tmp.name, 'p'))
+        self.assertLess(parallel * 3, serial)
+
+    def test_connection_reuse(self):
+        with HabrStub(articles=3, images=4) as stub:
+            self._run(stub, 4, per_host=2)
+        self.assertDownloaded(stub)
+        self.assertEqual(len(stub.requests), 1 + 3 + 3 * 4)
+        self.assertLessEqual(stub.connections, 2)
+
+    def test_stale_connection_retry(self):
+        pool = t.ConnectionPool()
+        with HabrStub(keep_alive=False) as stub:
+            for j in range(3):
+                self.assertEqual(pool.get(f'{stub.url}/images/0/{j}.png'),
+                                 stub.image(0, j))
+        self.assertEqual(stub.connections, 3)
+        self.assertEqual(pool.reused, 2)
+        self.assertEqual(pool.opened, 3)
+
+    def test_idle_eviction(self):
+        pool = t.ConnectionPool(idle_timeout=0)
+        with HabrStub() as stub:
+            for j in range(3):
+                pool.get(f'{stub.url}/images/0/{j}.png')
+        self.assertEqual((pool.opened, pool.reused), (3, 0))
+        self.assertEqual(stub.connections, 3)
+
+    def test_http_errors(self):
+        pool = t.ConnectionPool()
+        with HabrStub() as stub:
+            self.assertIsNone(pool.get(f'{stub.url}/nope'))
+            self.assertIsNotNone(pool.get(f'{stub.url}/articles/0/'))
+        self.assertIsNone(pool.get('http://127.0.0.1:1/'))
+
+    def test_response_cache(self):
+        for engine in 'threads', 'asyncio':
+            with self.subTest(engine=engine), \
+                    HabrStub(articles=2, images=3) as stub:
+                out_dir = os.path.join(self._tmp.name, engine)
+                self._run(stub, 4, out_dir=out_dir, engine=engine)
+                del stub.requests[:]
+                stub.images = 4
+                self._run(stub, 4, out_dir=out_dir, engine=engine)
+                self.assertDownloaded(stub, out_dir=out_dir)
+                # The front page is unchanged, the articles got a new image;
+                # the old images are not requested again.
+                self.assertEqual(stub.not_modified, 1)
+                self.assertCountEqual(
+                    stub.requests,
+                    ['/', '/articles/0/', '/articles/1/',
+                     '/images/0/3.png', '/images/1/3.png'])
+
+    def test_asyncio_cache_io(self):
+        threads = []
+
+        def track(method):
+            def wrapper(*args):
+                threads.append(t.threading.current_thread())
+                return method(*args)
+            return wrapper
+
+        methods = {name: track(getattr(t.ResponseCache, name))
+                   for name in ('hit', 'hit_blob', 'store', 'validators')}
+        with HabrStub(articles=2, images=2) as stub, \
+                mock.patch.multiple(t.ResponseCache, **methods):
+            self._run(stub, 4, engine='asyncio')
+            self._run(stub, 4, engine='asyncio')
+        self.assertDownloaded(stub)
+        self.assertGreater(len(threads), 10)
+        # The event loop runs in the main thread.
+        self.assertNotIn(t.threading.main_thread(), threads)
+
+    def test_standalone_download(self):
+        async def download_async(stub):
+            client = t.AsyncHttpClient(4, 4)
+            with t.ThreadPoolExecutor(2) as executor:
+                await t.download_images_async(client, executor, 'Article 0',
+                                              '/articles/0/')
+                await t.download_image_async(
+                    client, executor, f'{stub.url}/images/1/0.png',
+                    'Article 1')
+
+        # Outside of run_scraper there is no journal and no image store.
+        for engine in 'threads', 'asyncio':
+            out_dir = os.path.join(self._tmp.name, engine)
+            with self.subTest(engine=engine), \
+                    HabrStub(articles=2, images=3) as stub, \
+                    mock.patch.object(t, 'HABR', stub.url):
+                os.makedirs(os.path.join(out_dir, 'Article 1'))
+                os.chdir(out_dir)
+                if engine == 'asyncio':
+                    t.asyncio.run(download_async(stub))
+                else:
+                    t.download_images('Article 0', '/articles/0/')
+                    t.download_image(f'{stub.url}/images/1/0.png',
+                                     'Article 1')
+                self.assertDownloaded(stub, articles=1, out_dir=out_dir)
+                self.assertEqual(
+                    os.listdir(os.path.join(out_dir, 'Article 1')),
+                    ['0.png'])
+
+    def test_no_cache(self):
+        with HabrStub(articles=1, images=2) as stub:
+            self._run(stub, 2, cache=False)
+            self._run(stub, 2, cache=False)
+        self.assertEqual(len(stub.requests), 2 * (1 + 1 + 2))
+        self.assertFalse(os.path.exists(
+            os.path.join(self.out_dir, t.CACHE_DIR)))
+
+    def test_broken_body(self):
+        # E.g. the TLS session is cut mid-body: an OSError, not a
+        # ConnectionError.
+        error = mock.Mock(side_effect=t.ssl.SSLEOFError('EOF'))
+        with HabrStub(articles=1, images=1) as stub, \
+                mock.patch.multiple(t.http.client.HTTPResponse,
+                                    read=error, read1=error):
+            self._run(stub, 2)
+            path = os.path.join(self._tmp.name, '0.png')
+            self.assertIsNone(t.fetch_image(f'{stub.url}/images/0/0.png',
+                                            path=path))
+        self.assertFalse(os.path.exists(path))
+        self.assertEqual(stub.requests, ['/', '/images/0/0.png'])
+
+    def test_relative_out_dir(self):
+        for engine in 'threads', 'asyncio':
+            for cache in True, False:
+                with self.subTest(engine=engine, cache=cache), \
+                        HabrStub(articles=2, images=2) as stub:
+                    os.chdir(self._tmp.name)
+                    out_dir = f'{engine}-{cache}'
+                    self._run(stub, 2, out_dir=out_dir, engine=engine,
+                              cache=cache)
+                    self.assertDownloaded(stub, out_dir=os.path.join(
+                        self._tmp.name, out_dir))
+
+    def test_streaming_memory(self):
+        size = 2 * 1024 * 1024
+        peaks = {}
+        with habr_stub.spawn(articles=2, images=8, image_size=size) as url, \
+                mock.patch.object(t, 'HABR', url):
+            for threads in 1, 16:
+                out_dir = os.path.join(self._tmp.name, str(threads))
+                tracemalloc.start()
+                try:
+                    t.run_scraper(threads, 2, out_dir, cache=False)
+                    peaks[threads] = tracemalloc.get_traced_memory()[1]
+                finally:
+                    tracemalloc.stop()
+                for i in range(2):
+                    for j in range(8):
+                        self.assertEqual(os.path.getsize(os.path.join(
+                            out_dir, f'Article {i}', f'{j}.png')), size)
+        # Buffered downloads would hold up to 16 whole images at once.
+        self.assertLess(peaks[16], size)
+        self.assertLess(peaks[16], peaks[1] + 16 * 2 * t.CHUNK_SIZE)
+
+    def test_max_size(self):
+        for engine in 'threads', 'asyncio':
+            with self.subTest(engine=engine), \
+                    HabrStub(articles=2, images=2, image_size=4096) as stub:
+                out_dir = os.path.join(self._tmp.name, engine)
+                self._run(stub, 2, out_dir=out_dir, engine=engine,
+                          cache=False, max_size=4095)
+                for i in range(2):
+                    self.assertEqual(
+                        os.listdir(os.path.join(out_dir, f'Article {i}')), [])
+                self._run(stub, 2, out_dir=out_dir, engine=engine,
+                          cache=False, max_size=4096)
+                self.assertDownloaded(stub, out_dir=out_dir)
+                for i in range(2):
+                    self.assertEqual(len(os.listdir(
+                        os.path.join(out_dir, f'Article {i}'))), 2)
+
+    def test_dedup(self):
+        for engine in 'threads', 'asyncio':
+            for cache in True, False:
+                with self.subTest(engine=engine, cache=cache), \
+                        HabrStub(articles=4, images=1, shared=2,
+                                 copies=2) as stub:
+                    out_dir = os.path.join(self._tmp.name, f'{engine}{cache}')
+                    output = io.StringIO()
+                    with contextlib.redirect_stdout(output):
+                        self._run(stub, 4, out_dir=out_dir, engine=engine,
+                                  cache=cache)
+                    self.assertDownloaded(stub, out_dir=out_dir)
+                    for k in range(2):
+                        self.assertEqual(
+                            stub.requests.count(f'/shared/logo{k}.png'), 1)
+                    for name, content in [
+                            ('logo0.png', stub.image('shared', 0)),
+                            ('copy1.png', stub.image('copy', 1))]:
+                        stats = []
+                        for i in range(4):
+                            path = os.path.join(out_dir, f'Article {i}', name)
+                            with open(path, 'rb') as f:
+                                self.assertEqual(f.read(), content)
+                            stats.append(os.stat(path))
+                        self.assertEqual(len({st.st_ino for st in stats}), 1)
+                    self.assertIn(
+                        f'Dedup: 6 repeated image URLs ({6 * 1024} bytes not '
+                        f'downloaded), 6 duplicate images ({6 * 1024} bytes '
+                        f'not stored)', output.getvalue())
+                    self.assertCountEqual(
+                        os.listdir(out_dir),
+                        [f'Article {i}' for i in range(4)]
+                        + [t.JOURNAL_FILE] + [t.CACHE_DIR] * cache)
+
+    def test_resume(self):
+        download_image = t.download_image
+        downloaded = []
+
+        def interrupt_after_five(ref, folder, max_size):
+            download_image(ref, folder, max_size)
+            downloaded.append(ref)
+            if len(downloaded) == 5:
+                os.kill(os.getpid(), signal.SIGINT)
+
+        with HabrStub(articles=3, images=4) as stub:
+            with mock.patch.object(t, 'download_image', interrupt_after_five):
+                self._run(stub, 1, cache=False)
+            self.assertLess(len(downloaded), 12)
+            del stub.requests[:]
+            self._run(stub, 2, cache=False, resume=True)
+            self.assertDownloaded(stub)
+            self.assertFalse(
+                set(stub.requests) & {ref[len(stub.url):]
+                                      for ref in downloaded})
+            self.assertNotIn('/', stub.requests)
+            # A finished crawl leaves nothing to resume.
+            del stub.requests[:]
+            self._run(stub, 2, cache=False, resume=True)
+            self.assertEqual(stub.requests, ['/'])
+
+    def test_journal(self):
+        path = os.path.join(self._tmp.name, 'journal')
+        journal = t.Journal(path, batch=2, interval=60)
+        journal.queue('image', 'a', 'A')
+        self.assertEqual(os.path.getsize(path), 0)
+        journal.queue('image', 'b', 'A')
+        journal.start('image', 'a', 'A')
+        journal.done('image', 'a', 'A')
+        journal.queue('image', 'c', 'A')
+        # Crash: the unflushed record is lost, and a torn line is ignored.
+        journal.file.close()
+        with open(path, 'a') as f:
+            f.write('["done", "ima')
+        journal = t.Journal(path, resume=True)
+        self.assertTrue(journal.is_done('image', 'a', 'A'))
+        self.assertEqual(journal.pending(), [('image', 'b', 'A')])
+        journal.close()
+        with open(path) as f:
+            self.assertEqual(len(f.readlines()), 2)
+
+    def test_adaptive_goodput(self):
+        # The server alternates between 4 and 24 requests at once and
+        # rejects the excess: no fixed thread count suits both phases.
+        def goodput(threads, **kwargs):
+            with HabrStub(articles=12, images=25, delay=0.02,
+                          capacity=[(1, 4), (1, 24)]) as stub:
+                out_dir = os.path.join(self._tmp.name, f'{threads}{kwargs}')
+                with contextlib.redirect_stdout(io.StringIO()):
+                    elapsed = self._run(stub, threads, out_dir=out_dir,
+                                        per_host=64, cache=False, **kwargs)
+            downloaded = sum(
+                len(os.listdir(os.path.join(out_dir, name)))
+                for name in os.listdir(out_dir) if name.startswith('Art'))
+            return downloaded, downloaded / elapsed
+
+        downloaded, adaptive = goodput(64, adaptive=True)
+        self.assertEqual(downloaded, 12 * 25)
+        for threads in 4, 8, 16, 32:
+            with self.subTest(threads=threads):
+                self.assertGreater(adaptive, goodput(threads)[1])
+
+    def test_adaptive_limit(self):
+        limit = t.AdaptiveLimit(1, 8)
+        for _ in range(3):
+            limit.release(limit.acquire(), 0.01)
+        self.assertEqual(limit.limit, 4)
+        started = limit.acquire()
+        limit.release(started, overloaded=True)
+        self.assertEqual(limit.limit, 2)
+        # Overloads of requests sent before the decrease count once.
+        limit.release(started, overloaded=True)
+        self.assertEqual(limit.limit, 2)
+        for _ in range(2):
+            limit.release(limit.acquire(), 0.01)
+        self.assertEqual(limit.limit, 4)
+        # Latency blow-up stops the growth.
+        limit.release(limit.acquire(), 0.1)
+        self.assertEqual(limit.limit, 4)
+        for _ in range(10):
+            limit.release(limit.acquire(), 0.01)
+        self.assertEqual(limit.limit, 8)
+
+    def test_retry(self):
+        with HabrStub(capacity=[(60, 0)]) as stub:
+            pool = t.ConnectionPool(retries=2, backoff=0.01)
+            self.assertIsNone(pool.get(f'{stub.url}/images/0/0.png'))
+            self.assertEqual(stub.throttled, 3)
+            stub.capacity = [(0.1, 0), (60, 1)]
+            stub.started = time.monotonic()
+            pool = t.ConnectionPool(retries=10, backoff=0.05)
+            self.assertEqual(pool.get(f'{stub.url}/images/0/0.png'),
+                             stub.image(0, 0))
+
+    def test_rate_limit(self):
+        with HabrStub(articles=1, images=10) as stub:
+            elapsed = self._run(stub, 10, cache=False, rate=50)
+        self.assertDownloaded(stub)
+        # 12 requests at 50 per second, the first one free.
+        self.assertGreater(elapsed, 11 / 50)
+
+    def test_streaming_extraction(self):
+        with HabrStub(articles=2, images=3, stall=0.3) as stub:
+            self._run(stub, 4)
+        self.assertDownloaded(stub)
+        # Articles and images are requested while their page still loads.
+        page_sent = stub.timings['/'][1]
+        for i in range(stub.articles):
+            article = stub.timings[f'/articles/{i}/']
+            self.assertLess(article[0], page_sent)
+            for j in range(stub.images):
+                self.assertLess(stub.timings[f'/images/{i}/{j}.png'][0],
+                                article[1])
+
+    def test_streaming_single_connection(self):
+        # Pages are streamed holding the only connection to the host while
+        # their links overflow the job queue.
+        with HabrStub(articles=12, images=6) as stub:
+            self._run(stub, 2, per_host=1)
+        self.assertDownloaded(stub)
+
+    def test_stats(self):
+        report = os.path.join(self._tmp.name, 'stats.json')
+        for engine in ('threads', 'asyncio'):
+            with self.subTest(engine=engine):
+                output = io.StringIO()
+                with HabrStub(articles=2, images=3) as stub, \
+                        contextlib.redirect_stdout(output):
+                    self._run(stub, 4, engine=engine,
+                              out_dir=os.path.join(self.out_dir, engine),
+                              cache=False, report=report)
+                self.assertIsNone(t.STATS)
+                with open(report) as f:
+                    totals = t.json.load(f)
+                self.assertEqual(totals['requests'], 1 + 2 + 2 * 3)
+                self.assertEqual(totals['bytes'], len(stub.front_page())
+                                 + sum(len(stub.article(i)) for i in range(2))
+                                 + 2 * 3 * stub.image_size)
+                self.assertEqual(set(totals['stages']), set(t.Stats.STAGES))
+                stages = totals['stages']
+                for stage in ('ttfb', 'body'):
+                    self.assertEqual(stages[stage]['count'], 9)
+                self.assertEqual(stages['parse']['count'], 3)
+                self.assertEqual(stages['write']['count'], 6)
+                self.assertGreaterEqual(stages['connect']['count'], 1)
+                for values in stages.values():
+                    self.assertLessEqual(values['p50'], values['p99'])
+                    self.assertLessEqual(values['p99'], values['max'])
+                lines = [line.split()
+                         for line in output.getvalue().splitlines()
+                         if line.startswith('stats ')]
+                self.assertEqual(len(lines), 1 + len(t.Stats.STAGES))
+                self.assertTrue(all('=' in field for line in lines
+                                    for field in line[1:]))
+
+        output = io.StringIO()
+        with HabrStub(articles=1, images=1) as stub, \
+                contextlib.redirect_stdout(output):
+            self._run(stub, 2, cache=False)
+        self.assertNotIn('stats', output.getvalue())
+
+    def test_histogram(self):
+        histogram = t.Histogram()
+        for i in range(1, 1001):
+            histogram.record(i / 1000)
+        self.assertEqual(histogram.count, 1000)
+        for q in t.Stats.PERCENTILES:
+            self.assertAlmostEqual(histogram.percentile(q), q / 100,
+                                   delta=q / 100 * 0.07)
+        merged = t.Histogram()
+        merged.merge(histogram)
+        merged.merge(histogram)
+        self.assertEqual(merged.count, 2000)
+        self.assertEqual(merged.percentile(50), histogram.percentile(50))
+        self.assertEqual(t.Histogram().percentile(99), 0.0)
+
+    def test_asyncio_engine(self):
+        with HabrStub(articles=4, images=6, delay=0.05) as stub:
+            serial = self._run(stub, 1, engine='asyncio')
+            parallel = self._run(stub, 8, engine='asyncio', per_host=8,
+                                 out_dir=os.path.join(self._tmp.name, 'p'))
+        self.assertDownloaded(stub)
+        self.assertDownloaded(stub, out_dir=os.path.join(self._tmp.name, 'p'))
+        self.assertLess(parallel * 3, serial)
+
+    def test_asyncio_http_client(self):
+        async def fetch(*urls):
+            client = t.AsyncHttpClient(2, 1)
+            return await t.asyncio.gather(*map(client.get, urls))
+
+        with HabrStub(articles=1, images=1) as stub:
+            image, missing = t.asyncio.run(
+                fetch(f'{stub.url}/images/0/0.png', f'{stub.url}/nope'))
+        self.assertEqual(image, stub.image(0, 0))
+        self.assertIsNone(missing)
+
+    def test_asyncio_bad_responses(self):
+        for reply in b'', b'garbage\r\n\r\n', b'HTTP/1.1 OK\r\n\r\n':
+            with self.subTest(reply=reply), \
+                    t.socket.create_server(('127.0.0.1', 0)) as server:
+                def serve():
+                    # Stops once the server is closed or stays idle.
+                    server.settimeout(5)
+                    with contextlib.suppress(OSError):
+                        while True:
+                            connection, _ = server.accept()
+                            with connection:
+                                connection.recv(65536)
+                                connection.sendall(reply)
+
+                t.threading.Thread(target=serve, daemon=True).start()
+                url = f'http://127.0.0.1:{server.getsockname()[1]}/'
+                client = t.AsyncHttpClient(1, 1)
+                self.assertIsNone(t.asyncio.run(client.get(url)))
+                self.assertIsNone(t.ConnectionPool(retries=0).get(url))
+
+    def test_failing_job(self):
+        link = t.BlobStore.link
+
+        def fail_first(self, digest, path):
+            if path.endswith('0.png'):
+                raise OSError('no space left')
+            link(self, digest, path)
+
+        for engine in 'threads', 'asyncio':
+            with self.subTest(engine=engine), \
+                    HabrStub(articles=2, images=3) as stub, \
+                    mock.patch.object(t.BlobStore, 'link', fail_first), \
+                    contextlib.redirect_stderr(io.StringIO()) as stderr:
+                out_dir = os.path.join(self._tmp.name, engine)
+                self._run(stub, 2, out_dir=out_dir, engine=engine)
+                # The other images of the articles are still downloaded.
+                for i in range(2):
+                    self.assertCountEqual(
+                        os.listdir(os.path.join(out_dir, f'Article {i}')),
+                        ['1.png', '2.png'])
+                self.assertEqual(stderr.getvalue().count('no space left'), 2)
+
+    def test_asyncio_read_timeout(self):
+        body = b'x' * (4 * t.CHUNK_SIZE)
+        for pause, expected in (0.05, body), (0.5, None):
+            with self.subTest(pause=pause), \
+                    t.socket.create_server(('127.0.0.1', 0)) as server:
+                def serve():
+                    with contextlib.suppress(OSError):
+                        connection, _ = server.accept()
+                        with connection:
+                            connection.recv(65536)
+                            connection.sendall(
+                                b'HTTP/1.1 200 OK\r\nContent-Length: '
+                                b'%d\r\n\r\n' % len(body))
+                            for i in range(0, len(body), t.CHUNK_SIZE):
+                                time.sleep(pause)
+                                connection.sendall(
+                                    body[i:i + t.CHUNK_SIZE])
+
+                t.threading.Thread(target=serve, daemon=True).start()
+                url = f'http://127.0.0.1:{server.getsockname()[1]}/'
+                # The whole body takes longer than the timeout to arrive,
+                # each chunk only if the server pauses for longer.
+                client = t.AsyncHttpClient(1, 1, timeout=0.15)
+                self.assertEqual(t.asyncio.run(client.get(url)), expected)
+
+    def test_worker_pool_backpressure(self):
+        event = t.threading.Event()
+        pool = t.WorkerPool(2, event, queue_size=1)
+        done = []
+
+        def article(i):
+            for j in range(5):
+                pool.submit(done.append, (i, j))
+
+        for i in range(10):
+            pool.submit(article, i)
+        pool.join()
+        self.assertEqual(len(done), 50)
+
+
+class TestPageScanner(unittest.TestCase):
+    ARTICLE = (
+        b'<html><body><img src="/logo.png">'
+        b'<div id="post-content-body"><div class=\'x\'>'
+        b'<IMG alt="a > b" SRC="https://x.org/1.png?a=1&amp;b=2">'
+        b'</div><img src=/2.png><figure><img\nsrc=\'/3.png\'></figure>'
+        b'<img alt="a<b" src="/5.png"></div>'
+        b'<div>comments<img src="/4.png"></div></body></html>')
+    FRONT = (
+        b'<h2 class="title"><a href="/articles/1/" class="link">'
+        b'<span>Caf\xc3\xa9 &amp; <em>code</em></span></a></h2>'
+        b'<h2>No link</h2>'
+        b'<h2><a href="/articles/3/"><span>Unclosed</a></h2>'
+        b'<h2><a href="/articles/4/"><span> <em></em></span></a></h2>'
+        b'<h2><a href=\'/articles/2/\'><span>Second</span></a></h2>')
+
+    def scan(self, content, size):
+        articles, images = [], []
+        scanner = t.PageScanner(
+            lambda *article: articles.append(article), images.append)
+        for i in range(0, len(content), size):
+            scanner.feed(content[i:i + size])
+        scanner.close()
+        return articles, images
+
+    def test_chunking(self):
+        for size in (1, 2, 3, 7, 64, len(self.ARTICLE)):
+            with self.subTest(size=size):
+                self.assertEqual(self.scan(self.ARTICLE, size), ([], [
+                    'https://x.org/1.png?a=1&b=2', '/2.png', '/3.png',
+                    '/5.png']))
+                self.assertEqual(self.scan(self.FRONT, size), ([
+                    ('Café & code', '/articles/1/'),
+                    ('Second', '/articles/2/')], []))
+
+    def test_extract(self):
+        with HabrStub(articles=3, images=2, shared=1) as stub:
+            self.assertEqual(t.extract_articles(stub.front_page(), 2), [
+                ('Article 0', '/articles/0/'), ('Article 1', '/articles/1/')])
+            self.assertEqual(t.extract_images(stub.article(1)), [
+                f'{stub.url}/images/1/0.png', f'{stub.url}/images/1/1.png',
+                f'{stub.url}/shared/logo0.png'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,500 @@
+#!/usr/bin/env python3
+
+import gzip
+import hashlib
+import io
+import os
+import shutil
+import subprocess
+import tarfile
+import tempfile
+import unittest
+from unittest import mock
+
+import untar_stripped as t
+
+
+def _add_file(tar, name, data, mode=0o644, mtime=1396050765):
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    info.mode = mode
+    info.mtime = mtime
+    tar.addfile(info, io.BytesIO(data))
+
+
+def _add_dir(tar, name, mode=0o755, mtime=1396050765):
+    info = tarfile.TarInfo(name)
+    info.type = tarfile.DIRTYPE
+    info.mode = mode
+    info.mtime = mtime
+    tar.addfile(info)
+
+
+class TestTarParser(unittest.TestCase):
+    FILES = {
+        'dir/a.txt': b'hello\n',
+        'dir/b.bin': bytes(range(256)) * 9,
+        'empty': b'',
+    }
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.tmp = self._tmp.name
+        self.archive = os.path.join(self.tmp, 'test.tar')
+        with tarfile.open(self.archive, 'w', format=tarfile.USTAR_FORMAT) \
+                as tar:
+            _add_dir(tar, 'dir')
+            for name, data in self.FILES.items():
+                _add_file(tar, name, data)
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def test_files(self):
+        tar = t.TarParser(self.archive)
+        self.assertSetEqual(set(tar.files()), {'dir/', *self.FILES})
+
+    def test_file_stat(self):
+        stat = dict(t.TarParser(self.archive).file_stat('dir/b.bin'))
+        self.assertEqual(stat['Type'], 'Regular file')
+        self.assertEqual(stat['Size'], len(self.FILES['dir/b.bin']))
+        self.assertRaises(ValueError,
+                          t.TarParser(self.archive).file_stat, 'missing')
+
+    def test_read_member(self):
+        tar = t.TarParser(self.archive)
+        for name, data in self.FILES.items():
+            self.assertEqual(b''.join(tar.read_member(name, 100)), data)
+
+    def test_open_member(self):
+        data = self.FILES['dir/b.bin']
+        tar = t.TarParser(self.archive)
+        with tar.open_member('dir/b.bin') as member:
+            self.assertIsInstance(member, io.RawIOBase)
+            self.assertEqual(member.read(), data)
+            self.assertEqual(member.read(), b'')
+            member.seek(-10, os.SEEK_END)
+            self.assertEqual(member.read(100), data[-10:])
+            member.seek(1000)
+            buffer = bytearray(16)
+            self.assertEqual(member.readinto(buffer), 16)
+            self.assertEqual(buffer, data[1000:1016])
+        with io.BufferedReader(tar.open_member('dir/a.txt')) as member:
+            self.assertEqual(member.readline(), b'hello\n')
+
+    def test_extract(self):
+        dest = os.path.join(self.tmp, 'out')
+        os.mkdir(dest)
+        t.TarParser(self.archive).extract(dest)
+        for name, data in self.FILES.items():
+            path = os.path.join(dest, name)
+            with open(path, 'rb') as f:
+                self.assertEqual(f.read(), data)
+            self.assertEqual(os.stat(path).st_mode & 0o777, 0o644)
+            self.assertEqual(os.stat(path).st_mtime, 1396050765)
+        self.assertEqual(os.stat(os.path.join(dest, 'dir')).st_mtime,
+                         1396050765)
+
+    def test_parallel_extract(self):
+        archive = os.path.join(self.tmp, 'many.tar')
+        files = {f'd{i % 7}/sub/f{i}': os.urandom(i * 13) for i in range(200)}
+        with tarfile.open(archive, 'w', format=tarfile.USTAR_FORMAT) as tar:
+            for name, data in files.items():
+                _add_file(tar, name, data)
+        tar = t.TarParser(archive)
+        serial = os.path.join(self.tmp, 'serial')
+        parallel = os.path.join(self.tmp, 'parallel')
+        tar.extract(serial)
+        tar.extract(parallel, workers=8)
+        for name, data in files.items():
+            for dest in (serial, parallel):
+                with open(os.path.join(dest, name), 'rb') as f:
+                    self.assertEqual(f.read(), data)
+
+    def test_verify(self):
+        tar = t.TarParser(self.archive)
+        manifest = {item.name: item for item in tar.verify('sha256', 3)}
+        self.assertTrue(all(item.checksum_ok for item in manifest.values()))
+        self.assertIsNone(manifest['dir/'].digest)
+        for name, data in self.FILES.items():
+            self.assertEqual(manifest[name].size, len(data))
+            self.assertEqual(manifest[name].digest,
+                             hashlib.sha256(data).hexdigest())
+        self.assertTrue(all(item.digest is None for item in tar.verify()))
+
+    def test_verify_corrupted(self):
+        offset = t.TarParser(self.archive).get_entry('empty').header_offset
+        with open(self.archive, 'r+b') as f:
+            f.seek(offset + 108)
+            f.write(b'7')
+        manifest = {item.name: item for item in
+                    t.TarParser(self.archive).verify()}
+        self.assertFalse(manifest['empty'].checksum_ok)
+        self.assertTrue(manifest['dir/a.txt'].checksum_ok)
+
+    def test_parse_number(self):
+        self.assertEqual(t.parse_number(b'00000001750\x00'), 0o1750)
+        self.assertEqual(t.parse_number(b'     1750 \x00'), 0o1750)
+        self.assertEqual(t.parse_number(b'\x00' * 12), 0)
+        self.assertEqual(
+            t.parse_number(b'\x80' + (2**40).to_bytes(11, 'big')), 2**40)
+
+    def test_mmap_copy(self):
+        data = self.FILES['dir/b.bin']
+        tar = t.TarParser(self.archive)
+        entry = tar.get_entry('dir/b.bin')
+        path = os.path.join(self.tmp, 'copy')
+        with open(self.archive, 'rb') as src, open(path, 'wb') as dst:
+            t.mmap_copy(src.fileno(), dst.fileno(), entry.data_offset,
+                        entry.size)
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), data)
+
+    def test_large_archive(self):
+        big = os.path.join(self.tmp, 'big.tar')
+        with tarfile.open(big, 'w', format=tarfile.USTAR_FORMAT) as tar:
+            _add_file(tar, 'first', b'\x00' * (17 * 2**20))
+            _add_file(tar, 'last', b'tail')
+        tar = t.TarParser(big)
+        self.assertListEqual(list(tar.files()), ['first', 'last'])
+        self.assertEqual(b''.join(tar.read_member('last')), b'tail')
+
+    def test_index(self):
+        index = os.path.join(self.tmp, 'test.idx')
+        tar = t.TarParser(self.archive, index)
+        self.assertTrue(os.path.exists(index))
+
+        with mock.patch.object(t.TarParser, 'extract_archive_items',
+                               side_effect=AssertionError):
+            reopened = t.TarParser(self.archive, index)
+        self.assertDictEqual(reopened.index, tar.index)
+        self.assertListEqual(reopened.file_stat('dir/a.txt'),
+                             tar.file_stat('dir/a.txt'))
+
+    def test_stale_index(self):
+        index = os.path.join(self.tmp, 'test.idx')
+        t.TarParser(self.archive, index)
+        with tarfile.open(self.archive, 'a') as tar:
+            _add_file(tar, 'new', b'new')
+        tar = t.TarParser(self.archive, index)
+        self.assertIn('new', set(tar.files()))
+        self.assertTrue(tar.load_index(index))
+
+
+class TestExtendedHeaders(unittest.TestCase):
+    LONG_NAME = 'long/' + 'д' * 80 + '/' + 'n' * 120
+    LINK_TARGET = 't' * 150
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.tmp = self._tmp.name
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def _make(self, tar_format):
+        archive = os.path.join(self.tmp, 'test.tar')
+        with tarfile.open(archive, 'w', format=tar_format) as tar:
+            _add_file(tar, self.LONG_NAME, b'long')
+            _add_file(tar, self.LINK_TARGET, b'target')
+            info = tarfile.TarInfo('link')
+            info.type = tarfile.SYMTYPE
+            info.linkname = self.LINK_TARGET
+            tar.addfile(info)
+            _add_file(tar, 'short', b'short')
+        return archive
+
+    def _check(self, archive):
+        tar = t.TarParser(archive)
+        self.assertListEqual(
+            list(tar.files()),
+            [self.LONG_NAME, self.LINK_TARGET, 'link', 'short'])
+        self.assertEqual(b''.join(tar.read_member(self.LONG_NAME)), b'long')
+        self.assertEqual(dict(tar.file_stat(self.LONG_NAME))['Filename'],
+                         self.LONG_NAME)
+        dest = os.path.join(self.tmp, 'out')
+        tar.extract(dest)
+        self.assertEqual(os.readlink(os.path.join(dest, 'link')),
+                         self.LINK_TARGET)
+        with open(os.path.join(dest, 'link'), 'rb') as f:
+            self.assertEqual(f.read(), b'target')
+
+    def test_gnu(self):
+        self._check(self._make(tarfile.GNU_FORMAT))
+
+    def test_pax(self):
+        self._check(self._make(tarfile.PAX_FORMAT))
+
+    def test_pax_records(self):
+        records = t.parse_pax(b'14 path=a/b/c\n13 uid=12345\n'
+                              b'29 GNU.sparse.offset=0000000\n'
+                              b'26 GNU.sparse.numbytes=10\n')
+        self.assertDictEqual(records, {'path': 'a/b/c', 'uid': '12345',
+                                       'GNU.sparse.map': '0000000,10'})
+
+    @unittest.skipUnless(shutil.which('tar'), 'GNU tar is required')
+    def test_sparse(self):
+        source = os.path.join(self.tmp, 'src')
+        os.mkdir(source)
+        size = 8 * 2**20
+        chunks = {0: b'head', 3 * 2**20: b'middle' * 1000,
+                  size - 5: b'tail!'}
+        with open(os.path.join(source, 'sparse'), 'wb') as f:
+            f.truncate(size)
+            for offset, data in chunks.items():
+                f.seek(offset)
+                f.write(data)
+        with open(os.path.join(source, 'sparse'), 'rb') as f:
+            expected = f.read()
+
+        for options in (['--format=gnu'],
+                        ['--format=posix', '--sparse-version=0.0'],
+                        ['--format=posix', '--sparse-version=0.1'],
+                        ['--format=posix', '--sparse-version=1.0']):
+            with self.subTest(options[-1]):
+                archive = os.path.join(self.tmp, 'sparse.tar')
+                subprocess.run(['tar', '-cSf', archive, *options,
+                                '-C', source, 'sparse'], check=True)
+                tar = t.TarParser(archive)
+                self.assertListEqual(list(tar.files()), ['sparse'])
+                self.assertEqual(dict(tar.file_stat('sparse'))['Size'], size)
+                self.assertEqual(b''.join(tar.read_member('sparse')),
+                                 expected)
+                self.assertEqual(tar.verify('sha256')[0].digest,
+                                 hashlib.sha256(expected).hexdigest())
+
+                dest = os.path.join(self.tmp, 'out')
+                tar.extract(dest)
+                path = os.path.join(dest, 'sparse')
+                with open(path, 'rb') as f:
+                    self.assertEqual(f.read(), expected)
+                self.assertLess(os.stat(path).st_blocks * 512, size // 2)
+                shutil.rmtree(dest)
+
+
+class TestCompressedTarParser(unittest.TestCase):
+    FILES = {f'dir/f{i}': os.urandom(i * 3000) for i in range(10)}
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.tmp = self._tmp.name
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def _make(self, compression):
+        archive = os.path.join(self.tmp, f'test.tar.{compression}')
+        with tarfile.open(archive, f'w:{compression}',
+                          format=tarfile.USTAR_FORMAT) as tar:
+            for name, data in self.FILES.items():
+                _add_file(tar, name, data)
+        return archive
+
+    def _check(self, tar):
+        self.assertListEqual(list(tar.files()), list(self.FILES))
+        for name in reversed(self.FILES):
+            self.assertEqual(b''.join(tar.read_member(name)),
+                             self.FILES[name])
+            with tar.open_member(name) as member:
+                member.seek(len(self.FILES[name]) // 2)
+                self.assertEqual(member.read(),
+                                 self.FILES[name][len(self.FILES[name]) // 2:])
+        dest = os.path.join(self.tmp, 'out')
+        tar.extract(dest, workers=4)
+        for name, data in self.FILES.items():
+            with open(os.path.join(dest, name), 'rb') as f:
+                self.assertEqual(f.read(), data)
+
+    def test_compressions(self):
+        for compression in ('gz', 'bz2', 'xz'):
+            with self.subTest(compression):
+                tar = t.TarParser(self._make(compression))
+                self.assertEqual(tar.compression, compression)
+                self._check(tar)
+                shutil.rmtree(os.path.join(self.tmp, 'out'))
+
+    def test_multistream_checkpoints(self):
+        archive = os.path.join(self.tmp, 'multi.tar.gz')
+        with open(self._make('gz'), 'rb') as f:
+            data = gzip.decompress(f.read())
+        with open(archive, 'wb') as f:
+            for pos in range(0, len(data), 8192):
+                f.write(gzip.compress(data[pos:pos + 8192]))
+        index = os.path.join(self.tmp, 'multi.idx')
+        tar = t.TarParser(archive, index)
+        self.assertGreater(len(tar.checkpoints), len(data) // 8192)
+        reopened = t.TarParser(archive, index)
+        self.assertListEqual(reopened.checkpoints, tar.checkpoints)
+        self._check(reopened)
+
+    def test_seek_within_stream(self):
+        archive = self._make('gz')
+        with open(archive, 'rb') as f:
+            data = gzip.decompress(f.read())
+        with t.DecompressedFile(archive, 'gz', span=4096) as f:
+            self.assertEqual(f.read(), data)
+            self.assertGreater(len(f.checkpoints), 1)
+            for offset in (len(data) // 2, 100, len(data) - 10):
+                f.seek(offset)
+                self.assertEqual(f.read(1000), data[offset:offset + 1000])
+
+    def test_single_pass_headers(self):
+        archive = os.path.join(self.tmp, 'many.tar.bz2')
+        with tarfile.open(archive, 'w:bz2') as tar:
+            for i in range(50):
+                _add_dir(tar, f'd{i}', mode=0o700)
+                for j in range(5):
+                    _add_file(tar, f'd{i}/f{j}', os.urandom(2000))
+        tar = t.TarParser(archive)
+        restart = t.DecompressedFile._restart
+        with mock.patch.object(t.DecompressedFile, '_restart',
+                               autospec=True, side_effect=restart) as calls:
+            stats = tar.file_stats()
+            self.assertLessEqual(calls.call_count, 1)
+            calls.reset_mock()
+            dest = os.path.join(self.tmp, 'out')
+            tar.extract(dest)
+            self.assertLessEqual(calls.call_count, 3)
+        self.assertListEqual(sorted(stats), sorted(tar.files()))
+        self.assertListEqual(stats['d7/f3'], tar.file_stat('d7/f3'))
+        self.assertEqual(os.stat(os.path.join(dest, 'd7')).st_mode & 0o777,
+                         0o700)
+
+    def test_magic_like_name(self):
+        archive = os.path.join(self.tmp, 'plain.tar')
+        for name in ('BZh9_notes.txt', 'BZh91AY&Sx', '\x1f\x8bgz'):
+            with self.subTest(name):
+                with tarfile.open(archive, 'w') as tar:
+                    _add_file(tar, name, b'not compressed')
+                tar = t.TarParser(archive)
+                self.assertIsNone(tar.compression)
+                self.assertEqual(b''.join(tar.read_member(name)),
+                                 b'not compressed')
+
+    def test_unsupported(self):
+        archive = os.path.join(self.tmp, 'test.tar.zst')
+        with open(archive, 'wb') as f:
+            f.write(b'\x28\xb5\x2f\xfd' + bytes(512))
+        self.assertRaises(ValueError, t.TarParser, archive)
+
+
+class TestTarWriter(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.tmp = self._tmp.name
+        self.files = {
+            'dir/small': b'small',
+            'dir/random': os.urandom(300000),
+            'dir/' + 'д' * 70 + '/' + 'long' * 40: b'long name',
+            'd' * 120 + '/prefixed': b'prefixed',
+        }
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def _write(self, archive, **kwargs):
+        source = os.path.join(self.tmp, 'source')
+        with open(source, 'wb') as f:
+            f.write(self.files['dir/random'])
+        with t.TarWriter(archive, **kwargs) as writer:
+            writer.add_directory('dir', mtime=1396050765)
+            writer.add('dir/small', self.files['dir/small'], mode=0o600)
+            with open(source, 'rb') as f:
+                writer.add('dir/random', f)
+            for name in list(self.files)[2:]:
+                writer.add(name, iter([self.files[name][:4],
+                                       self.files[name][4:]]))
+            writer.add_symlink('link', 'dir/small')
+
+    def _check(self, archive):
+        tar = t.TarParser(archive)
+        self.assertListEqual(list(tar.files()),
+                             ['dir/', *self.files, 'link'])
+        for name, data in self.files.items():
+            self.assertEqual(b''.join(tar.read_member(name)), data)
+        self.assertTrue(all(item.checksum_ok for item in tar.verify()))
+        self.assertEqual(dict(tar.file_stat('dir/small'))['Mode'], '0000600')
+
+        with tarfile.open(archive) as tar:
+            self.assertListEqual(tar.getnames(),
+                                 ['dir', *self.files, 'link'])
+            for name, data in self.files.items():
+                self.assertEqual(tar.extractfile(name).read(), data)
+            self.assertEqual(tar.getmember('link').linkname, 'dir/small')
+            self.assertEqual(tar.getmember('dir').mtime, 1396050765)
+
+    def test_plain(self):
+        archive = os.path.join(self.tmp, 'test.tar')
+        self._write(archive)
+        self.assertEqual(os.path.getsize(archive) % 10240, 0)
+        self._check(archive)
+
+    def test_compressed(self):
+        for compression in ('gz', 'bz2', 'xz'):
+            for workers in (1, 4):
+                with self.subTest(compression=compression, workers=workers):
+                    archive = os.path.join(self.tmp, f'test.tar.{compression}')
+                    self._write(archive, compression=compression,
+                                workers=workers, block_size=65536)
+                    self._check(archive)
+
+    def test_failed_add(self):
+        def data():
+            yield b'12345'
+            raise OSError('read error')
+
+        for compression in (None, 'gz'):
+            with self.subTest(compression=compression):
+                archive = os.path.join(self.tmp, f'failed.{compression}')
+                with self.assertRaises(OSError), \
+                        t.TarWriter(archive, compression) as writer:
+                    writer.add('a', b'complete')
+                    writer.add('b', data(), size=10)
+                # The archive is cut off, not completed with zero blocks.
+                with self.assertRaises(tarfile.ReadError), \
+                        tarfile.open(archive) as tar:
+                    tar.extractfile('b').read()
+
+    def test_stream(self):
+        output = io.BytesIO()
+        with t.TarWriter(output, compression='gz', workers=2) as writer:
+            writer.add('a', io.BytesIO(b'unknown size'))
+        with tarfile.open(fileobj=io.BytesIO(output.getvalue())) as tar:
+            self.assertEqual(tar.extractfile('a').read(), b'unknown size')
+
+    def test_size_mismatch(self):
+        output = io.BytesIO()
+        with t.TarWriter(output) as writer:
+            self.assertRaises(ValueError, writer.add, 'a', [b'abc'], size=2)
+
+    def test_pax_owner(self):
+        archive = os.path.join(self.tmp, 'owners.tar')
+        owners = {'short': ('user', 'group'),
+                  'unicode': ('пользователь', 'группа'),
+                  'long': ('u' * 40, 'g' * 32)}
+        with t.TarWriter(archive) as writer:
+            for name, (uname, gname) in owners.items():
+                writer.add(name, b'data', uname=uname, gname=gname)
+        tar = t.TarParser(archive)
+        for name, (uname, gname) in owners.items():
+            stat = dict(tar.file_stat(name))
+            self.assertEqual((stat['User name'], stat['Group name']),
+                             (uname, gname))
+        with tarfile.open(archive) as tar:
+            for name, (uname, gname) in owners.items():
+                member = tar.getmember(name)
+                self.assertEqual((member.uname, member.gname),
+                                 (uname, gname))
+        header = t.TarWriter(io.BytesIO()).build_header(
+            'a', 0, 0o644, 0, b'0', uname='user', gname='group')
+        self.assertEqual(len(header), 512)
+
+    def test_pax_size(self):
+        header = t.TarWriter(io.BytesIO()).build_header(
+            'huge', 2**34, 0o644, 0, b'0')
+        self.assertEqual(header[156:157], b'x')
+        self.assertEqual(t.parse_pax(header[512:1024])['size'], str(2**34))
+
+
+if __name__ == '__main__':
+    unittest.main()
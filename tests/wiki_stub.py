@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+
+import bz2
+import http.server
+import random
+import sys
+import threading
+import time
+from urllib.parse import quote, unquote
+from xml.sax.saxutils import escape, quoteattr
+
+
+class _Server(http.server.ThreadingHTTPServer):
+    request_queue_size = 256
+
+    def handle_error(self, request, client_address):
+        # Clients hanging up mid-response are expected (e.g. on shutdown).
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+def synthetic_graph(nodes: int, degree: int, seed: int = 0) -> dict:
+    """
+    Random link graph of `nodes` articles with `degree` links each:
+    {title: [linked titles]}. Titles are Cyrillic with underscores, as
+    on ru.wikipedia.org.
+    """
+    rng = random.Random(seed)
+    titles = [f'Статья_{i}' for i in range(nodes)]
+    return {title: rng.sample(titles, min(degree, nodes))
+            for title in titles}
+
+
+def scale_free_graph(nodes: int, degree: int, seed: int = 0) -> dict:
+    """
+    Link graph with a power-law degree distribution, like Wikipedia's:
+    articles are added one by one, each links to `degree` earlier ones
+    picked with probability proportional to their degree (preferential
+    attachment), and every picked article links back with probability 1/2.
+    Titles are those of synthetic_graph.
+    """
+    rng = random.Random(seed)
+    titles = [f'Статья_{i}' for i in range(nodes)]
+    graph = {title: [] for title in titles}
+    # Every article appears here once per link to it plus once on its own.
+    ends = list(range(min(degree, nodes)))
+    for i in range(len(ends), nodes):
+        targets = set()
+        while len(targets) < min(degree, i):
+            targets.add(rng.choice(ends))
+        for target in sorted(targets):
+            graph[titles[i]].append(titles[target])
+            if rng.random() < 0.5:
+                graph[titles[target]].append(titles[i])
+            ends.append(target)
+        ends.append(i)
+    return graph
+
+
+def write_dump(graph: dict, path: str, redirects=None) -> None:
+    """
+    Writes `graph` as a MediaWiki XML export to `path`, compressed if it
+    ends with .bz2. Links are wikitext [[links]] written in the styles
+    found in real articles; every page also carries links that phil must
+    ignore (categories, interwiki, sections, files). `redirects` maps
+    extra titles to the titles they redirect to.
+    """
+    def page(title, text, redirect=None):
+        redirect = (f'<redirect title={quoteattr(redirect)} />'
+                    if redirect else '')
+        return (f'<page><title>{escape(title)}</title><ns>0</ns>'
+                f'<id>1</id>{redirect}<revision><id>1</id><text bytes="1" '
+                f'xml:space="preserve">{escape(text)}</text></revision>'
+                f'</page>\n')
+
+    def wikilink(title, i):
+        title = title.replace('_', ' ')
+        if i % 3 == 1:
+            return f'[[{title}|текст ссылки]]'
+        if i % 3 == 2:
+            return f'[[{title[:1].lower()}{title[1:]}]]ами'
+        return f'[[{title}]]'
+
+    opener = bz2.open if path.endswith('.bz2') else open
+    with opener(path, 'wt', encoding='utf-8') as f:
+        f.write('<mediawiki xmlns="http://www.mediawiki.org/xml/export-0.10/"'
+                ' xml:lang="ru"><siteinfo><sitename>Википедия</sitename>'
+                '</siteinfo>\n')
+        f.write('<page><title>Категория:Статьи</title><ns>14</ns><id>1</id>'
+                '<revision><text>[[Статья_0]]</text></revision></page>\n')
+        for title, links in graph.items():
+            text = ' '.join(wikilink(link, i) for i, link in enumerate(links))
+            f.write(page(title.replace('_', ' '), (
+                f'{{{{Карточка|[[Файл:x.png|мини|[[Нет_такой]]]]}}}} {text} '
+                f'[[#Раздел]] [[{title}#Раздел|раздел]] [[en:Article]] '
+                f'[[Категория:Статьи]] [[Несуществующая статья]]')))
+        for title, target in (redirects or {}).items():
+            f.write(page(title.replace('_', ' '), f'#REDIRECT [[{target}]]',
+                         target.replace('_', ' ')))
+        f.write('</mediawiki>\n')
+
+
+class WikiStub:
+    """
+    Local stand-in for ru.wikipedia.org serving the link graph `graph`:
+    {title: [linked titles]}. Every article page links to its titles inside
+    the article body, plus a few links outside of it that must be ignored;
+    titles missing from `graph` get 404. Every response is delayed by
+    `delay` seconds; `requests` lists the titles requested.
+    """
+
+    def __init__(self, graph: dict, delay: float = 0.0):
+        self.graph = graph
+        self.delay = delay
+        self.requests = []
+        self.lock = threading.Lock()
+        self.server = _Server(('127.0.0.1', 0), self._handler())
+        self.server.daemon_threads = True
+        self.url = f'http://127.0.0.1:{self.server.server_port}'
+        self._thread = threading.Thread(target=self.server.serve_forever,
+                                        daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def page(self, title: str) -> bytes:
+        links = ''.join(f'<p><a href="/wiki/{quote(link)}" title="{link}">'
+                        f'{link}</a></p>\n' for link in self.graph[title])
+        return (
+            f'<html><body><a href="/wiki/Заглавная_страница">Wiki</a>'
+            f'<div class="mw-content-ltr mw-parser-output" lang="ru" '
+            f'dir="ltr">{links}<a href="/wiki/Категория:Статьи">c</a></div>'
+            f'<!--esi <esi:include src="/footer" /> -->'
+            f'<a href="/wiki/Служебная_страница">footer</a></body></html>'
+        ).encode()
+
+    def _handler(self):
+        stub = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                title = unquote(self.path[len('/wiki/'):])
+                with stub.lock:
+                    stub.requests.append(title)
+                if stub.delay:
+                    time.sleep(stub.delay)
+                if not self.path.startswith('/wiki/') \
+                        or title not in stub.graph:
+                    self.send_error(404)
+                    return
+                content = stub.page(title)
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/html; charset=UTF-8')
+                self.send_header('Content-Length', str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
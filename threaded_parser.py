@@ -1,16 +1,42 @@
 import argparse
+import asyncio
+import hashlib
+import html
+import http.client
+import io
+import json
+import math
 import os
 import pathlib
+import queue
+import random
 import re
+import shutil
 import signal
+import socket
+import ssl
 import sys
-import urllib.request
+import tempfile
+import time
+import urllib.parse
 import threading
+from collections import deque, namedtuple
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import partial
 from typing import Optional
-from urllib.error import URLError, HTTPError
 
 HABR = "https://habr.com"
-RE_IMAGES = re.compile(r'<img src=\"')
+PER_HOST = 16
+FILE_WORKERS = 4
+REDIRECTS = (301, 302, 303, 307, 308)
+USER_AGENT = 'Python-urllib/{}.{}'.format(*sys.version_info)
+CACHE_DIR = '.cache'
+JOURNAL_FILE = '.journal'
+CHUNK_SIZE = 64 * 1024
+MAX_IMAGE_SIZE = 64 * 1024 * 1024
+
+Response = namedtuple('Response', 'status headers body')
 
 
 def correct_name_folder(name):
@@ -20,46 +46,1209 @@ def correct_name_folder(name):
     return name
 
 
+class AdaptiveLimit:
+    """
+    Thread-safe limit on requests in flight, adjusted AIMD-style between
+    `minimum` and `maximum`: it grows by one per request that succeeds
+    with latency within `tolerance` times the best seen, and halves on
+    overload (errors, 429, 503). Overloads of requests sent before the
+    last decrease are not counted again, so a burst of rejections halves
+    the limit once. With `minimum` equal to `maximum` it is a plain
+    semaphore.
+    """
+
+    def __init__(self, initial: int, maximum: int, minimum: int = 1,
+                 tolerance: float = 2.0):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.tolerance = tolerance
+        self.condition = threading.Condition()
+        self.in_flight = 0
+        self.best_latency = float('inf')
+        self.decreased = 0.0
+
+    def acquire(self) -> float:
+        """ Waits for a free slot and returns the time it was taken. """
+        with self.condition:
+            while self.in_flight >= int(self.limit):
+                self.condition.wait()
+            self.in_flight += 1
+            return time.monotonic()
+
+    def release(self, started: float, latency: Optional[float] = None,
+                overloaded: bool = False) -> None:
+        with self.condition:
+            self.in_flight -= 1
+            if self.minimum < self.maximum:
+                self.adjust(started, latency, overloaded)
+            self.condition.notify_all()
+
+    def adjust(self, started, latency, overloaded) -> None:
+        if overloaded:
+            if started >= self.decreased:
+                self.limit = max(self.minimum, self.limit / 2)
+                self.decreased = time.monotonic()
+            return
+        if latency is None:
+            return
+        self.best_latency = min(self.best_latency, latency)
+        if latency > self.tolerance * self.best_latency:
+            return
+        self.limit = min(self.maximum, self.limit + 1)
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: `acquire` lets through `rate` calls per
+    second on average and bursts of up to `burst` calls.
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self) -> None:
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst,
+                              self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            wait = -self.tokens / self.rate
+        if wait > 0:
+            time.sleep(wait)
+
+
+class ConnectionPool:
+    """
+    Thread-safe pool of keep-alive `http.client` connections keyed by
+    (scheme, host, port).
+
+    At most `max_per_host` connections to a host are in use at once; the
+    rest of the callers wait for one to be released. If `adaptive`, the
+    limit starts at one and adapts to the host's latency and errors up to
+    `max_per_host` (see AdaptiveLimit). With `rate`, requests to a host are
+    also spaced to at most `rate` per second. Connections idle for longer
+    than `idle_timeout` seconds are closed. A request that fails on
+    a reused connection (the server may have dropped it meanwhile) is
+    retried on another one. Requests answered with 429 or 503 or failing
+    with a timeout or connection error are retried up to `retries` times
+    after an exponential backoff with full jitter (or Retry-After).
+    """
+    CONNECTIONS = {'http': http.client.HTTPConnection,
+                   'https': http.client.HTTPSConnection}
+    PORTS = {'http': 80, 'https': 443}
+    RETRY_STATUSES = (429, 503)
+
+    def __init__(self, max_per_host: int = PER_HOST,
+                 idle_timeout: float = 30, timeout: float = 10,
+                 max_redirects: int = 5, adaptive: bool = False,
+                 rate: Optional[float] = None, retries: int = 4,
+                 backoff: float = 0.05, max_backoff: float = 2.0):
+        self.max_per_host = max_per_host
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self.max_redirects = max_redirects
+        self.adaptive = adaptive
+        self.rate = rate
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.ssl = ssl.create_default_context()
+        self.lock = threading.Lock()
+        self.idle = {}
+        self.limits = {}
+        self.buckets = {}
+        self.opened = 0
+        self.reused = 0
+        self.retried = 0
+
+    def get(self, url: str) -> Optional[bytes]:
+        response = self.fetch(url)
+        if response is None or not 200 <= response.status < 300:
+            return None
+        return response.body
+
+    def fetch(self, url: str, headers=None) -> Optional[Response]:
+        """
+        Returns the response to GET `url` after following redirects, or
+        None on network errors.
+        """
+        try:
+            with self.open(url, headers) as response:
+                if response is None:
+                    return None
+                body = response.read()
+        except (OSError, http.client.HTTPException):
+            return None
+        if STATS is not None:
+            STATS.count('bytes', len(body))
+        return Response(response.status, response.msg, body)
+
+    @contextmanager
+    def open(self, url: str, headers=None):
+        """
+        Sends GET `url`, following redirects, and yields the
+        `http.client.HTTPResponse` with its body left to the caller, or
+        None on network errors. The connection returns to the pool on exit
+        if the body has been read in full, and is closed otherwise.
+        """
+        redirects = attempts = 0
+        while True:
+            parts = urllib.parse.urlsplit(url)
+            try:
+                key = (parts.scheme, parts.hostname,
+                       parts.port or self.PORTS[parts.scheme])
+            except (KeyError, ValueError):
+                break
+            if self.rate:
+                self.bucket(key).acquire()
+            limit = self.host_limit(key)
+            started = limit.acquire()
+            try:
+                connection, response = self.send(key, parts, headers)
+            except (ConnectionError, TimeoutError):
+                limit.release(started, overloaded=True)
+                if attempts == self.retries:
+                    break
+                attempts += 1
+                self.wait(attempts)
+                continue
+            except (OSError, ValueError, http.client.HTTPException):
+                limit.release(started)
+                break
+            except BaseException:
+                limit.release(started)
+                raise
+            latency = time.monotonic() - started
+            overloaded = response.status in self.RETRY_STATUSES
+            location = response.getheader('Location')
+            retry = overloaded and attempts < self.retries
+            redirect = response.status in REDIRECTS and location \
+                and redirects < self.max_redirects
+            if retry or redirect:
+                try:
+                    response.read()
+                except (OSError, http.client.HTTPException):
+                    pass
+                self.finish(key, connection, response)
+                limit.release(started, latency, overloaded)
+                if retry:
+                    attempts += 1
+                    self.wait(attempts, response.getheader('Retry-After'))
+                else:
+                    redirects += 1
+                    url = urllib.parse.urljoin(url, location)
+                continue
+            mark = STATS.mark() if STATS is not None else None
+            try:
+                yield response
+            finally:
+                if mark is not None:
+                    STATS.record_since('body', mark)
+                self.finish(key, connection, response)
+                limit.release(started, latency, overloaded)
+            return
+        yield None
+
+    def wait(self, attempt: int, retry_after: Optional[str] = None) -> None:
+        """ Sleeps before retry number `attempt`. """
+        with self.lock:
+            self.retried += 1
+        delay = random.uniform(
+            0, min(self.max_backoff, self.backoff * 2 ** (attempt - 1)))
+        if retry_after is not None and retry_after.isdigit():
+            delay = max(delay, min(self.max_backoff, int(retry_after)))
+        time.sleep(delay)
+
+    def send(self, key, parts, headers=None):
+        """
+        Sends the request on a pooled connection, retrying on a new one if
+        a reused connection turns out to be dropped by the server.
+        """
+        target = parts.path or '/'
+        if parts.query:
+            target += '?' + parts.query
+        headers = {'User-Agent': USER_AGENT, 'Accept-Encoding': 'identity',
+                   **(headers or {})}
+        while True:
+            connection, reused = self.acquire(key)
+            try:
+                if STATS is None:
+                    connection.request('GET', target, headers=headers)
+                    return connection, connection.getresponse()
+                if not reused:
+                    timed_connect(connection)
+                started = time.perf_counter()
+                connection.request('GET', target, headers=headers)
+                response = connection.getresponse()
+                STATS.record('ttfb', time.perf_counter() - started)
+                STATS.count('requests')
+                return connection, response
+            except ConnectionError:
+                connection.close()
+                if not reused:
+                    raise
+            except BaseException:
+                connection.close()
+                raise
+
+    def finish(self, key, connection, response) -> None:
+        if response.isclosed() and not response.will_close:
+            self.release(key, connection)
+        else:
+            connection.close()
+
+    def host_limit(self, key) -> AdaptiveLimit:
+        with self.lock:
+            if key not in self.limits:
+                self.limits[key] = AdaptiveLimit(
+                    1 if self.adaptive else self.max_per_host,
+                    self.max_per_host,
+                    1 if self.adaptive else self.max_per_host)
+            return self.limits[key]
+
+    def bucket(self, key) -> TokenBucket:
+        with self.lock:
+            if key not in self.buckets:
+                self.buckets[key] = TokenBucket(self.rate)
+            return self.buckets[key]
+
+    def acquire(self, key):
+        """
+        Returns an idle connection to the host or a new one, and whether
+        it is reused.
+        """
+        with self.lock:
+            self.evict_idle()
+            idle = self.idle.get(key)
+            if idle:
+                self.reused += 1
+                return idle.pop()[0], True
+            self.opened += 1
+        scheme, host, port = key
+        if scheme == 'https':
+            return self.CONNECTIONS[scheme](
+                host, port, timeout=self.timeout, context=self.ssl), False
+        return self.CONNECTIONS[scheme](host, port, timeout=self.timeout), \
+            False
+
+    def release(self, key, connection) -> None:
+        with self.lock:
+            self.idle.setdefault(key, deque()).append(
+                (connection, time.monotonic()))
+
+    def evict_idle(self) -> None:
+        """ Closes connections idle for too long. Call with `lock` held. """
+        expired = time.monotonic() - self.idle_timeout
+        for idle in self.idle.values():
+            while idle and idle[0][1] <= expired:
+                idle.popleft()[0].close()
+
+    def close(self) -> None:
+        with self.lock:
+            for idle in self.idle.values():
+                while idle:
+                    idle.popleft()[0].close()
+
+
+def timed_connect(connection) -> None:
+    """
+    Connects `connection`, recording the DNS lookup and the TCP and TLS
+    handshakes that follow it as separate stages.
+    """
+    started = time.perf_counter()
+    addresses = socket.getaddrinfo(connection.host, connection.port,
+                                   type=socket.SOCK_STREAM)
+    resolved = time.perf_counter()
+    STATS.record('dns', resolved - started)
+    connection._create_connection = partial(connect_resolved, addresses)
+    connection.connect()
+    STATS.record('connect', time.perf_counter() - resolved)
+
+
+def connect_resolved(addresses, address, *args):
+    """ socket.create_connection to already resolved `addresses`. """
+    for i, (*_, sockaddr) in enumerate(addresses):
+        try:
+            return socket.create_connection(sockaddr[:2], *args)
+        except OSError:
+            if i == len(addresses) - 1:
+                raise
+
+
+class BlobStore:
+    """
+    Content-addressed file store in `root`: every distinct payload is kept
+    once, named by its SHA-256, and hard-linked wherever it is needed.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.lock = threading.Lock()
+        self.duplicates = 0
+        self.bytes_deduplicated = 0
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, digest: str) -> str:
+        return os.path.join(self.root, digest[:2], digest)
+
+    def add(self, tmp: str, digest: str) -> None:
+        """ Moves the file `tmp` with the given digest into the store. """
+        path = self.path(digest)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self.lock:
+            if not os.path.exists(path):
+                os.replace(tmp, path)
+                return
+            self.duplicates += 1
+            self.bytes_deduplicated += os.path.getsize(path)
+        os.unlink(tmp)
+
+    def write(self, body: bytes) -> str:
+        """ Stores `body` and returns its digest. """
+        digest = hashlib.sha256(body).hexdigest()
+        tmp = self.incoming()
+        write_file(tmp, body)
+        self.add(tmp, digest)
+        return digest
+
+    def save(self, response, max_size=None) -> Optional[str]:
+        """
+        Streams the body of `response` into the store and returns its
+        digest, or None if it is larger than `max_size` bytes.
+        """
+        tmp = self.incoming()
+        digest = stream_to_file(response, tmp, max_size)
+        if digest is not None:
+            self.add(tmp, digest)
+        return digest
+
+    def incoming(self) -> str:
+        return os.path.join(self.root, f'incoming.{threading.get_ident()}')
+
+    def link(self, digest: str, path: str) -> None:
+        """
+        Atomically puts the blob at `path` as a hard link, or as a copy
+        where the file system does not support links.
+        """
+        blob = self.path(digest)
+        try:
+            if os.path.samefile(blob, path):
+                return
+        except FileNotFoundError:
+            pass
+        tmp = temp_path(path)
+        try:
+            os.link(blob, tmp)
+        except OSError:
+            shutil.copyfile(blob, tmp)
+        os.replace(tmp, path)
+
+
+class ResponseCache:
+    """
+    On-disk HTTP response cache in `root`.
+
+    Bodies are kept in the `blobs` store, while index.json maps every URL to
+    its blob and the ETag/Last-Modified validators. Cached responses are
+    revalidated with conditional requests; immutable ones (images) are
+    served without touching the network at all.
+    """
+    INDEX = 'index.json'
+
+    def __init__(self, root, blobs: BlobStore):
+        self.root = root
+        self.blobs = blobs
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+        try:
+            with open(os.path.join(root, self.INDEX)) as f:
+                self.index = json.load(f)
+        except (OSError, ValueError):
+            self.index = {}
+
+    def lookup(self, url: str) -> Optional[str]:
+        """ Returns the digest of the cached body of `url`, if any. """
+        entry = self.index.get(url)
+        if entry is None or not os.path.exists(
+                self.blobs.path(entry['digest'])):
+            return None
+        return entry['digest']
+
+    def hit(self, url: str) -> Optional[bytes]:
+        """ Returns the cached body of `url` and counts it as a hit. """
+        digest = self.lookup(url)
+        if digest is None:
+            return None
+        try:
+            with open(self.blobs.path(digest), 'rb') as f:
+                body = f.read()
+        except FileNotFoundError:
+            return None
+        with self.lock:
+            self.hits += 1
+            self.bytes_saved += len(body)
+        return body
+
+    def hit_blob(self, url: str) -> Optional[str]:
+        """ Returns the digest of the cached body of `url` as a hit. """
+        digest = self.lookup(url)
+        if digest is not None:
+            with self.lock:
+                self.hits += 1
+                self.bytes_saved += os.path.getsize(self.blobs.path(digest))
+        return digest
+
+    def validators(self, url: str) -> dict:
+        """ Returns the headers of a conditional request for `url`. """
+        if self.lookup(url) is None:
+            return {}
+        entry = self.index[url]
+        headers = {}
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def store(self, url: str, response: Optional[Response]) \
+            -> Optional[bytes]:
+        """
+        Returns the body for `response` to a (conditional) request of `url`,
+        taking it from the cache on 304 and caching it on success.
+        """
+        if response is None:
+            return None
+        if response.status == 304:
+            return self.hit(url)
+        if not 200 <= response.status < 300:
+            return None
+        self.record(url, response.headers, self.blobs.write(response.body))
+        return response.body
+
+    def record(self, url: str, headers, digest: str) -> None:
+        with self.lock:
+            self.misses += 1
+            self.index[url] = {
+                'digest': digest,
+                'etag': headers.get('ETag'),
+                'last_modified': headers.get('Last-Modified'),
+            }
+
+    def save(self) -> None:
+        path = os.path.join(self.root, self.INDEX)
+        with self.lock:
+            with open(path + '.tmp', 'w') as f:
+                json.dump(self.index, f)
+        os.replace(path + '.tmp', path)
+
+    def summary(self) -> str:
+        return (f'Cache: {self.hits} hits, {self.misses} misses, '
+                f'{self.bytes_saved} bytes saved')
+
+
+class ImageStore:
+    """
+    Images shared by all articles of a run: every URL is downloaded once,
+    however many articles refer to it, and every distinct payload is kept
+    once in `blobs` and hard-linked into the article folders.
+    """
+
+    def __init__(self, blobs: BlobStore):
+        self.blobs = blobs
+        self.lock = threading.Lock()
+        self.downloads = {}
+        self.repeated = 0
+        self.bytes_saved = 0
+
+    def claim(self, url: str):
+        """
+        Returns the future digest of `url` and whether the caller is the
+        first to ask for it and so has to download it and set the result.
+        """
+        with self.lock:
+            future = self.downloads.get(url)
+            if future is not None:
+                return future, False
+            future = self.downloads[url] = Future()
+            return future, True
+
+    def reuse(self, digest: str) -> None:
+        with self.lock:
+            self.repeated += 1
+            self.bytes_saved += os.path.getsize(self.blobs.path(digest))
+
+    def summary(self) -> str:
+        return (f'Dedup: {self.repeated} repeated image URLs '
+                f'({self.bytes_saved} bytes not downloaded), '
+                f'{self.blobs.duplicates} duplicate images '
+                f'({self.blobs.bytes_deduplicated} bytes not stored)')
+
+
+class Journal:
+    """
+    Crash-safe record of crawl jobs in `path`: an append-only log with one
+    JSON line per job state change (queued, started, done). Lines are
+    buffered and written in batches of `batch` or every `interval` seconds,
+    so a crash loses at most the last batch, whose jobs are then redone.
+
+    With `resume` the existing log is loaded (a torn last line is ignored)
+    and compacted to one line per job; otherwise it is started afresh.
+    """
+    QUEUED, STARTED, DONE = 'queued', 'started', 'done'
+
+    def __init__(self, path, resume: bool = False, batch: int = 256,
+                 interval: float = 1.0):
+        self.path = path
+        self.batch = batch
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.states = {}
+        self.buffer = []
+        if resume:
+            self.load()
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            f.writelines(self.line(state, key)
+                         for key, state in self.states.items())
+        os.replace(path + '.tmp', path)
+        self.file = open(path, 'a', encoding='utf-8')
+        self.flushed = time.monotonic()
+
+    def load(self) -> None:
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        state, *key = json.loads(line)
+                    except ValueError:
+                        break
+                    self.states[tuple(key)] = state
+        except FileNotFoundError:
+            pass
+
+    @staticmethod
+    def line(state: str, key: tuple) -> str:
+        return json.dumps([state, *key], ensure_ascii=False) + '\n'
+
+    def pending(self) -> list:
+        """ Returns the jobs queued or started but not done. """
+        with self.lock:
+            return [key for key, state in self.states.items()
+                    if state != self.DONE]
+
+    def is_done(self, *key) -> bool:
+        return self.states.get(key) == self.DONE
+
+    def queue(self, *key) -> None:
+        self.log(self.QUEUED, key)
+
+    def start(self, *key) -> None:
+        self.log(self.STARTED, key)
+
+    def done(self, *key) -> None:
+        self.log(self.DONE, key)
+
+    def log(self, state: str, key: tuple) -> None:
+        with self.lock:
+            self.states[key] = state
+            self.buffer.append(self.line(state, key))
+            if len(self.buffer) >= self.batch \
+                    or time.monotonic() - self.flushed >= self.interval:
+                self.flush()
+
+    def flush(self) -> None:
+        """ Writes out the buffered lines. Call with `lock` held. """
+        self.file.write(''.join(self.buffer))
+        self.file.flush()
+        self.buffer.clear()
+        self.flushed = time.monotonic()
+
+    def close(self) -> None:
+        with self.lock:
+            self.flush()
+            self.file.close()
+
+
+class Histogram:
+    """
+    Latency histogram with logarithmic buckets, SUBBUCKETS per power of
+    two, so percentiles are within about 6% of the true values. Not
+    thread-safe: every thread records into its own and they are merged.
+    """
+    SUBBUCKETS = 8
+
+    def __init__(self):
+        self.buckets = {}
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds: float) -> None:
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+        mantissa, exponent = math.frexp(seconds)
+        bucket = exponent * self.SUBBUCKETS \
+            + int((mantissa - 0.5) * 2 * self.SUBBUCKETS)
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+
+    def merge(self, other: 'Histogram') -> None:
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+        # `other` may be in use by its thread: copy before iterating.
+        for bucket, count in list(other.buckets.items()):
+            self.buckets[bucket] = self.buckets.get(bucket, 0) + count
+
+    def percentile(self, q: float) -> float:
+        """ Middle of the bucket holding the `q`-th percentile. """
+        rank = math.ceil(self.count * q / 100)
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                exponent, sub = divmod(bucket, self.SUBBUCKETS)
+                return min(self.max, math.ldexp(
+                    0.5 + (sub + 0.5) / (2 * self.SUBBUCKETS), exponent))
+        return 0.0
+
+
+class Stats:
+    """
+    Per-stage latencies and throughput of a run. Every thread records into
+    its own histograms and counters, so recording takes no locks; `report`
+    merges them.
+
+    Stages are `dns`, `connect` (TCP and TLS handshakes), `ttfb` (request
+    sent to response headers), `body` (reading the body), `parse` (HTML
+    extraction, per page) and `write` (disk writes, per file). Parsing and
+    writing that happen while a body streams in are not counted in `body`.
+    """
+    STAGES = ('dns', 'connect', 'ttfb', 'body', 'parse', 'write')
+    NESTED = ('parse', 'write')
+    PERCENTILES = (50, 95, 99)
+
+    def __init__(self):
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.shards = []
+        self.started = time.monotonic()
+
+    def shard(self) -> dict:
+        try:
+            return self.local.shard
+        except AttributeError:
+            shard = self.local.shard = {
+                'histograms': {}, 'requests': 0, 'bytes': 0, 'nested': 0.0}
+            with self.lock:
+                self.shards.append(shard)
+            return shard
+
+    def record(self, stage: str, seconds: float) -> None:
+        shard = self.shard()
+        histograms = shard['histograms']
+        if stage not in histograms:
+            histograms[stage] = Histogram()
+        histograms[stage].record(seconds)
+        if stage in self.NESTED:
+            shard['nested'] += seconds
+
+    def mark(self):
+        """ Returns a mark for `record_since`. """
+        return time.perf_counter(), self.shard()['nested']
+
+    def record_since(self, stage: str, mark) -> None:
+        """
+        Records the time since `mark` less parsing and writing the thread
+        has done in the meantime.
+        """
+        started, nested = mark
+        self.record(stage, time.perf_counter() - started
+                    - (self.shard()['nested'] - nested))
+
+    def count(self, name: str, n: int = 1) -> None:
+        """ Adds `n` to the `requests` or `bytes` counter. """
+        self.shard()[name] += n
+
+    def report(self) -> dict:
+        """ Returns the totals so far as a JSON-serializable dict. """
+        elapsed = time.monotonic() - self.started
+        histograms = {stage: Histogram() for stage in self.STAGES}
+        requests = received = 0
+        with self.lock:
+            shards = list(self.shards)
+        for shard in shards:
+            requests += shard['requests']
+            received += shard['bytes']
+            for stage, histogram in list(shard['histograms'].items()):
+                histograms.setdefault(stage, Histogram()).merge(histogram)
+        return {
+            'elapsed': elapsed,
+            'requests': requests,
+            'bytes': received,
+            'requests_per_second': requests / elapsed if elapsed else 0.0,
+            'bytes_per_second': received / elapsed if elapsed else 0.0,
+            'stages': {
+                stage: {
+                    'count': histogram.count,
+                    'total': histogram.total,
+                    'max': histogram.max,
+                    **{f'p{q}': histogram.percentile(q)
+                       for q in self.PERCENTILES},
+                } for stage, histogram in histograms.items()},
+        }
+
+    @staticmethod
+    def format(report: dict) -> str:
+        """
+        Formats `report` as logfmt lines, times in milliseconds: one
+        line with the totals and one per stage.
+        """
+        lines = [
+            f'stats elapsed={report["elapsed"]:.3f} '
+            f'requests={report["requests"]} bytes={report["bytes"]} '
+            f'requests_per_s={report["requests_per_second"]:.1f} '
+            f'bytes_per_s={report["bytes_per_second"]:.0f}']
+        for stage, values in report['stages'].items():
+            lines.append(f'stats stage={stage} count={values["count"]} '
+                         + ' '.join(f'{key}_ms={values[key] * 1000:.3f}'
+                                    for key in (
+                                        'p50', 'p95', 'p99', 'max')))
+        return '\n'.join(lines)
+
+
+POOL = ConnectionPool()
+CACHE: Optional[ResponseCache] = None
+IMAGES: Optional[ImageStore] = None
+JOURNAL: Optional[Journal] = None
+STATS: Optional[Stats] = None
+
+
 def load_content(url: str) -> Optional[bytes]:
-    try:
-        return urllib.request.urlopen(url, timeout=10).read()
-    except (HTTPError, URLError):
+    """
+    Downloads `url` through the shared connection pool and, when enabled,
+    the response cache.
+    """
+    if CACHE is None:
+        return POOL.get(url)
+    return CACHE.store(url, POOL.fetch(url, CACHE.validators(url)))
+
+
+class PageScanner:
+    """
+    Single-pass incremental extractor for Habr pages.
+
+    `feed` takes the page bytes as they arrive. A compiled regex picks out
+    just the tags that matter where the scan is (e.g. links only inside
+    headers); article links of the front page are reported to
+    `on_article(name, link)` and image URLs inside the post body to
+    `on_image(url)` as soon as their tags are complete. Only the tail of
+    an unfinished tag is kept between feeds.
+    """
+    ATTR = re.compile(
+        rb'''([\w:-]+)\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s"'>]+))''')
+    BODY_ID = b'post-content-body'
+    TAG_START = re.compile(rb'</?[a-z]*\Z', re.IGNORECASE)
+
+    def __init__(self, on_article=None, on_image=None):
+        self.on_article = on_article
+        self.on_image = on_image
+        self.patterns = {}
+        self.buffer = b''
+        self.body_depth = 0
+        self.body_done = False
+        self.heading = False
+        self.link = None
+        self.name = None
+        self.name_start = None
+        self.elapsed = 0.0
+
+    def feed(self, data: bytes) -> None:
+        if STATS is None:
+            self.scan(data)
+            return
+        started = time.perf_counter()
+        self.scan(data)
+        self.elapsed += time.perf_counter() - started
+
+    def close(self) -> None:
+        self.buffer = b''
+        if STATS is not None:
+            STATS.record('parse', self.elapsed)
+
+    def scan(self, data: bytes) -> None:
+        if self.body_done and self.on_article is None:
+            return  # Nothing of interest after the post body.
+        buffer = self.buffer + data if self.buffer else data
+        end = 0
+        while match := self.pattern().search(buffer, end):
+            if match.group(4) is None:
+                # The tag is cut off by the end of the data: keep it from
+                # its start, not from a '<' in a quoted attribute value.
+                keep = match.start()
+                break
+            self.handle_tag(match, buffer)
+            end = match.end()
+            if self.body_done and self.on_article is None:
+                self.buffer = b''
+                return
+        else:
+            keep = buffer.rfind(b'<', max(end, len(buffer) - 6))
+            if keep == -1 or not self.TAG_START.match(buffer, keep):
+                keep = len(buffer)
+        if self.name_start is not None:
+            self.name.append(buffer[self.name_start:keep])
+            self.name_start = 0
+        self.buffer = buffer[keep:]
+
+    def pattern(self):
+        """
+        Returns the regex for the tags that matter in this state. It also
+        matches such a tag cut off by the end of the data, which lacks the
+        closing '>' (group 4).
+        """
+        state = (self.heading, bool(self.body_depth), self.body_done)
+        if state not in self.patterns:
+            tags = []
+            if self.on_article is not None:
+                tags += [b'h2', b'a', b'span'] if self.heading else [b'h2']
+            if self.on_image is not None and not self.body_done:
+                tags += [b'div', b'img'] if self.body_depth else [b'div']
+            self.patterns[state] = re.compile(
+                rb'<(/?)(' + b'|'.join(tags)
+                + rb''')\b([^>"']*(?:(?:"[^"]*"|'[^']*')[^>"']*)*)'''
+                + rb'''(?:(>)|(?:"[^"]*|'[^']*)?\Z)''',
+                re.IGNORECASE)
+        return self.patterns[state]
+
+    def handle_tag(self, match, buffer: bytes) -> None:
+        closing, tag, attrs = match.group(1, 2, 3)
+        tag = tag.lower()
+        if tag == b'div':
+            if self.body_depth:
+                self.body_depth += -1 if closing else 1
+                self.body_done = not self.body_depth
+            elif not closing and not self.body_done \
+                    and self.BODY_ID in attrs \
+                    and self.attr(attrs, b'id') == self.BODY_ID:
+                self.body_depth = 1
+        elif tag == b'img':
+            src = self.attr(attrs, b'src') if self.body_depth else None
+            if src:
+                self.on_image(self.text(src))
+        elif tag == b'h2':
+            if not closing:
+                self.heading = True
+                self.link = self.name = self.name_start = None
+            elif self.heading:
+                self.heading = False
+                # Only a name whose span is closed is complete: the text
+                # of an unclosed one would depend on where chunks end.
+                if self.link and self.name is not None \
+                        and self.name_start is None:
+                    name = self.text(
+                        re.sub(rb'<[^>]*>', b'', b''.join(self.name)))
+                    if name.strip():
+                        self.on_article(name, self.link)
+        elif not self.heading:
+            return
+        elif tag == b'a':
+            if not closing and self.link is None:
+                href = self.attr(attrs, b'href')
+                self.link = href and self.text(href)
+        elif not closing:
+            if self.name is None:
+                self.name = []
+                self.name_start = match.end()
+        elif self.name_start is not None:
+            self.name.append(buffer[self.name_start:match.start()])
+            self.name_start = None
+
+    @classmethod
+    def attr(cls, attrs: bytes, name: bytes) -> Optional[bytes]:
+        for match in cls.ATTR.finditer(attrs):
+            if match.group(1).lower() == name:
+                return next(value for value in match.groups()[1:]
+                            if value is not None)
         return None
 
+    @staticmethod
+    def text(value: bytes) -> str:
+        return html.unescape(value.decode('utf-8', 'replace'))
+
+
+def stream_page(url: str, scanner: PageScanner) -> bool:
+    """
+    Feeds the page at `url` to `scanner` chunk by chunk as it arrives, or
+    from the response cache. Returns False if the page failed to load.
+    """
+    headers = CACHE.validators(url) if CACHE is not None else {}
+    try:
+        with POOL.open(url, headers) as response:
+            if response is None:
+                return False
+            if response.status == 304 and CACHE is not None:
+                body = CACHE.hit(url)
+                if body is None:
+                    return False
+                scanner.feed(body)
+            elif 200 <= response.status < 300:
+                chunks = []
+                while chunk := response.read1(CHUNK_SIZE):
+                    chunks.append(chunk)
+                    scanner.feed(chunk)
+                # read1 hands out whatever has arrived but leaves the
+                # response open at the end of the body; read closes it so
+                # the connection can be reused.
+                response.read()
+                body = b''.join(chunks)
+                if STATS is not None:
+                    STATS.count('bytes', len(body))
+                if CACHE is not None:
+                    CACHE.store(url, Response(response.status, response.msg,
+                                              body))
+            else:
+                return False
+            scanner.close()
+    except (OSError, http.client.HTTPException):
+        return False
+    return True
+
 
 def get_images(article_link):
-    content = load_content(f"{HABR}{article_link}").decode("utf-8")
+    content = load_content(f"{HABR}{article_link}")
     if content is None:
         return
-    body_start = content.find(r'<div id="post-content-body">')
-    body_end = content.find(r'</div>', body_start)
-    inner_content = content[body_start:body_end]
-    all_images = RE_IMAGES.finditer(inner_content)
+    return extract_images(content)
+
+
+def extract_images(content: bytes) -> list:
     images = []
-    for image in all_images:
-        start_ref = image.end()
-        end_ref = inner_content.find(r'"', start_ref)
-        images.append(inner_content[start_ref:end_ref])
+    scanner = PageScanner(on_image=images.append)
+    scanner.feed(content)
+    scanner.close()
     return images
 
 
-def download_images(name_article, article_link):
-    images = get_images(article_link)
+def download_images(name_article, article_link, pool=None,
+                    max_size=MAX_IMAGE_SIZE):
+    """
+    Downloads images of the article into its folder. If `pool` is given,
+    every image is handed to it as a separate job instead of being
+    downloaded inline. Images larger than `max_size` bytes are skipped.
+    """
+    if JOURNAL is not None:
+        if JOURNAL.is_done('article', name_article, article_link):
+            return
+        JOURNAL.start('article', name_article, article_link)
+    folder = correct_name_folder(name_article)
+    deferred = []
+
+    def on_image(ref):
+        # Called while the page is still being downloaded, holding its
+        # connection: images wait for the page unless the pool can take
+        # them right away, or they could wait on that connection slot.
+        if JOURNAL is not None and JOURNAL.is_done('image', ref, folder):
+            return
+        os.makedirs(folder, exist_ok=True)
+        if JOURNAL is not None:
+            JOURNAL.queue('image', ref, folder)
+        if pool is None or not pool.offer(download_image, ref, folder,
+                                          max_size):
+            deferred.append(ref)
+
+    done = stream_page(f"{HABR}{article_link}",
+                       PageScanner(on_image=on_image))
+    for ref in deferred:
+        if pool is None:
+            download_image(ref, folder, max_size)
+        else:
+            pool.submit(download_image, ref, folder, max_size)
+    if done and JOURNAL is not None:
+        JOURNAL.done('article', name_article, article_link)
 
-    if not images:
-        return
 
-    name_article = correct_name_folder(name_article)
-    os.makedirs(name_article, exist_ok=True)
+def download_image(ref, folder, max_size=MAX_IMAGE_SIZE):
+    image_name = ref[ref.rfind('/') + 1:]
+    path = os.path.join(folder, image_name)
+    if JOURNAL is not None:
+        JOURNAL.start('image', ref, folder)
+    if IMAGES is None:
+        # Outside of storage() there is no store to share images through.
+        if fetch_image(ref, max_size, path) is None:
+            return
+    else:
+        future, first = IMAGES.claim(ref)
+        if first:
+            try:
+                future.set_result(fetch_image(ref, max_size))
+            except BaseException as e:
+                future.set_exception(e)
+                raise
+        digest = future.result()
+        if digest is None:
+            return
+        if not first:
+            IMAGES.reuse(digest)
+        IMAGES.blobs.link(digest, path)
+    if JOURNAL is not None:
+        JOURNAL.done('image', ref, folder)
+
+
+def fetch_image(ref, max_size=MAX_IMAGE_SIZE, path=None) -> Optional[str]:
+    """
+    Streams the image into the blob store, unless it is cached already,
+    and returns its digest. Without the store the image is written to
+    `path` instead.
+    """
+    if CACHE is not None and (digest := CACHE.hit_blob(ref)) is not None:
+        return digest
+    try:
+        with POOL.open(ref) as response:
+            if response is None or not 200 <= response.status < 300:
+                return None
+            if IMAGES is None:
+                digest = stream_to_file(response, path, max_size)
+            else:
+                digest = IMAGES.blobs.save(response, max_size)
+    except (OSError, http.client.HTTPException):
+        return None
+    if digest is not None and CACHE is not None:
+        CACHE.record(ref, response.msg, digest)
+    return digest
+
+
+def stream_to_file(response, path, max_size=None) -> Optional[str]:
+    """
+    Writes the body of `response` to `path` in CHUNK_SIZE pieces through a
+    temporary file next to it, so `path` is either complete or untouched.
+    Returns the SHA-256 of the body, or None if the body is larger than
+    `max_size` bytes, in which case it is not read any further.
+    """
+    length = response.getheader('Content-Length')
+    if max_size is not None and length is not None \
+            and int(length) > max_size:
+        return None
+    digest = hashlib.sha256()
+    size = 0
+    writing = 0.0
+    tmp = temp_path(path)
+    f = open(tmp, 'wb')
+    complete = False
+    try:
+        with f:
+            while chunk := response.read(CHUNK_SIZE):
+                size += len(chunk)
+                if max_size is not None and size > max_size:
+                    return None
+                digest.update(chunk)
+                if STATS is None:
+                    f.write(chunk)
+                else:
+                    started = time.perf_counter()
+                    f.write(chunk)
+                    writing += time.perf_counter() - started
+        started = time.perf_counter()
+        os.replace(tmp, path)
+        complete = True
+    finally:
+        if not complete:
+            os.unlink(tmp)
+        if STATS is not None:
+            STATS.count('bytes', size)
+    if STATS is not None:
+        STATS.record('write', writing + time.perf_counter() - started)
+    return digest.hexdigest()
+
 
-    for ref in images:
-        image_content = load_content(ref)
-        if image_content is None:
+def temp_path(path):
+    """ Returns a name for a temporary file to be renamed to `path`. """
+    head, tail = os.path.split(path)
+    return os.path.join(head, f'.{tail}.{threading.get_ident()}.part')
+
+
+def write_file(path, content):
+    started = time.perf_counter()
+    tmp = temp_path(path)
+    img = open(tmp, "wb")
+    try:
+        with img:
+            img.write(content)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+    if STATS is not None:
+        STATS.record('write', time.perf_counter() - started)
+
+
+class WorkerPool:
+    """
+    Fixed set of long-lived worker threads consuming a bounded job queue.
+
+    Jobs submitted from outside the pool block while the queue is full,
+    which throttles the producer. Jobs submitted by a worker (images of an
+    article it is processing) never block: when the queue is full the
+    worker runs the job itself, so the pool cannot deadlock on its own
+    queue. Once `event` is set, queued jobs are drained without running.
+    """
+
+    def __init__(self, threads: int, event: threading.Event,
+                 queue_size: Optional[int] = None):
+        self.event = event
+        self.jobs = queue.Queue(queue_size or 4 * threads)
+        self.threads = [threading.Thread(target=self.work, daemon=True)
+                        for _ in range(threads)]
+        for thread in self.threads:
+            thread.start()
+        self._workers = {thread.ident for thread in self.threads}
+
+    def submit(self, func, *args):
+        if threading.get_ident() not in self._workers:
+            self.jobs.put((func, args))
             return
-        image_name = ref[ref.rfind('/') + 1:]
-        path = os.path.join(name_article, image_name)
-        with open(path, "wb") as img:
-            img.write(image_content)
+        if not self.offer(func, *args):
+            self.run(func, args)
+
+    def offer(self, func, *args) -> bool:
+        """ Queues the job if there is room right now. """
+        try:
+            self.jobs.put_nowait((func, args))
+        except queue.Full:
+            return False
+        return True
+
+    def run(self, func, args):
+        if self.event.is_set():
+            return
+        try:
+            func(*args)
+        except Exception as e:
+            print(f'{func.__name__}{args}: {e!r}', file=sys.stderr)
+
+    def work(self):
+        while True:
+            job = self.jobs.get()
+            try:
+                if job is None:
+                    return
+                self.run(*job)
+            finally:
+                self.jobs.task_done()
+
+    def join(self):
+        self.jobs.join()
+        for _ in self.threads:
+            self.jobs.put(None)
+        GracefulShutdown.wait_threads(list(self.threads))
 
 
 class GracefulShutdown:
@@ -71,7 +1260,6 @@ class GracefulShutdown:
 
     def exit_graceful(self, signum, frame):
         self.event.set()
-        self.wait_threads(self.threads)
 
     @staticmethod
     def wait_threads(threads):
@@ -79,38 +1267,510 @@ class GracefulShutdown:
             threads.pop().join()
 
 
-def run_scraper(threads: int, articles: int, out_dir: pathlib.Path) -> None:
-    thread_pool = []
-    gs = GracefulShutdown(thread_pool)
+def run_scraper(threads: int, articles: int, out_dir: pathlib.Path,
+                per_host: int = PER_HOST, cache: bool = True,
+                max_size: int = MAX_IMAGE_SIZE, resume: bool = False,
+                adaptive: bool = False, rate: Optional[float] = None,
+                stats: bool = False, report: Optional[str] = None) -> None:
+    global POOL
+    POOL = ConnectionPool(per_host, adaptive=adaptive, rate=rate)
+    try:
+        with statistics(stats, report), storage(out_dir, cache, resume):
+            scrape(threads, articles, out_dir, max_size)
+    finally:
+        POOL.close()
+
+
+@contextmanager
+def statistics(enabled: bool = False, report: Optional[str] = None,
+               interval: float = 1.0):
+    """
+    If `enabled` or given a `report` path, collects Stats for the run,
+    shows the progress on stderr every `interval` seconds and finally
+    prints the totals and writes them to `report` as JSON.
+    """
+    global STATS
+    if not enabled and report is None:
+        yield
+        return
+    if report is not None:
+        report = os.path.abspath(report)  # The scrapers chdir to out_dir.
+    STATS = Stats()
+    stop = threading.Event()
+    progress = threading.Thread(target=show_progress,
+                                args=(STATS, stop, interval), daemon=True)
+    progress.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        progress.join()
+        totals = STATS.report()
+        STATS = None
+        print(Stats.format(totals))
+        if report is not None:
+            tmp = temp_path(report)
+            with open(tmp, 'w') as f:
+                json.dump(totals, f, indent=2)
+            os.replace(tmp, report)
+
+
+def show_progress(stats: Stats, stop: threading.Event,
+                  interval: float) -> None:
+    while not stop.wait(interval):
+        totals = stats.report()
+        print(f'progress elapsed={totals["elapsed"]:.1f} '
+              f'requests={totals["requests"]} bytes={totals["bytes"]} '
+              f'requests_per_s={totals["requests_per_second"]:.1f} '
+              f'bytes_per_s={totals["bytes_per_second"]:.0f}',
+              file=sys.stderr, flush=True)
+
+
+@contextmanager
+def storage(out_dir: pathlib.Path, cache: bool = True, resume: bool = False):
+    """
+    Sets up the crawl journal and the image store shared by all articles in
+    `out_dir` and, if `cache` is on, the response cache kept there between
+    runs. Without the cache the blob store is temporary.
+    """
+    global CACHE, IMAGES, JOURNAL
+    os.makedirs(out_dir, exist_ok=True)
+    JOURNAL = Journal(os.path.join(os.path.abspath(out_dir), JOURNAL_FILE),
+                      resume)
+    root = os.path.join(os.path.abspath(out_dir), CACHE_DIR)
+    if cache:
+        blobs = BlobStore(os.path.join(root, 'blobs'))
+        CACHE = ResponseCache(root, blobs)
+    else:
+        blobs = BlobStore(tempfile.mkdtemp(prefix='.blobs-',
+                                          dir=os.path.abspath(out_dir)))
+    IMAGES = ImageStore(blobs)
+    try:
+        yield
+    finally:
+        if CACHE is not None:
+            CACHE.save()
+            print(CACHE.summary())
+        else:
+            shutil.rmtree(blobs.root)
+        print(IMAGES.summary())
+        JOURNAL.close()
+        CACHE = IMAGES = JOURNAL = None
+
+
+def scrape(threads: int, articles: int, out_dir: pathlib.Path,
+           max_size: int = MAX_IMAGE_SIZE) -> None:
+    gs = GracefulShutdown([])
+    pool = WorkerPool(threads, gs.event)
+    gs.threads = pool.threads
 
     if not (os.path.exists(out_dir)):
         os.makedirs(out_dir, exist_ok=True)
     os.chdir(out_dir)
 
-    content = load_content(HABR).decode("utf-8")
-    re_headers = re.compile(r'<h2.*<\/h2>')
-    re_name = re.compile(r'<span>(.*)<\/span>')
-    re_href = re.compile(r'<a href=\"(.*)\"')
-    article_list = re.findall(re_headers, content)[:articles]
+    def submit(job):
+        kind, *args = job
+        if kind == 'article':
+            pool.submit(download_images, *args, pool, max_size)
+        else:
+            pool.submit(download_image, *args, max_size)
+
+    jobs = JOURNAL.pending()
+    if not jobs:
+        found = 0
+
+        def on_article(article_name, article_link):
+            # Articles start downloading while the front page still loads,
+            # as long as the pool can take them without blocking the
+            # page's connection; the rest wait for the page to end.
+            nonlocal found
+            found += 1
+            if found <= articles and not gs.event.is_set():
+                job = queue_article(article_name, article_link)
+                if job is not None and not pool.offer(
+                        download_images, *job[1:], pool, max_size):
+                    jobs.append(job)
 
-    for lnk in article_list:
+        stream_page(HABR, PageScanner(on_article=on_article))
+    for job in jobs:
         if gs.event.is_set():
             break
-        while len(thread_pool) >= threads:
-            for thread in thread_pool:
-                if not thread.is_alive():
-                    thread_pool.remove(thread)
-                    break
+        submit(job)
+    pool.join()
+
+
+def queue_article(article_name, article_link):
+    """ Journals the article and returns its job unless it is done. """
+    job = ('article', article_name, article_link)
+    if JOURNAL.is_done(*job):
+        return None
+    JOURNAL.queue(*job)
+    return job
+
+
+def queue_articles(content, articles):
+    """
+    Journals the articles of the front page that are not done yet and
+    returns their jobs.
+    """
+    jobs = []
+    for article_name, article_link in extract_articles(content, articles):
+        job = queue_article(article_name, article_link)
+        if job is not None:
+            jobs.append(job)
+    return jobs
+
+
+def extract_articles(content: bytes, articles: int) -> list:
+    result = []
+    scanner = PageScanner(on_article=lambda *article: result.append(article))
+    scanner.feed(content)
+    scanner.close()
+    return result[:articles]
+
+
+class TimeoutReader:
+    """
+    asyncio.StreamReader whose every read fails with asyncio.TimeoutError
+    after `timeout` seconds, like a socket timeout: bodies are read in
+    CHUNK_SIZE pieces, so a large one that keeps arriving is not cut off.
+    """
+
+    def __init__(self, reader: asyncio.StreamReader, timeout: float):
+        self.reader = reader
+        self.timeout = timeout
 
-        article_name = re.search(re_name, lnk).group(1)
-        article_link = re.search(re_href, lnk).group(
-            1)
-        article_link = article_link[:article_link.find(r'"', 1)]
-        thread = threading.Thread(
-            target=download_images(article_name, article_link))
-        thread_pool.append(thread)
-        thread.start()
-    GracefulShutdown.wait_threads(thread_pool)
+    async def readline(self) -> bytes:
+        return await asyncio.wait_for(self.reader.readline(), self.timeout)
+
+    async def readexactly(self, size: int) -> bytes:
+        body = bytearray()
+        while len(body) < size:
+            body += await asyncio.wait_for(self.reader.readexactly(
+                min(CHUNK_SIZE, size - len(body))), self.timeout)
+        return bytes(body)
+
+    async def read(self, limit: Optional[int] = None) -> bytes:
+        """ Reads up to EOF or until more than `limit` bytes arrive. """
+        body = bytearray()
+        while chunk := await asyncio.wait_for(self.reader.read(CHUNK_SIZE),
+                                              self.timeout):
+            body += chunk
+            if limit is not None and len(body) > limit:
+                break
+        return bytes(body)
+
+
+class AsyncHttpClient:
+    """
+    Minimal non-blocking HTTP/1.1 GET client on top of asyncio streams.
+
+    At most `concurrency` requests are in flight overall and at most
+    `per_host` of them go to the same host. Like `load_content`, it follows
+    redirects and returns None on HTTP and network errors. `timeout` limits
+    the connection and every read, not the whole request.
+    """
+    def __init__(self, concurrency: int, per_host: int, timeout: float = 10,
+                 max_redirects: int = 5):
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.per_host = per_host
+        self.host_limits = {}
+        self.timeout = timeout
+        self.max_redirects = max_redirects
+        self.ssl = ssl.create_default_context()
+
+    async def get(self, url: str) -> Optional[bytes]:
+        response = await self.fetch(url)
+        if response is None or not 200 <= response.status < 300:
+            return None
+        return response.body
+
+    async def fetch(self, url: str, headers=None,
+                    max_size: Optional[int] = None) -> Optional[Response]:
+        """
+        Returns the response to GET `url` after following redirects, or
+        None on network errors and bodies larger than `max_size` bytes.
+        """
+        for _ in range(self.max_redirects + 1):
+            parts = urllib.parse.urlsplit(url)
+            host_limit = self.host_limits.setdefault(
+                parts.netloc, asyncio.Semaphore(self.per_host))
+            try:
+                async with self.semaphore, host_limit:
+                    response = await self.request(parts, headers, max_size)
+            except (OSError, ValueError, http.client.HTTPException,
+                    asyncio.TimeoutError, asyncio.IncompleteReadError):
+                return None
+            location = response.headers.get('location')
+            if response.status in REDIRECTS and location:
+                url = urllib.parse.urljoin(url, location)
+                continue
+            return response
+        return None
+
+    async def request(self, parts, headers=None,
+                      max_size: Optional[int] = None) -> Response:
+        https = parts.scheme == 'https'
+        port = parts.port or (443 if https else 80)
+        if STATS is None:
+            connect = asyncio.open_connection(
+                parts.hostname, port, ssl=self.ssl if https else None)
+        else:
+            connect = self.timed_connect(parts.hostname, port, https)
+        reader, writer = await asyncio.wait_for(connect, self.timeout)
+        reader = TimeoutReader(reader, self.timeout)
+        started = time.perf_counter()
+        try:
+            target = parts.path or '/'
+            if parts.query:
+                target += '?' + parts.query
+            writer.write((f'GET {target} HTTP/1.1\r\n'
+                          f'Host: {parts.netloc}\r\n'
+                          f'User-Agent: {USER_AGENT}\r\n'
+                          f'Accept-Encoding: identity\r\n'
+                          + ''.join(f'{key}: {value}\r\n'
+                                    for key, value in (headers or {}).items())
+                          + 'Connection: close\r\n\r\n').encode())
+            await asyncio.wait_for(writer.drain(), self.timeout)
+            status, headers = await self.read_head(reader)
+            if STATS is not None:
+                received = time.perf_counter()
+                STATS.record('ttfb', received - started)
+                STATS.count('requests')
+            if headers.get('transfer-encoding', '').lower() == 'chunked':
+                body = await self.read_chunked(reader, max_size)
+            elif 'content-length' in headers:
+                length = int(headers['content-length'])
+                if max_size is not None and length > max_size:
+                    raise ValueError('response body is too large')
+                body = await reader.readexactly(length)
+            else:
+                body = await reader.read(max_size)
+                if max_size is not None and len(body) > max_size:
+                    raise ValueError('response body is too large')
+            if STATS is not None:
+                STATS.record('body', time.perf_counter() - received)
+                STATS.count('bytes', len(body))
+            return Response(status, headers, body)
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except OSError:
+                pass
+
+    async def timed_connect(self, host: str, port: int, https: bool):
+        """
+        Opens a connection like asyncio.open_connection, recording the DNS
+        lookup and the TCP and TLS handshakes as separate stages.
+        """
+        started = time.perf_counter()
+        addresses = await asyncio.get_running_loop().getaddrinfo(
+            host, port, type=socket.SOCK_STREAM)
+        resolved = time.perf_counter()
+        STATS.record('dns', resolved - started)
+        tls = {'ssl': self.ssl, 'server_hostname': host} if https else {}
+        for i, (*_, sockaddr) in enumerate(addresses):
+            try:
+                streams = await asyncio.open_connection(*sockaddr[:2], **tls)
+                break
+            except OSError:
+                if i == len(addresses) - 1:
+                    raise
+        STATS.record('connect', time.perf_counter() - resolved)
+        return streams
+
+    @staticmethod
+    async def read_head(reader):
+        line = await reader.readline()
+        if not line:
+            raise http.client.RemoteDisconnected(
+                'Remote end closed connection without response')
+        parts = line.split(None, 2)
+        if len(parts) < 2 or not parts[0].startswith(b'HTTP/') \
+                or not parts[1].isdigit():
+            raise http.client.BadStatusLine(repr(line))
+        status = int(parts[1])
+        lines = []
+        while (line := await reader.readline()).strip():
+            lines.append(line)
+        headers = http.client.parse_headers(io.BytesIO(b''.join(lines)))
+        return status, headers
+
+    @staticmethod
+    async def read_chunked(reader, max_size=None):
+        body = bytearray()
+        while True:
+            size = int((await reader.readline()).split(b';')[0], 16)
+            if size == 0:
+                while (await reader.readline()).strip():
+                    pass
+                return bytes(body)
+            if max_size is not None and len(body) + size > max_size:
+                raise ValueError('response body is too large')
+            body += await reader.readexactly(size)
+            await reader.readexactly(2)
+
+
+class AsyncGracefulShutdown:
+    """
+    asyncio counterpart of GracefulShutdown: on SIGINT/SIGTERM sets `event`
+    and cancels the scraping task, which cancels all of its downloads.
+    """
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.event = threading.Event()
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signum, self.exit_graceful)
+
+    def exit_graceful(self):
+        self.event.set()
+        self.task.cancel()
+
+
+async def load_content_async(client: AsyncHttpClient, executor, url: str):
+    if CACHE is None:
+        return await client.get(url)
+    # The cache reads and writes blob files: keep that off the event loop.
+    loop = asyncio.get_running_loop()
+    headers = await loop.run_in_executor(executor, CACHE.validators, url)
+    response = await client.fetch(url, headers)
+    return await loop.run_in_executor(executor, CACHE.store, url, response)
+
+
+async def get_images_async(client: AsyncHttpClient, executor, article_link):
+    content = await load_content_async(client, executor,
+                                       f"{HABR}{article_link}")
+    if content is None:
+        return
+    return extract_images(content)
+
+
+async def download_images_async(client: AsyncHttpClient, executor,
+                                name_article, article_link,
+                                max_size=MAX_IMAGE_SIZE):
+    if JOURNAL is not None:
+        if JOURNAL.is_done('article', name_article, article_link):
+            return
+        JOURNAL.start('article', name_article, article_link)
+    images = await get_images_async(client, executor, article_link)
+
+    if images is None:
+        return
+
+    folder = correct_name_folder(name_article)
+    if images:
+        await asyncio.get_running_loop().run_in_executor(
+            executor, partial(os.makedirs, folder, exist_ok=True))
+    if JOURNAL is not None:
+        images = [ref for ref in images
+                  if not JOURNAL.is_done('image', ref, folder)]
+        for ref in images:
+            JOURNAL.queue('image', ref, folder)
+        JOURNAL.done('article', name_article, article_link)
+    await asyncio.gather(*(
+        run_job_async(download_image_async, client, executor, ref, folder,
+                      max_size)
+        for ref in images))
+
+
+async def download_image_async(client: AsyncHttpClient, executor, ref,
+                               folder, max_size=MAX_IMAGE_SIZE):
+    image_name = ref[ref.rfind('/') + 1:]
+    path = os.path.join(folder, image_name)
+    if JOURNAL is not None:
+        JOURNAL.start('image', ref, folder)
+    if IMAGES is None:
+        # Outside of storage() there is no store to share images through.
+        if await fetch_image_async(client, executor, ref, max_size,
+                                   path) is None:
+            return
+    else:
+        future, first = IMAGES.claim(ref)
+        if first:
+            try:
+                future.set_result(
+                    await fetch_image_async(client, executor, ref, max_size))
+            except BaseException as e:
+                future.set_exception(e)
+                raise
+        digest = await asyncio.wrap_future(future)
+        if digest is None:
+            return
+        loop = asyncio.get_running_loop()
+        if not first:
+            await loop.run_in_executor(executor, IMAGES.reuse, digest)
+        await loop.run_in_executor(executor, IMAGES.blobs.link, digest, path)
+    if JOURNAL is not None:
+        JOURNAL.done('image', ref, folder)
+
+
+async def fetch_image_async(client: AsyncHttpClient, executor, ref,
+                            max_size=MAX_IMAGE_SIZE,
+                            path=None) -> Optional[str]:
+    """ fetch_image for the asyncio engine. """
+    loop = asyncio.get_running_loop()
+    if CACHE is not None:
+        digest = await loop.run_in_executor(executor, CACHE.hit_blob, ref)
+        if digest is not None:
+            return digest
+    response = await client.fetch(ref, max_size=max_size)
+    if response is None or not 200 <= response.status < 300:
+        return None
+    if IMAGES is None:
+        await loop.run_in_executor(executor, write_file, path, response.body)
+        return hashlib.sha256(response.body).hexdigest()
+    digest = await loop.run_in_executor(
+        executor, IMAGES.blobs.write, response.body)
+    if CACHE is not None:
+        CACHE.record(ref, response.headers, digest)
+    return digest
+
+
+async def run_job_async(func, client: AsyncHttpClient, executor, *args):
+    """
+    Awaits the download like WorkerPool.run runs a job: a failure is
+    reported and does not cancel the other downloads.
+    """
+    try:
+        await func(client, executor, *args)
+    except Exception as e:
+        print(f'{func.__name__}{args}: {e!r}', file=sys.stderr)
+
+
+async def scrape_async(threads: int, articles: int, per_host: int,
+                       max_size: int = MAX_IMAGE_SIZE) -> None:
+    client = AsyncHttpClient(threads, per_host)
+    AsyncGracefulShutdown(asyncio.current_task())
+    with ThreadPoolExecutor(FILE_WORKERS) as executor:
+        jobs = JOURNAL.pending()
+        if not jobs:
+            content = await load_content_async(client, executor, HABR)
+            if content is None:
+                return
+            jobs = queue_articles(content, articles)
+        await asyncio.gather(*(
+            run_job_async(download_images_async if kind == 'article' else
+                          download_image_async, client, executor, *args,
+                          max_size)
+            for kind, *args in jobs))
+
+
+def run_scraper_async(threads: int, articles: int, out_dir: pathlib.Path,
+                      per_host: int = PER_HOST, cache: bool = True,
+                      max_size: int = MAX_IMAGE_SIZE,
+                      resume: bool = False, stats: bool = False,
+                      report: Optional[str] = None) -> None:
+    if not (os.path.exists(out_dir)):
+        os.makedirs(out_dir, exist_ok=True)
+    with statistics(stats, report), storage(out_dir, cache, resume):
+        os.chdir(out_dir)
+        try:
+            asyncio.run(scrape_async(threads, articles, per_host, max_size))
+        except asyncio.CancelledError:
+            pass
 
 
 def main():
@@ -128,9 +1788,57 @@ def main():
     parser.add_argument(
         'out_dir', type=pathlib.Path, help='Directory to download habr images',
     )
+    parser.add_argument(
+        '--engine', choices=('threads', 'asyncio'), default='threads',
+        help='Run downloads on worker threads or on an asyncio event loop '
+             '(then THREAD_NUMBER limits requests in flight)',
+    )
+    parser.add_argument(
+        '--per-host', type=int, default=PER_HOST,
+        help='Max concurrent connections per host',
+    )
+    parser.add_argument(
+        '--no-cache', dest='cache', action='store_false',
+        help=f'Do not keep responses in OUT_DIRECTORY/{CACHE_DIR} '
+             f'between runs',
+    )
+    parser.add_argument(
+        '--max-size', type=int, default=MAX_IMAGE_SIZE,
+        help='Skip images larger than this many bytes',
+    )
+    parser.add_argument(
+        '--resume', action='store_true',
+        help=f'Continue an interrupted run from OUT_DIRECTORY/{JOURNAL_FILE}',
+    )
+    parser.add_argument(
+        '--adaptive', action='store_true',
+        help='Adapt requests in flight per host to latency and errors, up '
+             'to --per-host (threads engine; give it enough threads)',
+    )
+    parser.add_argument(
+        '--rate', type=float,
+        help='Max requests per second per host (threads engine)',
+    )
+    parser.add_argument(
+        '--stats', action='store_true',
+        help='Show progress on stderr and print latency percentiles per '
+             'stage and throughput at the end',
+    )
+    parser.add_argument(
+        '--stats-json', metavar='PATH',
+        help='Also write the final statistics to PATH as JSON '
+             '(implies --stats)',
+    )
     args = parser.parse_args()
 
-    run_scraper(args.threads, args.n, args.out_dir)
+    if args.engine == 'asyncio':
+        run_scraper_async(args.threads, args.n, args.out_dir, args.per_host,
+                          args.cache, args.max_size, args.resume,
+                          args.stats, args.stats_json)
+    else:
+        run_scraper(args.threads, args.n, args.out_dir, args.per_host,
+                    args.cache, args.max_size, args.resume, args.adaptive,
+                    args.rate, args.stats, args.stats_json)
 
 
 if __name__ == '__main__':
@@ -2,31 +2,473 @@
 
 from __future__ import annotations
 from pathlib import Path
-from typing import TextIO, Text
+from typing import BinaryIO, TextIO, Text
 import os.path
 from datetime import datetime
+import bz2
+import errno
+import gzip
+import hashlib
+import io
+import lzma
+import mmap
+import queue
+import re
+import shutil
 import struct
 import sys
+import tempfile
+import threading
+import time
+import zlib
+from bisect import bisect_right
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+IndexEntry = namedtuple(
+    'IndexEntry', ['header_offset', 'data_offset', 'size', 'type'])
+ManifestEntry = namedtuple(
+    'ManifestEntry', ['name', 'size', 'checksum_ok', 'digest'])
+
+_MAX_COPY = 2**30
+_SIGNED_HEADER = struct.Struct('148b8x356b')
+_USTAR_HEADER = struct.Struct('100s8s8s8s12s12s8sc100s6s2s32s32s8s8s155s12x')
+_SMALL_COPY = 2**16
+_UNSUPPORTED_COPY = (errno.EXDEV, errno.ENOSYS, errno.EINVAL,
+                     errno.EOPNOTSUPP, errno.EBADF)
+
+
+def _copy_file_range(src_fd: int, dst_fd: int, offset: int, count: int) -> int:
+    return os.copy_file_range(src_fd, dst_fd, count, offset)
+
+
+def _sendfile(src_fd: int, dst_fd: int, offset: int, count: int) -> int:
+    return os.sendfile(dst_fd, src_fd, offset, count)
+
+
+_ZERO_COPY_CALLS = [call for name, call in (
+    ('copy_file_range', _copy_file_range),
+    ('sendfile', _sendfile),
+) if hasattr(os, name)]
+
+
+def copy_file_data(src_fd: int, dst_fd: int, offset: int, size: int) -> None:
+    '''
+    Копирует `size' байт, начиная со смещения `offset', из дескриптора
+    `src_fd' в текущую позицию дескриптора `dst_fd'. Данные копируются ядром
+    (copy_file_range/sendfile), а если это невозможно — через mmap.
+    Позиция `src_fd' не меняется, поэтому один дескриптор архива можно
+    использовать из нескольких потоков
+    '''
+    if size <= _SMALL_COPY:
+        pread_copy(src_fd, dst_fd, offset, size)
+        return
+    end = offset + size
+    for call in _ZERO_COPY_CALLS:
+        try:
+            while offset < end:
+                copied = call(src_fd, dst_fd, offset,
+                              min(end - offset, _MAX_COPY))
+                if copied == 0:
+                    raise EOFError(offset)
+                offset += copied
+            return
+        except OSError as e:
+            if e.errno not in _UNSUPPORTED_COPY:
+                raise
+    mmap_copy(src_fd, dst_fd, offset, end - offset)
+
+
+def pread_copy(src_fd: int, dst_fd: int, offset: int, size: int) -> None:
+    '''
+    Копирует небольшой фрагмент `src_fd' в `dst_fd' одним чтением по
+    смещению: для маленьких файлов это дешевле copy_file_range
+    '''
+    data = os.pread(src_fd, size, offset)
+    if len(data) < size:
+        raise EOFError(offset)
+    with memoryview(data) as view:
+        pos = 0
+        while pos < size:
+            pos += os.write(dst_fd, view[pos:])
+
+
+def mmap_copy(src_fd: int, dst_fd: int, offset: int, size: int) -> None:
+    '''
+    Копирует `size' байт из `src_fd' в `dst_fd' через отображение в память
+    '''
+    if size <= 0:
+        return
+    start = offset - offset % mmap.ALLOCATIONGRANULARITY
+    with mmap.mmap(src_fd, offset + size - start, access=mmap.ACCESS_READ,
+                   offset=start) as mapped:
+        with memoryview(mapped) as view:
+            pos = offset - start
+            while pos < len(view):
+                pos += os.write(dst_fd, view[pos:pos + _MAX_COPY])
+
+
+# Сигнатура bzip2 — не только 'BZh' и уровень сжатия, но и магическое число
+# первого блока (или конца пустого потока): с 'BZh' может начинаться имя
+# первого файла несжатого архива
+_COMPRESSION_MAGIC = (
+    (re.compile(re.escape(b'\x1f\x8b\x08')), 'gz'),
+    (re.compile(b'BZh[1-9](?:1AY&SY|' + re.escape(b'\x17rE8P\x90') + b')'),
+     'bz2'),
+    (re.compile(re.escape(b'\xfd7zXZ\x00')), 'xz'),
+    (re.compile(re.escape(b'\x28\xb5\x2f\xfd')), 'zst'),
+)
+_DECOMPRESSORS = {
+    'gz': lambda: zlib.decompressobj(wbits=31),
+    'bz2': bz2.BZ2Decompressor,
+    'xz': lzma.LZMADecompressor,
+}
+
+
+def detect_compression(filename: str) -> str | None:
+    '''
+    Определяет сжатие файла `filename' по сигнатуре: 'gz', 'bz2', 'xz' или
+    None для несжатого архива
+    '''
+    with open(filename, 'rb') as f:
+        magic = f.read(10)
+    for signature, compression in _COMPRESSION_MAGIC:
+        if signature.match(magic):
+            if compression not in _DECOMPRESSORS:
+                raise ValueError(
+                    f'{compression} compression is not supported')
+            return compression
+    return None
+
+
+Checkpoint = namedtuple('Checkpoint', ['position', 'offset', 'state'])
+
+
+class DecompressedFile(io.RawIOBase):
+    '''
+    Сжатый файл, открытый на чтение, распаковываемый на лету ограниченными
+    порциями. Поддерживает seek: распаковка начинается с ближайшей
+    контрольной точки перед нужной позицией. Контрольные точки ставятся на
+    границах сжатых потоков (их можно сохранить в индексе) и, для gzip,
+    через каждые `span' байт распакованных данных (копии состояния zlib)
+    '''
+    _CHUNK = 2**16
+    _SKIP_CHUNK = 2**20
+
+    def __init__(self, filename: str, compression: str,
+                 checkpoints: list | None = None, span: int = 2**25):
+        super().__init__()
+        self._file = open(filename, 'rb')
+        self._new_decompressor = _DECOMPRESSORS[compression]
+        self.checkpoints = checkpoints if checkpoints else [
+            Checkpoint(0, 0, None)]
+        self._span = span
+        self._restart(self.checkpoints[0])
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def close(self) -> None:
+        self._file.close()
+        super().close()
+
+    def tell(self) -> int:
+        return self._pos
+
+    def readinto(self, buffer) -> int:
+        filled = 0
+        while filled < len(buffer):
+            data = self._decompress(len(buffer) - filled)
+            if not data:
+                break
+            buffer[filled:filled + len(data)] = data
+            filled += len(data)
+        return filled
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        if whence == os.SEEK_CUR:
+            offset += self._pos
+        elif whence == os.SEEK_END:
+            while self._decompress(self._SKIP_CHUNK):
+                pass
+            offset += self._pos
+        index = bisect_right(self.checkpoints, offset,
+                             key=lambda c: c.position) - 1
+        checkpoint = self.checkpoints[max(index, 0)]
+        if offset < self._pos or checkpoint.position > self._pos:
+            self._restart(checkpoint)
+        while self._pos < offset:
+            if not self._decompress(min(offset - self._pos,
+                                        self._SKIP_CHUNK)):
+                break
+        return self._pos
+
+    def _restart(self, checkpoint: Checkpoint) -> None:
+        self._file.seek(checkpoint.offset)
+        self._input = b''
+        self._decompressor = (checkpoint.state.copy() if checkpoint.state
+                              else self._new_decompressor())
+        self._pos = checkpoint.position
+        self._eof = False
+
+    def _compressed_offset(self) -> int:
+        return self._file.tell() - len(self._input)
+
+    def _add_checkpoint(self, state=None) -> None:
+        if self._pos > self.checkpoints[-1].position:
+            self.checkpoints.append(
+                Checkpoint(self._pos, self._compressed_offset(), state))
+
+    def _decompress(self, size: int) -> bytes:
+        while not self._eof:
+            decompressor = self._decompressor
+            if hasattr(decompressor, 'unconsumed_tail'):
+                if not self._input:
+                    self._input = self._file.read(self._CHUNK)
+                data = self._input
+                if not data:
+                    raise EOFError('compressed archive is truncated')
+                out = decompressor.decompress(data, size)
+                self._input = decompressor.unconsumed_tail
+            else:
+                data = b''
+                if decompressor.needs_input:
+                    data = self._input or self._file.read(self._CHUNK)
+                    self._input = b''
+                    if not data:
+                        raise EOFError('compressed archive is truncated')
+                out = decompressor.decompress(data, max_length=size)
+            self._pos += len(out)
+            if decompressor.eof:
+                self._next_stream(decompressor.unused_data)
+            elif (hasattr(decompressor, 'copy') and self._pos
+                    >= self.checkpoints[-1].position + self._span):
+                self._add_checkpoint(decompressor.copy())
+            if out:
+                return out
+        return b''
+
+    def _next_stream(self, data: bytes) -> None:
+        data = data.lstrip(b'\x00')
+        while not data:
+            data = self._file.read(self._CHUNK)
+            if not data:
+                self._input = b''
+                self._eof = True
+                return
+            data = data.lstrip(b'\x00')
+        self._input = data
+        self._decompressor = self._new_decompressor()
+        self._add_checkpoint()
+
+
+class MemberFile(io.RawIOBase):
+    '''
+    Файл только для чтения, ограниченный данными одного элемента архива.
+    Данные несжатого архива читаются по смещению (preadv) сразу в буфер
+    вызывающего, без промежуточных копий. Для разреженного файла `sparse' —
+    список фрагментов (смещение, длина), хранящихся в архиве подряд; дыры
+    между ними читаются как нули
+    '''
+
+    def __init__(self, archive, offset: int, size: int,
+                 sparse: list | None = None, close_archive: bool = True):
+        super().__init__()
+        self._archive = archive
+        self._close_archive = close_archive
+        self._offset = offset
+        self._size = size
+        self._pos = 0
+        self._fd = (archive.fileno()
+                    if not isinstance(archive, DecompressedFile) else None)
+        self._segments = None
+        if sparse is not None:
+            self._segments = []
+            stored = offset
+            for segment_offset, length in sparse:
+                self._segments.append((segment_offset, length, stored))
+                stored += length
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def close(self) -> None:
+        if self._close_archive:
+            self._archive.close()
+        super().close()
+
+    def tell(self) -> int:
+        return self._pos
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        if whence == os.SEEK_CUR:
+            offset += self._pos
+        elif whence == os.SEEK_END:
+            offset += self._size
+        if offset < 0:
+            raise ValueError(f'negative seek position {offset}')
+        self._pos = offset
+        return self._pos
+
+    def readinto(self, buffer) -> int:
+        size = min(len(buffer), self._size - self._pos)
+        if size <= 0:
+            return 0
+        with memoryview(buffer) as view:
+            view = view.cast('B')[:size]
+            if self._segments is None:
+                read = self._read_at(view, self._offset + self._pos)
+            else:
+                read = self._read_sparse(view)
+        self._pos += read
+        return read
+
+    def _read_at(self, view: memoryview, offset: int) -> int:
+        if self._fd is None:
+            self._archive.seek(offset)
+            return self._archive.readinto(view)
+        return os.preadv(self._fd, [view], offset)
+
+    def _read_sparse(self, view: memoryview) -> int:
+        index = bisect_right(self._segments, self._pos,
+                             key=lambda segment: segment[0]) - 1
+        if index >= 0:
+            start, length, stored = self._segments[index]
+            if self._pos < start + length:
+                size = min(len(view), start + length - self._pos)
+                return self._read_at(view[:size], stored + self._pos - start)
+        if index + 1 < len(self._segments):
+            hole_end = self._segments[index + 1][0]
+        else:
+            hole_end = self._size
+        size = min(len(view), hole_end - self._pos)
+        view[:size] = bytes(size)
+        return size
+
+
+def parse_number(field: bytes) -> int:
+    '''
+    Разбирает числовое поле заголовка: восьмеричное число, дополненное
+    пробелами и NUL, или двоичное (base-256) представление GNU tar для
+    значений, не помещающихся в поле
+    '''
+    if field and field[0] & 0x80:
+        return int.from_bytes(field[1:], 'big')
+    return int(field.rstrip(b' \x00') or b'0', base=8)
+
+
+def verify_checksum(header: bytes) -> bool:
+    '''
+    Проверяет контрольную сумму заголовка: сумму его байтов, в которой
+    поле самой суммы считается заполненным пробелами. Старые версии tar
+    считали байты знаковыми, такая сумма тоже принимается
+    '''
+    stored = parse_number(header[148:156])
+    unsigned = sum(header[:148]) + sum(header[156:]) + 8 * ord(' ')
+    signed = sum(_SIGNED_HEADER.unpack(header)) + 8 * ord(' ')
+    return stored in (unsigned, signed)
+
+
+def parse_pax(payload: bytes, records: dict | None = None) -> dict:
+    '''
+    Разбирает записи расширенного заголовка PAX ("%d %s=%s\\n") и добавляет
+    их в словарь `records'. Повторяющиеся ключи разреженного формата 0.0
+    (GNU.sparse.offset/GNU.sparse.numbytes) собираются в GNU.sparse.map
+    '''
+    records = {} if records is None else records
+    pos = 0
+    while pos < len(payload):
+        space = payload.find(b' ', pos)
+        if space < 0 or not payload[pos:space].isdigit():
+            break
+        length = int(payload[pos:space])
+        if length <= 0:
+            break
+        record = payload[space + 1:pos + length - 1]
+        pos += length
+        key, _, value = record.partition(b'=')
+        key = key.decode()
+        value = value.decode('utf-8', errors='surrogateescape')
+        if key in ('GNU.sparse.offset', 'GNU.sparse.numbytes'):
+            sparse_map = records.get('GNU.sparse.map')
+            records['GNU.sparse.map'] = (
+                value if not sparse_map else f'{sparse_map},{value}')
+        elif value:
+            records[key] = value
+        else:
+            records.pop(key, None)
+    return records
+
+
+def parse_sparse_map(numbers: str) -> list:
+    '''
+    Превращает строку "смещение,длина,смещение,длина,..." в список пар
+    '''
+    numbers = [int(number) for number in numbers.split(',') if number]
+    return list(zip(numbers[::2], numbers[1::2]))
+
+
+def decode_name(header: bytes) -> str:
+    '''
+    Возвращает имя из заголовка с учётом поля prefix формата ustar
+    '''
+    name = header[:100].split(b'\x00', 1)[0]
+    if header[257:263] == b'ustar\x00':
+        prefix = header[345:500].split(b'\x00', 1)[0]
+        if prefix:
+            name = prefix + b'/' + name
+    return name.decode(errors='surrogateescape')
 
 
 class ArchiveItem:
+    __slots__ = ('name', 'file_mode', 'own_id', 'group_id', 'size', 'mtime',
+                 'checksum', 'type_flag', 'type', 'linked_file_name',
+                 'user_name', 'group_name', 'sparse', 'sparse_map_size')
+
     def __init__(self, header: bytes):
-        self.name = header[0].decode()
+        self.name = header[0].decode(errors='surrogateescape')
         self.file_mode = header[1].decode()
         self.own_id = header[2].decode()
         self.group_id = header[3].decode()
-        self.size = int(header[4].decode(), base=8)
-        self.mod_time = datetime.fromtimestamp(
-            int(header[5], base=8)).strftime('%d %b %Y %H:%M:%S')
+        self.size = parse_number(header[4])
+        self.mtime = parse_number(header[5])
         self.checksum = int(header[6].decode(), base=8)
-        self.type = TarParser._FILE_TYPES[header[7]]
+        self.type_flag = header[7] or b'0'
+        self.type = TarParser._FILE_TYPES[self.type_flag]
         self.linked_file_name = header[8].decode()
         self.user_name = header[11].decode()
         self.group_name = header[12].decode()
-        self.content = ""
+        self.sparse = None
+        self.sparse_map_size = 0
 
-    def save_item_content(self, content_as_bytes: bytes) -> None:
-        self.content = content_as_bytes.decode('ascii', errors='ignore')
+    def apply_extended(self, records: dict) -> None:
+        '''
+        Применяет записи длинных имён GNU и расширенных заголовков PAX
+        '''
+        self.name = records.get('GNU.sparse.name',
+                                records.get('path', self.name))
+        self.linked_file_name = records.get('linkpath', self.linked_file_name)
+        self.own_id = records.get('uid', self.own_id)
+        self.group_id = records.get('gid', self.group_id)
+        self.user_name = records.get('uname', self.user_name)
+        self.group_name = records.get('gname', self.group_name)
+        if 'mtime' in records:
+            self.mtime = int(float(records['mtime']))
+        if 'size' in records:
+            self.size = int(records['size'])
+        if 'GNU.sparse.map' in records:
+            self.sparse = parse_sparse_map(records['GNU.sparse.map'])
+        real_size = records.get('GNU.sparse.realsize',
+                                records.get('GNU.sparse.size'))
+        if real_size is not None:
+            self.size = int(real_size)
 
     def get_item_info(self) -> list:
         return [
@@ -42,12 +484,27 @@ class ArchiveItem:
             ('Group name', self.group_name),
         ]
 
+    @property
+    def mod_time(self) -> str:
+        return datetime.fromtimestamp(
+            self.mtime).strftime('%d %b %Y %H:%M:%S')
+
 
 class TarParser:
     _HEADER_FMT1 = '100s8s8s8s12s12s8sc100s255s'
     _HEADER_FMT2 = '6s2s32s32s8s8s155s12s'
     _HEADER_FMT3 = '6s2s32s32s8s8s12s12s112s31x'
-    _READ_BLOCK = 16 * 2**20
+    _COPY_CHUNK = 2**20
+    _SCAN_BLOCK = 2**17
+    _VERIFY_QUEUE = 16
+    _DIR_TYPES = (b'5', b'D')
+    _LINK_TYPES = (b'1', b'2')
+    _EXTENDED_TYPES = (b'L', b'K', b'x', b'g')
+
+    _INDEX_MAGIC = b'TARIDX02'
+    _INDEX_HEAD = struct.Struct('<8sQqI')
+    _INDEX_CHECKPOINT = struct.Struct('<QQ')
+    _INDEX_ENTRY = struct.Struct('<QQQcI')
 
     _FILE_TYPES = {
         b'0': 'Regular file',
@@ -64,52 +521,512 @@ class TarParser:
         b'M': 'Continue of last file',
         b'N': 'Rename/symlink command',
         b'S': "`sparse' regular file",
-        b'V': "`name' is tape/volume header name"
+        b'V': "`name' is tape/volume header name",
+        b'g': 'Global extended header',
+        b'x': 'Extended header',
     }
 
-    def __init__(self, filename: str):
+    def __init__(self, filename: str, index_path: str | None = None):
         '''
         Открывает tar-архив `filename' и производит его предобработку
-        (если требуется)
+        (если требуется). Если указан `index_path', индекс заголовков
+        архива загружается из этого файла (или сохраняется в него, если
+        файла нет или он устарел)
         '''
-        self.saved_items = {}
-        self.extract_archive_items(filename)
+        self.filename = filename
+        self.compression = detect_compression(filename)
+        self.checkpoints = [Checkpoint(0, 0, None)]
+        self.index = {}
+        if index_path is None or not self.load_index(index_path):
+            self.extract_archive_items(filename)
+            if index_path is not None:
+                self.save_index(index_path)
 
-    def extract(self, dest: Path = os.getcwd()) -> None:
+    def extract(self, dest: Path = os.getcwd(), workers: int = 1) -> None:
         '''
-        Распаковывает данный tar-архив в каталог `dest'
+        Распаковывает данный tar-архив в каталог `dest'. Сначала создаются
+        все каталоги (родительские раньше вложенных), затем файлы копируются
+        в `workers' потоков, разделяющих один дескриптор архива, после них
+        создаются ссылки. Сжатый архив распаковывается за один
+        последовательный проход
         '''
-        for archive_item in self.saved_items.values():
-            if 'directory' in archive_item.type.lower():
-                os.mkdir(os.path.join(dest, archive_item.name))
+        directories = set()
+        files = []
+        links = []
+        for name, entry in self.index.items():
+            if entry.type in self._DIR_TYPES:
+                directories.add(name.rstrip('/'))
+            elif entry.type in self._LINK_TYPES:
+                links.append(name)
+            else:
+                files.append(name)
+            parent = os.path.dirname(name.rstrip('/'))
+            while parent and parent not in directories:
+                directories.add(parent)
+                parent = os.path.dirname(parent)
+        directories = sorted(directories, key=lambda d: d.count('/'))
+        os.makedirs(dest, exist_ok=True)
+        for directory in directories:
+            os.makedirs(os.path.join(dest, directory), exist_ok=True)
+
+        if self.compression is not None:
+            files.sort(key=lambda name: self.index[name].data_offset)
+            workers = 1
+
+        with self.open_archive() as archive:
+            extract_member = partial(self.extract_member, archive, dest)
+            if workers > 1:
+                with ThreadPoolExecutor(workers) as pool:
+                    for _ in pool.map(extract_member, files):
+                        pass
             else:
-                with open(os.path.join(dest, archive_item.name), 'w') as f:
-                    f.write(archive_item.content)
+                for name in files:
+                    extract_member(name)
+
+            for name in links:
+                self.extract_link(archive, dest, name)
+
+            # Заголовки каталогов читаются в порядке архива: сжатый архив
+            # не распаковывается заново ради каждого каталога
+            names = {}
+            for directory in directories:
+                name = directory + '/'
+                if name not in self.index:
+                    name = directory
+                entry = self.index.get(name)
+                if entry is not None and entry.type in self._DIR_TYPES:
+                    names[name] = directory
+            attributes = {names[name]: archive_item for name, archive_item
+                          in self.read_headers(archive, names)}
+            for directory in reversed(directories):
+                if directory in attributes:
+                    self.set_attributes(os.path.join(dest, directory),
+                                        attributes[directory])
+
+    def extract_member(self, archive, dest: Path, filename: str) -> None:
+        '''
+        Распаковывает файл `filename' в каталог `dest', читая данные из
+        открытого архива `archive' (несжатый архив читается по смещению,
+        без изменения позиции дескриптора)
+        '''
+        entry = self.get_entry(filename)
+        path = os.path.join(dest, filename)
+        archive_item = self.read_header(archive, entry)
+        self.extract_file(archive, entry, archive_item, path)
+        self.set_attributes(path, archive_item)
+
+    def extract_link(self, archive, dest: Path, filename: str) -> None:
+        '''
+        Создаёт символическую или жёсткую ссылку `filename' в каталоге `dest'
+        '''
+        entry = self.get_entry(filename)
+        path = os.path.join(dest, filename)
+        target = self.read_header(archive, entry).linked_file_name
+        if os.path.lexists(path):
+            os.remove(path)
+        if entry.type == b'2':
+            os.symlink(target, path)
+        else:
+            os.link(os.path.join(dest, target), path)
+
+    def extract_file(self, archive, entry: IndexEntry,
+                     archive_item: ArchiveItem, path: str) -> None:
+        """
+        Копирует данные элемента архива `entry' в файл `path'. Фрагменты
+        разреженного файла записываются по своим смещениям, дыры между ними
+        не заполняются, и файл на диске остаётся разреженным
+        """
+        with open(path, 'wb') as f:
+            if archive_item.sparse is None:
+                self.copy_data(archive, entry.data_offset, entry.size, f)
+                return
+            stored = entry.data_offset + archive_item.sparse_map_size
+            for offset, length in archive_item.sparse:
+                f.seek(offset)
+                self.copy_data(archive, stored, length, f)
+                stored += length
+            f.truncate(archive_item.size)
+
+    def copy_data(self, archive, offset: int, size: int, f) -> None:
+        """
+        Копирует `size' байт архива со смещения `offset' в текущую позицию
+        открытого файла `f'
+        """
+        if self.compression is None:
+            copy_file_data(archive.fileno(), f.fileno(), offset, size)
+        else:
+            archive.seek(offset)
+            for chunk in self.read_chunks(archive, size):
+                f.write(chunk)
+
+    @staticmethod
+    def set_attributes(path: str, archive_item: ArchiveItem) -> None:
+        """
+        Устанавливает права доступа и время модификации из заголовка
+        """
+        os.chmod(path, int(archive_item.file_mode or '0', base=8) & 0o7777)
+        os.utime(path, (archive_item.mtime, archive_item.mtime))
+
+    def read_member(self, filename: str, chunk_size: int = _COPY_CHUNK):
+        '''
+        Возвращает итератор по содержимому файла `filename' из архива,
+        читая его из архива кусками не больше `chunk_size' байт
+        '''
+        with self.open_member(filename) as member:
+            while chunk := member.read(chunk_size):
+                yield chunk
+
+    def open_member(self, filename: str) -> MemberFile:
+        '''
+        Открывает файл `filename' из архива на чтение. Возвращаемый объект
+        поддерживает seek и читает только данные этого файла
+        '''
+        entry = self.get_entry(filename)
+        archive = self.open_archive()
+        try:
+            archive_item = self.read_header(archive, entry)
+        except BaseException:
+            archive.close()
+            raise
+        return self.member_file(archive, entry, archive_item)
+
+    @staticmethod
+    def member_file(archive, entry: IndexEntry, archive_item: ArchiveItem,
+                    close_archive: bool = True) -> MemberFile:
+        '''
+        Создаёт MemberFile для элемента `entry' открытого архива `archive'
+        '''
+        if archive_item.sparse is None:
+            return MemberFile(archive, entry.data_offset, entry.size,
+                              close_archive=close_archive)
+        return MemberFile(
+            archive, entry.data_offset + archive_item.sparse_map_size,
+            archive_item.size, archive_item.sparse, close_archive)
+
+    @staticmethod
+    def read_chunks(file, size: int, chunk_size: int = _COPY_CHUNK):
+        '''
+        Читает `size' байт из текущей позиции `file' кусками не больше
+        `chunk_size' байт
+        '''
+        while size > 0:
+            chunk = file.read(min(chunk_size, size))
+            if not chunk:
+                raise EOFError(file.name if hasattr(file, 'name') else file)
+            size -= len(chunk)
+            yield chunk
+
+    def open_archive(self):
+        '''
+        Открывает архив на чтение. Сжатый архив распаковывается на лету,
+        контрольные точки распаковки общие для всех открытых копий
+        '''
+        if self.compression is None:
+            return open(self.filename, 'rb')
+        return DecompressedFile(self.filename, self.compression,
+                                self.checkpoints)
+
+    def read_at(self, archive, offset: int, size: int) -> bytes:
+        '''
+        Читает `size' байт архива, начиная со смещения `offset'
+        '''
+        if self.compression is None:
+            return os.pread(archive.fileno(), size, offset)
+        archive.seek(offset)
+        return archive.read(size)
 
     def extract_archive_items(self, filename: str) -> None:
         """
-        Извлекает объекты (директории и файлы) их архива
+        Извлекает объекты (директории и файлы) из архива. Содержимое файлов
+        не читается: запоминаются только заголовки и смещения данных.
+        Сжатый архив распаковывается один раз, по пути запоминаются
+        контрольные точки распаковки
         """
-        with open(filename, 'rb') as file:
-            end = file.seek(0, os.SEEK_END)
-            file.seek(0)
-            while file.tell() <= self._READ_BLOCK and file.tell() < end:
-                header = file.read(512)
-                if header.startswith(b'\x00'):
-                    continue
+        with self.open_archive() as file:
+            for header_offset, header, data_offset, size, records \
+                    in self.iter_headers(file):
+                name = records.get('path') or decode_name(header)
+                type_flag = header[156:157].replace(b'\x00', b'0')
+                if 'GNU.sparse.name' in records:
+                    name = records['GNU.sparse.name']
+                if ('GNU.sparse.map' in records
+                        or 'GNU.sparse.major' in records):
+                    type_flag = b'S'
+                self.index[name] = IndexEntry(
+                    header_offset, data_offset, size, type_flag)
+
+    def iter_headers(self, file, offset: int = 0, block: int = _SCAN_BLOCK):
+        """
+        Итератор по элементам архива, начиная со смещения `offset':
+        (смещение первого заголовка элемента, его основной заголовок,
+        смещение данных, размер данных, записи расширенных заголовков).
+        Длинные имена GNU ('L'/'K') и заголовки PAX ('x'/'g') применяются к
+        следующему заголовку, карта старого разреженного формата GNU ('S')
+        переводится в запись GNU.sparse.map. Архив читается блоками по
+        `block' байт, заголовки небольших файлов берутся прямо из
+        прочитанного блока; данные больших файлов пропускаются
+        """
+        buffer = b''
+        buffer_offset = 0
+
+        def read(offset: int, size: int) -> bytes:
+            nonlocal buffer, buffer_offset
+            pos = offset - buffer_offset
+            if pos < 0 or pos + size > len(buffer):
+                buffer = self.read_at(file, offset, max(size, block))
+                buffer_offset = offset
+                pos = 0
+            return buffer[pos:pos + size]
+
+        global_records = {}
+        records = {}
+        member_offset = None
+        while True:
+            header = read(offset, 512)
+            if len(header) < 512:
+                return
+            if header[0] == 0:
+                offset += 512
+                continue
+            type_flag = header[156:157]
+            size = parse_number(header[124:136])
+            data_offset = offset + 512
+            if type_flag in self._EXTENDED_TYPES:
+                payload = read(data_offset, size)
+                if type_flag == b'g':
+                    parse_pax(payload, global_records)
                 else:
-                    archive_item = self.create_archive_item(header)
-                    archive_item.save_item_content(
-                        file.read(archive_item.size))
-                    self.save_archive_item(archive_item)
-                    new_pointer = (512 - archive_item.size) % 512
-                    file.seek(new_pointer, 1)
+                    if member_offset is None:
+                        member_offset = offset
+                    if type_flag == b'x':
+                        parse_pax(payload, records)
+                    else:
+                        key = 'path' if type_flag == b'L' else 'linkpath'
+                        records[key] = payload.split(b'\x00', 1)[0].decode(
+                            errors='surrogateescape')
+                offset = data_offset + -(-size // 512) * 512
+                continue
+
+            if type_flag == b'S':
+                sparse = [header[386 + i:398 + i] + header[398 + i:410 + i]
+                          for i in range(0, 96, 24)]
+                is_extended = header[482]
+                while is_extended:
+                    extension = read(data_offset, 512)
+                    if len(extension) < 512:
+                        return
+                    data_offset += 512
+                    sparse += [extension[i:i + 24] for i in range(0, 504, 24)]
+                    is_extended = extension[504]
+                records['GNU.sparse.map'] = ','.join(
+                    f'{parse_number(entry[:12])},{parse_number(entry[12:])}'
+                    for entry in sparse if entry.strip(b'\x00'))
+                records['GNU.sparse.size'] = str(parse_number(header[483:495]))
+
+            records = {**global_records, **records}
+            size = int(records.get('size', size))
+            yield (offset if member_offset is None else member_offset,
+                   header, data_offset, size, records)
+            offset = data_offset + -(-size // 512) * 512
+            records = {}
+            member_offset = None
 
-    def save_archive_item(self, archive_item: ArchiveItem) -> None:
+    def get_entry(self, filename: str) -> IndexEntry:
         """
-        Cохраняет элементы архива
+        Возвращает запись индекса для файла `filename'
         """
-        self.saved_items[archive_item.name] = archive_item
+        if filename not in self.index.keys():
+            raise ValueError(filename)
+        return self.index[filename]
+
+    def get_item(self, filename: str) -> ArchiveItem:
+        """
+        Перечитывает заголовок файла `filename' из архива
+        """
+        entry = self.get_entry(filename)
+        with self.open_archive() as archive:
+            archive_item = self.read_header(archive, entry)
+        archive_item.name = filename
+        return archive_item
+
+    def read_header(self, archive, entry: IndexEntry) -> ArchiveItem:
+        """
+        Читает заголовок элемента архива `entry' из открытого архива вместе
+        с предшествующими ему расширенными заголовками
+        """
+        return self.load_header(archive, entry)[1]
+
+    def read_headers(self, archive, filenames: iter):
+        """
+        Итератор по (имя, ArchiveItem) для файлов `filenames' открытого
+        архива. Заголовки читаются в порядке их смещений, так что сжатый
+        архив распаковывается за один проход, а не с начала для каждого файла
+        """
+        entries = sorted((self.get_entry(name), name) for name in filenames)
+        for entry, filename in entries:
+            archive_item = self.read_header(archive, entry)
+            archive_item.name = filename
+            yield filename, archive_item
+
+    def load_header(self, archive,
+                    entry: IndexEntry) -> tuple[bytes, ArchiveItem]:
+        """
+        То же, что read_header, но возвращает ещё и сам блок заголовка
+        """
+        _, header, data_offset, _, records = next(self.iter_headers(
+            archive, entry.header_offset, 512))
+        archive_item = self.create_archive_item(header)
+        archive_item.apply_extended(records)
+        if records.get('GNU.sparse.major') == '1':
+            archive_item.sparse, archive_item.sparse_map_size = \
+                self.read_sparse_map(archive, data_offset)
+        return header, archive_item
+
+    def verify(self, algorithm: str | None = None,
+               workers: int = os.cpu_count() or 1) -> list:
+        """
+        Проверяет контрольные суммы заголовков и, если задан `algorithm'
+        (например, 'sha256' или 'blake2b'), хэширует содержимое файлов.
+        Архив читается одним потоком, прочитанные куски передаются `workers'
+        потокам, считающим хэши (hashlib отпускает GIL на больших блоках).
+        Возвращает манифест — список ManifestEntry в порядке архива
+        """
+        if algorithm is not None:
+            hashlib.new(algorithm)
+        entries = sorted(self.index.items(),
+                         key=lambda item: item[1].header_offset)
+        manifest = [None] * len(entries)
+        queues = []
+        threads = []
+        if algorithm is not None:
+            for _ in range(max(workers, 1)):
+                tasks = queue.Queue(self._VERIFY_QUEUE)
+                thread = threading.Thread(
+                    target=self.hash_worker,
+                    args=(tasks, algorithm, manifest), daemon=True)
+                thread.start()
+                queues.append(tasks)
+                threads.append(thread)
+
+        try:
+            with self.open_archive() as archive:
+                for i, (name, entry) in enumerate(entries):
+                    header, archive_item = self.load_header(archive, entry)
+                    manifest[i] = ManifestEntry(
+                        name, archive_item.size,
+                        verify_checksum(header), None)
+                    if not queues or entry.type in (
+                            *self._DIR_TYPES, *self._LINK_TYPES):
+                        continue
+                    tasks = queues[i % len(queues)]
+                    member = self.member_file(
+                        archive, entry, archive_item, close_archive=False)
+                    while chunk := member.read(self._COPY_CHUNK):
+                        tasks.put((i, chunk))
+                    tasks.put((i, None))
+        finally:
+            for tasks in queues:
+                tasks.put(None)
+            for thread in threads:
+                thread.join()
+        return manifest
+
+    @staticmethod
+    def hash_worker(tasks: queue.Queue, algorithm: str,
+                    manifest: list) -> None:
+        """
+        Считает хэши кусков из очереди `tasks'; кусок None завершает файл
+        """
+        hashes = {}
+        while (task := tasks.get()) is not None:
+            i, chunk = task
+            if i not in hashes:
+                hashes[i] = hashlib.new(algorithm)
+            if chunk is None:
+                digest = hashes.pop(i).hexdigest()
+                manifest[i] = manifest[i]._replace(digest=digest)
+            else:
+                hashes[i].update(chunk)
+
+    def read_sparse_map(self, archive, offset: int) -> tuple[list, int]:
+        """
+        Читает карту разреженного файла формата PAX 1.0, записанную в начале
+        его данных. Возвращает карту и занимаемый ею размер
+        """
+        data = b''
+        while True:
+            block = self.read_at(archive, offset + len(data), 512)
+            if len(block) < 512:
+                raise EOFError('sparse map is truncated')
+            data += block
+            numbers = data.split(b'\n')[:-1]
+            if numbers and len(numbers) >= 2 * int(numbers[0]) + 1:
+                count = int(numbers[0])
+                return (parse_sparse_map(','.join(
+                    number.decode() for number in numbers[1:2 * count + 1])),
+                    len(data))
+
+    def load_index(self, index_path: str) -> bool:
+        """
+        Загружает индекс заголовков из файла `index_path'. Возвращает False,
+        если файла нет, он повреждён или не соответствует архиву
+        (изменились размер или время модификации архива). Вместе с индексом
+        загружаются контрольные точки распаковки сжатого архива
+        """
+        try:
+            with open(index_path, 'rb') as f:
+                data = f.read()
+        except OSError:
+            return False
+        if len(data) < self._INDEX_HEAD.size:
+            return False
+        magic, size, mtime, checkpoints = self._INDEX_HEAD.unpack_from(data)
+        archive_stat = os.stat(self.filename)
+        if (magic != self._INDEX_MAGIC or size != archive_stat.st_size
+                or mtime != archive_stat.st_mtime_ns):
+            return False
+        index = {}
+        pos = self._INDEX_HEAD.size
+        try:
+            checkpoints = [
+                Checkpoint(*self._INDEX_CHECKPOINT.unpack_from(
+                    data, pos + i * self._INDEX_CHECKPOINT.size), None)
+                for i in range(checkpoints)]
+            pos += len(checkpoints) * self._INDEX_CHECKPOINT.size
+            while pos < len(data):
+                *fields, name_length = self._INDEX_ENTRY.unpack_from(data, pos)
+                pos += self._INDEX_ENTRY.size
+                name = data[pos:pos + name_length].decode(
+                    errors='surrogateescape')
+                pos += name_length
+                index[name] = IndexEntry(*fields)
+        except (struct.error, UnicodeDecodeError):
+            return False
+        self.index = index
+        self.checkpoints = checkpoints or [Checkpoint(0, 0, None)]
+        return True
+
+    def save_index(self, index_path: str) -> None:
+        """
+        Сохраняет индекс заголовков в файл `index_path'. Сохраняются только
+        контрольные точки на границах сжатых потоков: состояние zlib внутри
+        потока нельзя сериализовать
+        """
+        archive_stat = os.stat(self.filename)
+        checkpoints = [checkpoint for checkpoint in self.checkpoints
+                       if checkpoint.state is None]
+        tmp_path = f'{index_path}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(self._INDEX_HEAD.pack(
+                self._INDEX_MAGIC, archive_stat.st_size,
+                archive_stat.st_mtime_ns, len(checkpoints)))
+            for checkpoint in checkpoints:
+                f.write(self._INDEX_CHECKPOINT.pack(*checkpoint[:2]))
+            for name, entry in self.index.items():
+                name = name.encode(errors='surrogateescape')
+                f.write(self._INDEX_ENTRY.pack(*entry, len(name)))
+                f.write(name)
+        os.replace(tmp_path, index_path)
 
     def create_archive_item(self, header: bytes) -> ArchiveItem:
         """
@@ -125,13 +1042,15 @@ class TarParser:
                 self._HEADER_FMT3, header_second_half)
         head = list(map(lambda x: x.replace(b'\x00', b''),
                     header_first_half[:-1] + header_second_half))
-        return ArchiveItem(head)
+        archive_item = ArchiveItem(head)
+        archive_item.name = decode_name(header)
+        return archive_item
 
     def files(self) -> iter:
         '''
         Возвращает итератор имён файлов (с путями) в архиве
         '''
-        return iter(self.saved_items.keys())
+        return iter(self.index.keys())
 
     def file_stat(self, filename: str) -> list:
         '''
@@ -153,11 +1072,322 @@ class TarParser:
         ]
         '''
 
-        if filename not in self.saved_items.keys():
-            raise ValueError(filename)
-        info = self.saved_items[filename].get_item_info()
+        info = self.get_item(filename).get_item_info()
         return info
 
+    def file_stats(self, filenames: iter | None = None) -> dict:
+        '''
+        Возвращает словарь {имя: информация как в file_stat} для файлов
+        `filenames' (по умолчанию — для всех). Архив открывается один раз,
+        заголовки читаются в порядке архива
+        '''
+        if filenames is None:
+            filenames = self.index.keys()
+        with self.open_archive() as archive:
+            return {name: archive_item.get_item_info() for name, archive_item
+                    in self.read_headers(archive, filenames)}
+
+
+_BLOCK_COMPRESSORS = {
+    'gz': lambda data, level: gzip.compress(data, level, mtime=0),
+    'bz2': lambda data, level: bz2.compress(data, level),
+    'xz': lambda data, level: lzma.compress(data, preset=level),
+}
+
+
+class BlockCompressor(io.RawIOBase):
+    '''
+    Поток записи, сжимающий данные независимыми блоками по `block_size'
+    байт. Каждый блок становится отдельным потоком gzip/bz2/xz, их
+    последовательность — корректный сжатый файл (как у pigz). Блоки сжимают
+    `workers' потоков, записываются они в исходном порядке
+    '''
+
+    def __init__(self, file, compression: str, workers: int = 1,
+                 block_size: int = 2**20, level: int = 6):
+        super().__init__()
+        self._file = file
+        self._compress = partial(_BLOCK_COMPRESSORS[compression],
+                                 level=level)
+        self._block_size = block_size
+        self._buffer = bytearray()
+        self._workers = max(workers, 1)
+        self._pool = (ThreadPoolExecutor(self._workers)
+                      if self._workers > 1 else None)
+        self._pending = deque()
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._buffer += data
+        while len(self._buffer) >= self._block_size:
+            self._submit(bytes(self._buffer[:self._block_size]))
+            del self._buffer[:self._block_size]
+        return len(data)
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        try:
+            if self._buffer:
+                self._submit(bytes(self._buffer))
+                self._buffer.clear()
+            while self._pending:
+                self._file.write(self._pending.popleft().result())
+        finally:
+            if self._pool is not None:
+                self._pool.shutdown()
+            super().close()
+
+    def abort(self) -> None:
+        ''' Закрывает поток, отбрасывая ещё не записанные блоки '''
+        if self.closed:
+            return
+        self._buffer.clear()
+        self._pending.clear()
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+        super().close()
+
+    def _submit(self, block: bytes) -> None:
+        if self._pool is None:
+            self._file.write(self._compress(block))
+            return
+        self._pending.append(self._pool.submit(self._compress, block))
+        while len(self._pending) > 2 * self._workers:
+            self._file.write(self._pending.popleft().result())
+
+
+class TarWriter:
+    '''
+    Записывает tar-архив (ustar, с расширенными заголовками PAX там, где
+    ustar не хватает) в файл `file' — имя файла или открытый двоичный
+    поток. Если задано `compression' ('gz', 'bz2', 'xz'), архив сжимается
+    блоками в `workers' потоков
+    '''
+    _RECORD_SIZE = 20 * 512
+    _SPOOL_SIZE = 2**26
+    _MAX_OCTAL = {8: 8**7 - 1, 12: 8**11 - 1}
+
+    def __init__(self, file: str | Path | BinaryIO,
+                 compression: str | None = None, workers: int = 1,
+                 block_size: int = 2**20, level: int = 6):
+        self._own_file = isinstance(file, (str, Path))
+        self._file = open(file, 'wb') if self._own_file else file
+        self._output = self._file
+        if compression is not None:
+            if compression not in _BLOCK_COMPRESSORS:
+                raise ValueError(
+                    f'{compression} compression is not supported')
+            self._output = BlockCompressor(
+                self._file, compression, workers, block_size, level)
+        self._written = 0
+
+    def __enter__(self) -> TarWriter:
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def add(self, name: str, data=b'', size: int | None = None,
+            mode: int = 0o644, mtime: int | None = None,
+            type_flag: bytes = b'0', linkname: str = '', uid: int = 0,
+            gid: int = 0, uname: str = '', gname: str = '') -> None:
+        '''
+        Добавляет в архив элемент `name'. Данные `data' — bytes, открытый
+        двоичный файл или итератор по кускам bytes; они копируются в архив
+        кусками, не собираясь целиком в памяти. Если размер `size' не указан
+        и его нельзя узнать у файла, данные сначала копируются во временный
+        буфер (в памяти, а для больших данных — на диске)
+        '''
+        if mtime is None:
+            mtime = int(time.time())
+        spool = None
+        if isinstance(data, (bytes, bytearray, memoryview)):
+            data = memoryview(data).cast('B')
+            size = len(data) if size is None else size
+            chunks = [data]
+        elif hasattr(data, 'read'):
+            if size is None:
+                size = self._remaining_size(data)
+            if size is None:
+                spool = tempfile.SpooledTemporaryFile(self._SPOOL_SIZE)
+                shutil.copyfileobj(data, spool)
+                size = spool.tell()
+                spool.seek(0)
+                data = spool
+            chunks = iter(partial(data.read, TarParser._COPY_CHUNK), b'')
+        else:
+            chunks = data
+            if size is None:
+                spool = tempfile.SpooledTemporaryFile(self._SPOOL_SIZE)
+                for chunk in chunks:
+                    spool.write(chunk)
+                size = spool.tell()
+                spool.seek(0)
+                chunks = iter(partial(spool.read, TarParser._COPY_CHUNK),
+                              b'')
+
+        try:
+            self._write(self.build_header(
+                name, size, mode, mtime, type_flag, linkname,
+                uid, gid, uname, gname))
+            written = 0
+            for chunk in chunks:
+                written += len(chunk)
+                if written > size:
+                    raise ValueError(f'{name}: more than {size} bytes given')
+                self._write(chunk)
+            if written != size:
+                raise ValueError(f'{name}: {written} bytes given instead '
+                                 f'of {size}')
+            self._pad()
+        finally:
+            if spool is not None:
+                spool.close()
+
+    def add_directory(self, name: str, mode: int = 0o755,
+                      mtime: int | None = None, **fields) -> None:
+        '''
+        Добавляет в архив каталог `name'
+        '''
+        self.add(name.rstrip('/') + '/', mode=mode, mtime=mtime,
+                 type_flag=b'5', **fields)
+
+    def add_symlink(self, name: str, target: str, **fields) -> None:
+        '''
+        Добавляет в архив символическую ссылку `name' на `target'
+        '''
+        self.add(name, mode=0o777, type_flag=b'2', linkname=target, **fields)
+
+    def close(self) -> None:
+        '''
+        Дописывает конец архива (два нулевых блока, выравнивание до записи
+        в 10240 байт) и закрывает его
+        '''
+        if self._output is None:
+            return
+        try:
+            self._write(bytes(1024))
+            self._pad(self._RECORD_SIZE)
+            if self._output is not self._file:
+                self._output.close()
+            self._file.flush()
+        finally:
+            if self._own_file:
+                self._file.close()
+            self._output = None
+
+    def abort(self) -> None:
+        '''
+        Закрывает архив, не дописывая его конец: оборванный архив не должен
+        выглядеть целым
+        '''
+        if self._output is None:
+            return
+        try:
+            if self._output is not self._file:
+                self._output.abort()
+        finally:
+            if self._own_file:
+                self._file.close()
+            self._output = None
+
+    def build_header(self, name: str, size: int, mode: int, mtime: int,
+                     type_flag: bytes, linkname: str = '', uid: int = 0,
+                     gid: int = 0, uname: str = '', gname: str = '') -> bytes:
+        '''
+        Собирает заголовок ustar. Если какое-то поле в ustar не помещается,
+        перед ним пишется расширенный заголовок PAX с этим полем
+        '''
+        records = {}
+        name_bytes = name.encode(errors='surrogateescape')
+        prefix = b''
+        if len(name_bytes) > 100:
+            prefix, name_bytes = self._split_name(name_bytes)
+        if prefix is None:
+            records['path'] = name
+            name_bytes = name_bytes[:100]
+            prefix = b''
+        link_bytes = linkname.encode(errors='surrogateescape')
+        if len(link_bytes) > 100:
+            records['linkpath'] = linkname
+            link_bytes = link_bytes[:100]
+        owners = {'uname': uname, 'gname': gname}
+        for key, value in owners.items():
+            owners[key] = value.encode('ascii', 'replace')[:31]
+            if len(value) > 31 or not value.isascii():
+                records[key] = value
+        numbers = {'size': (size, 12), 'mtime': (mtime, 12),
+                   'uid': (uid, 8), 'gid': (gid, 8)}
+        for key, (value, width) in numbers.items():
+            if not 0 <= value <= self._MAX_OCTAL[width]:
+                records[key] = str(value)
+                numbers[key] = (0, width)
+
+        header = bytearray(_USTAR_HEADER.pack(
+            name_bytes, self._octal(mode & 0o7777, 8),
+            self._octal(*numbers['uid']), self._octal(*numbers['gid']),
+            self._octal(*numbers['size']), self._octal(*numbers['mtime']),
+            b' ' * 8, type_flag, link_bytes, b'ustar\x00', b'00',
+            owners['uname'], owners['gname'], b'', b'', prefix))
+        header[148:156] = b'%06o\x00 ' % sum(header)
+        if not records:
+            return bytes(header)
+
+        payload = self.build_pax(records)
+        pax_header = self.build_header(
+            '././@PaxHeader', len(payload), 0o644,
+            min(max(mtime, 0), self._MAX_OCTAL[12]), b'x')
+        padding = bytes(-len(payload) % 512)
+        return pax_header + payload + padding + bytes(header)
+
+    @staticmethod
+    def build_pax(records: dict) -> bytes:
+        '''
+        Кодирует записи расширенного заголовка PAX: "%d %s=%s\\n", где
+        число — длина всей записи вместе с ним самим
+        '''
+        payload = b''
+        for key, value in records.items():
+            record = f' {key}={value}\n'.encode(errors='surrogateescape')
+            length = len(record) + 1
+            while len(str(length)) + len(record) != length:
+                length = len(str(length)) + len(record)
+            payload += str(length).encode() + record
+        return payload
+
+    @staticmethod
+    def _split_name(name: bytes) -> tuple[bytes | None, bytes]:
+        for pos in range(len(name) - 1, -1, -1):
+            if (name[pos:pos + 1] == b'/' and 0 < pos <= 155
+                    and 0 < len(name) - pos - 1 <= 100):
+                return name[:pos], name[pos + 1:]
+        return None, name
+
+    @staticmethod
+    def _octal(value: int, width: int) -> bytes:
+        return b'%0*o\x00' % (width - 1, value)
+
+    @staticmethod
+    def _remaining_size(file) -> int | None:
+        try:
+            return os.fstat(file.fileno()).st_size - file.tell()
+        except (AttributeError, OSError, io.UnsupportedOperation):
+            return None
+
+    def _write(self, data) -> None:
+        self._output.write(data)
+        self._written += len(data)
+
+    def _pad(self, block: int = 512) -> None:
+        if self._written % block:
+            self._write(bytes(block - self._written % block))
+
 
 def print_file_info(stat: iter, f: Text | Path | TextIO = sys.stdout) -> None:
     max_width = max(map(lambda s: len(s[0]), stat))
@@ -165,6 +1395,17 @@ def print_file_info(stat: iter, f: Text | Path | TextIO = sys.stdout) -> None:
         print("{{:>{}}} : {{}}".format(max_width).format(*field), file=f)
 
 
+def print_manifest(manifest: list,
+                   f: Text | Path | TextIO = sys.stdout) -> None:
+    corrupted = [item.name for item in manifest if not item.checksum_ok]
+    for item in manifest:
+        print(f'{item.digest or "-"}  {item.size}  {item.name}', file=f)
+    for name in corrupted:
+        print(f'{name}: header checksum mismatch', file=sys.stderr)
+    if corrupted:
+        raise ValueError(f'{len(corrupted)} corrupted header(s)')
+
+
 def main() -> None:
     import argparse
     parser = argparse.ArgumentParser(
@@ -176,25 +1417,39 @@ def main() -> None:
                         help='extract files from an archive')
     parser.add_argument('-i', '--info', action='store_true', dest='info',
                         help='get information about files in an archive')
+    parser.add_argument('-v', '--verify', action='store_true', dest='verify',
+                        help='verify header checksums and print a manifest')
+    parser.add_argument('--hash', metavar='ALGORITHM', dest='hash',
+                        help='hash file contents while verifying '
+                             '(e.g. sha256, blake2b)')
+    parser.add_argument('-j', '--jobs', type=int, default=1, dest='jobs',
+                        help='number of threads used to extract or hash '
+                             'files')
+    parser.add_argument('--index', metavar='INDEX', dest='index',
+                        help='load (or build) a header index from INDEX')
     parser.add_argument('fn', metavar='FILE',
                         help='name of an archive')
 
     args = parser.parse_args()
-    if not (args.ls or args.extract or args.info):
+    if not (args.ls or args.extract or args.info or args.verify):
         sys.exit("Error: action must be specified")
 
     try:
-        tar = TarParser(args.fn)
+        tar = TarParser(args.fn, args.index)
         if args.info:
-            for fn in sorted(tar.files()):
-                print_file_info(tar.file_stat(fn))
+            stats = tar.file_stats()
+            for fn in sorted(stats):
+                print_file_info(stats[fn])
                 print()
         elif args.ls:
             for fn in sorted(tar.files()):
                 print(fn)
 
+        if args.verify:
+            print_manifest(tar.verify(args.hash, args.jobs))
+
         if args.extract:
-            tar.extract()
+            tar.extract(workers=args.jobs)
     except Exception as e:
         sys.exit(e)
 